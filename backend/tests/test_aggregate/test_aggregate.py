@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.vizimacli import app
+
+runner = CliRunner()
+
+
+def make_store(tmp_path, ndays=3):
+    times = pd.date_range("2026-01-30", periods=24 * ndays, freq="h")
+    temp = np.arange(times.size, dtype=float)[:, None, None] * np.ones((1, 2, 3))
+    xr.Dataset(
+        {"temp": (("time", "lat", "lon"), temp)},
+        coords={
+            "time": ("time", times, {"standard_name": "time"}),
+            "lat": ("lat", [0.0, 1.0], {"units": "degrees_north"}),
+            "lon": ("lon", [10.0, 11.0, 12.0], {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    out = tmp_path / "out.zarr"
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    return out, temp
+
+
+def test_aggregate_daily_and_monthly(tmp_path):
+    out, temp = make_store(tmp_path)
+    args = ["aggregate", str(out), "--freq", "1D", "--freq", "MS"]
+    args += ["--stat", "mean", "--stat", "max", "--climatology", "month"]
+
+    for _ in range(2):  # a second run replaces the aggregates
+        result = runner.invoke(app, args)
+        assert result.exit_code == 0, result.output
+
+    with xr.open_zarr(out) as ds:
+        daily = ds.temp_1D_mean.isel(lat=0, lon=0).values
+        np.testing.assert_allclose(daily, [11.5, 35.5, 59.5], atol=0.01)
+        np.testing.assert_allclose(
+            ds.temp_1D_max.isel(lat=0, lon=0).values, [23, 47, 71], atol=0.01
+        )
+        # January 30-31 and February 1
+        np.testing.assert_allclose(
+            ds.temp_MS_mean.isel(lat=0, lon=0).values, [23.5, 59.5], atol=0.01
+        )
+        np.testing.assert_allclose(
+            ds.temp_clim_month_mean.isel(lat=0, lon=0).values, [23.5, 59.5], atol=0.01
+        )
+        assert ds.temp_1D_mean.attrs["cell_methods"] == "time: mean"
+        assert ds.temp.shape == temp.shape
+
+        attrs = ds.attrs
+        entry = attrs["datavars"]["temperature_1D_mean"]
+        assert entry["arrName"] == "temp_1D_mean"
+        assert entry["time"] == "time_1D"
+        assert attrs["times"]["time_1D"] == [
+            "2026-01-30T00:00:00",
+            "2026-01-31T00:00:00",
+            "2026-02-01T00:00:00",
+        ]
+        assert attrs["times"]["time_clim_month"][1] == "2026-02-01T00:00:00"
+        assert len(attrs["datavars"]) == 1 + 3 * 2
+
+
+def test_aggregate_needs_a_frequency(tmp_path):
+    out, _ = make_store(tmp_path, ndays=1)
+    result = runner.invoke(app, ["aggregate", str(out)])
+    assert result.exit_code != 0
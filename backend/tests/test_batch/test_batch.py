@@ -0,0 +1,181 @@
+import json
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from vizima import batch, vizimacli
+from vizima.batch import Ledger, load_jobs, run_batch, run_job, time_chunks
+
+
+def make_input(path, ntimes=5):
+    ds = xr.Dataset(
+        {"temp": (("time", "lat", "lon"), np.arange(ntimes * 6.0).reshape(-1, 2, 3))},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=ntimes, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", [0.0, 1.0], {"units": "degrees_north"}),
+            "lon": ("lon", [10.0, 11.0, 12.0], {"units": "degrees_east"}),
+        },
+    )
+    ds.to_netcdf(path)
+    return ds
+
+
+def make_jobs(tmp_path, njobs=2):
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    specs = []
+    for i in range(njobs):
+        make_input(tmp_path / f"in_{i}.nc")
+        specs.append(
+            {"input": f"in_{i}.nc", "metadata": "meta.json", "out": f"{i}.zarr"}
+        )
+    (tmp_path / "jobs.json").write_text(json.dumps(specs))
+    return load_jobs(tmp_path / "jobs.json")
+
+
+def test_time_chunks():
+    assert time_chunks(5, 2) == [(0, 2), (2, 4), (4, 5)]
+    assert time_chunks(1, 24) == [(0, 1)]
+
+
+def test_run_batch(tmp_path):
+    jobs = make_jobs(tmp_path)
+
+    summary = run_batch(jobs, tmp_path / "ledger.sqlite", workers=2, chunk_size=2)
+
+    assert summary == {"done": 2}
+    for i in range(2):
+        with xr.open_zarr(tmp_path / f"{i}.zarr") as ds:
+            np.testing.assert_allclose(
+                ds.temp.values, np.arange(30.0).reshape(5, 2, 3), atol=0.01
+            )
+    # a second run has nothing left to do
+    assert run_batch(jobs, tmp_path / "ledger.sqlite") == {"done": 2}
+
+
+def test_run_job_packs_for_the_whole_job(tmp_path, monkeypatch):
+    (job,) = make_jobs(tmp_path, njobs=1)
+    ledger_path = tmp_path / "ledger.sqlite"
+    (job_id,) = Ledger(ledger_path).add_jobs([job])
+
+    def repack_array(*args):
+        raise AssertionError("appending a chunk re-packed the store")
+
+    # the values grow chunk by chunk
+    monkeypatch.setattr(vizimacli, "repack_array", repack_array)
+    assert run_job(ledger_path, job_id, chunk_size=2) == "done"
+    with xr.open_zarr(tmp_path / "0.zarr") as ds:
+        np.testing.assert_allclose(
+            ds.temp.values, np.arange(30.0).reshape(5, 2, 3), atol=0.01
+        )
+
+
+def test_run_job_resumes_at_first_unfinished_chunk(tmp_path, monkeypatch):
+    (job,) = make_jobs(tmp_path, njobs=1)
+    ledger_path = tmp_path / "ledger.sqlite"
+    ledger = Ledger(ledger_path)
+    (job_id,) = ledger.add_jobs([job])
+
+    calls = []
+    update_store = batch.update_store
+
+    def crash_on_second_chunk(ds, *args):
+        calls.append(ds.time.size)
+        if len(calls) == 2:
+            raise MemoryError
+        update_store(ds, *args)
+
+    monkeypatch.setattr(batch, "update_store", crash_on_second_chunk)
+    assert run_job(ledger_path, job_id, chunk_size=2) == "failed"
+    assert [c["state"] for c in ledger.chunks(job_id)] == ["done", "done", "pending"]
+    assert ledger.job(job_id)["error"] == "MemoryError()"
+
+    assert run_job(ledger_path, job_id, chunk_size=2) == "done"
+    # the first chunk is not written again, the failed one is retried
+    assert calls == [2, 1, 1]
+    assert ledger.job(job_id)["attempts"] == 2
+    with xr.open_zarr(tmp_path / "0.zarr") as ds:
+        assert ds.time.size == 5
+
+
+def test_run_job_restarts_when_input_changes(tmp_path, monkeypatch):
+    (job,) = make_jobs(tmp_path, njobs=1)
+    ledger_path = tmp_path / "ledger.sqlite"
+    ledger = Ledger(ledger_path)
+    (job_id,) = ledger.add_jobs([job])
+
+    def crash(*args):
+        raise MemoryError
+
+    monkeypatch.setattr(batch, "update_store", crash)
+    assert run_job(ledger_path, job_id, chunk_size=2) == "failed"
+    assert [c["state"] for c in ledger.chunks(job_id)] == ["done", "pending", "pending"]
+
+    # same number of time steps, other values
+    source = make_input(tmp_path / "new.nc")
+    (source + 100.0).to_netcdf(tmp_path / "new.nc")
+    (tmp_path / "new.nc").replace(tmp_path / "in_0.nc")
+    monkeypatch.undo()
+    assert run_job(ledger_path, job_id, chunk_size=2) == "done"
+    with xr.open_zarr(tmp_path / "0.zarr") as ds:
+        np.testing.assert_allclose(
+            ds.temp.values, np.arange(30.0).reshape(5, 2, 3) + 100.0, atol=0.01
+        )
+
+
+def test_run_batch_fails_only_the_job_whose_worker_died(tmp_path, monkeypatch):
+    jobs = make_jobs(tmp_path, njobs=3)
+    ledger_path = tmp_path / "ledger.sqlite"
+    pools = []
+
+    def run_pool(ledger, job_ids, workers, args):
+        # jobs 1 and 2 start, the worker of job 1 dies and breaks the pool
+        # before job 3 starts
+        pools.append(job_ids)
+        if job_ids == [1, 2, 3] or job_ids == [1]:
+            for job_id in job_ids[:2]:
+                ledger.update_job(job_id, state="running")
+            return {job_id: BrokenProcessPool("killed") for job_id in job_ids}
+        for job_id in job_ids:
+            run_job(ledger.path, job_id, *args)
+        return {}
+
+    monkeypatch.setattr(batch, "run_pool", run_pool)
+    summary = run_batch(jobs, ledger_path, workers=2, chunk_size=2)
+
+    assert summary == {"done": 2, "failed": 1}
+    assert pools == [[1, 2, 3], [1], [2], [3]]
+    ledger = Ledger(ledger_path)
+    assert ledger.job(1)["error"] == "BrokenProcessPool('killed')"
+    assert ledger.job(2)["error"] is None
+
+
+def test_load_jobs_missing_key(tmp_path):
+    (tmp_path / "jobs.json").write_text(json.dumps([{"input": "a.nc"}]))
+    with pytest.raises(KeyError):
+        load_jobs(tmp_path / "jobs.json")
@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+from typer.testing import CliRunner
+
+from vizima.contour import QUANT_MAX, contour_slab, nice_levels
+from vizima.vizimacli import FILL_VALUE, app
+
+runner = CliRunner()
+
+
+def cone(ny=21, nx=31, cy=10.0, cx=15.0):
+    y, x = np.mgrid[0:ny, 0:nx]
+    return np.hypot(x - cx, y - cy)
+
+
+def test_nice_levels():
+    assert nice_levels(0.3, 9.7, 10) == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    assert nice_levels(271.3, 302.0, 5) == [280, 290, 300]
+    assert nice_levels(1.0, 1.0) == []
+
+
+def test_contour_slab_ring():
+    field = cone()
+    ((counts, points),) = contour_slab(field, [5.0])
+
+    assert len(counts) == 1
+    xy = points / QUANT_MAX * [30, 20]
+    # a closed ring around the centre
+    np.testing.assert_allclose(xy[0], xy[-1])
+    np.testing.assert_allclose(np.hypot(xy[:, 0] - 15, xy[:, 1] - 10), 5, atol=0.3)
+
+
+def test_contour_slab_open_lines_at_missing_values():
+    field = cone()
+    field[:, 15] = FILL_VALUE
+    ((counts, points),) = contour_slab(field, [5.0])
+
+    # the ring is cut into two open arcs
+    assert len(counts) == 2
+    assert points.shape == (counts.sum(), 2)
+
+
+def test_contour_command(tmp_path):
+    r = cone()
+    temp = np.stack([r, 2 * r])
+    xr.Dataset(
+        {"temp": (("time", "lat", "lon"), temp)},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=2, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", np.arange(21.0), {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(31.0), {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    out = tmp_path / "out.zarr"
+    runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+        ],
+    )
+
+    result = runner.invoke(app, ["contour", str(out), "--level", "8", "--level", "4"])
+    assert result.exit_code == 0, result.output
+
+    group = zarr.open_consolidated(str(out))["contours"]
+    info = group.attrs["temperature"]
+    assert info["levels"] == [4.0, 8.0]
+    assert info["dims"] == ["time"]
+
+    temp_group = group["temp"]
+    index, lines, points = (
+        temp_group["index"],
+        temp_group["lines"],
+        temp_group["points"],
+    )
+    assert index.shape == (2, 2, 2)
+    # second time step, level 8: a ring of radius 4
+    first, count = index[1, 1]
+    assert count == 1
+    start, npoints = lines[first]
+    xy = points[start : start + npoints] * [info["xScale"], info["yScale"]]
+    np.testing.assert_allclose(np.hypot(xy[:, 0] - 15, xy[:, 1] - 10), 4, atol=0.3)
+    # and the store still opens as a dataset
+    with xr.open_zarr(out) as ds:
+        assert "temp" in ds
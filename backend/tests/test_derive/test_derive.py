@@ -0,0 +1,126 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.derive import derive_variables, evaluate, expression_names
+from vizima.vizimacli import app, get_native_chunks
+
+runner = CliRunner()
+
+
+def datavar(arr_name, units, expression=None):
+    return {
+        "units": units,
+        "long_name": arr_name,
+        "standard_name": "",
+        "arrName": arr_name,
+        "lon": "lon",
+        "lat": "lat",
+        "level": "",
+        "time": "time",
+        "expression": expression,
+    }
+
+
+def make_dataset():
+    shape = (3, 4, 5)
+    return xr.Dataset(
+        {
+            "u": (("time", "lat", "lon"), np.random.randn(*shape)),
+            "v": (("time", "lat", "lon"), np.random.randn(*shape)),
+            "t2m": (("time", "lat", "lon"), 280 + np.random.rand(*shape)),
+        },
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=3, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", np.arange(4.0), {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(5.0), {"units": "degrees_east"}),
+        },
+    )
+
+
+def test_evaluate():
+    assert evaluate("sqrt(a**2 + b**2) * 2", {"a": 3.0, "b": 4.0}) == 10.0
+    assert evaluate(
+        "where(a > 1, a, -a)", {"a": xr.DataArray([0.5, 2])}
+    ).values.tolist() == [-0.5, 2]
+    assert expression_names("hypot(u, v) * pi") == {"u", "v"}
+    with pytest.raises(ValueError, match="Unsupported syntax"):
+        evaluate("__import__('os').system('true')", {})
+    with pytest.raises(ValueError, match="Unsupported syntax"):
+        evaluate("u.values", {"u": 1.0})
+    with pytest.raises(ValueError, match="Unknown variable"):
+        evaluate("w + 1", {"u": 1.0})
+    with pytest.raises(ValueError, match="Invalid expression"):
+        evaluate("u +", {"u": 1.0})
+
+
+def test_derive_variables_is_lazy():
+    ds = make_dataset().chunk({"time": 1})
+    ds["u"].encoding["chunksizes"] = (1, 4, 5)
+    ds["v"].encoding["chunksizes"] = (3, 2, 5)
+    metadata = {"datavars": {"speed": datavar("speed", "m/s", "hypot(u, v)")}}
+
+    out = derive_variables(ds, metadata)
+
+    assert out["speed"].chunks is not None
+    assert out["speed"].attrs["units"] == "m/s"
+    # aligned with the source chunks of both inputs
+    assert get_native_chunks(out["speed"]) == (3, 4, 5)
+    np.testing.assert_allclose(out["speed"], np.hypot(ds["u"], ds["v"]))
+
+
+def test_derive_variables_needs_a_variable():
+    metadata = {"datavars": {"constant": datavar("constant", "1", "pi * 2")}}
+    with pytest.raises(TypeError, match="does not use any variable"):
+        derive_variables(make_dataset(), metadata)
+
+
+def test_process_dataset_derived(tmp_path):
+    ds = make_dataset()
+    ds.to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": datavar("t2m", "K"),
+            "temperature_c": datavar("t2m_c", "degC", "t2m - 273.15"),
+            "wind_speed": datavar("speed", "m/s", "sqrt(u**2 + v**2)"),
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    out = tmp_path / "out.zarr"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    with xr.open_zarr(out) as store:
+        assert "u" not in store
+        np.testing.assert_allclose(
+            store["speed"], np.hypot(ds["u"], ds["v"]), atol=1e-3
+        )
+        np.testing.assert_allclose(store["t2m_c"], ds["t2m"] - 273.15, atol=1e-3)
+        assert store["t2m_c"].attrs["units"] == "degC"
+        assert store.attrs["datavars"]["wind_speed"]["expression"] == (
+            "sqrt(u**2 + v**2)"
+        )
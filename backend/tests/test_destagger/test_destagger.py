@@ -0,0 +1,182 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import zarr
+from typer.testing import CliRunner
+
+from vizima.destagger import destagger, destagger_dataset, earth_relative
+from vizima.vizimacli import app
+
+runner = CliRunner()
+
+NT, NZ, NY, NX = 2, 3, 4, 5
+
+
+def lonlat(name, ny, nx, offset_x=0.0, offset_y=0.0):
+    dims = (
+        "south_north_stag" if ny > NY else "south_north",
+        "west_east_stag" if nx > NX else "west_east",
+    )
+    lon = 10.0 + offset_x + np.arange(nx)[None, :] + np.zeros((ny, 1))
+    lat = 40.0 + offset_y + np.arange(ny)[:, None] + np.zeros((1, nx))
+    return {
+        f"XLONG{name}": (dims, lon, {"units": "degrees_east"}),
+        f"XLAT{name}": (dims, lat, {"units": "degrees_north"}),
+    }
+
+
+def make_wrf_dataset():
+    """A small WRF-like output with U, V on their staggered grids."""
+    rng = np.random.default_rng(0)
+    alpha = np.deg2rad(30.0)
+    return xr.Dataset(
+        {
+            "U": (
+                ("Time", "bottom_top", "south_north", "west_east_stag"),
+                rng.random((NT, NZ, NY, NX + 1)),
+                {"units": "m s-1", "stagger": "X"},
+            ),
+            "V": (
+                ("Time", "bottom_top", "south_north_stag", "west_east"),
+                rng.random((NT, NZ, NY + 1, NX)),
+                {"units": "m s-1", "stagger": "Y"},
+            ),
+            "T2": (
+                ("Time", "south_north", "west_east"),
+                rng.random((NT, NY, NX)),
+                {"units": "K"},
+            ),
+            "COSALPHA": (
+                ("south_north", "west_east"),
+                np.full((NY, NX), np.cos(alpha)),
+            ),
+            "SINALPHA": (
+                ("south_north", "west_east"),
+                np.full((NY, NX), np.sin(alpha)),
+            ),
+        },
+        coords={
+            "XTIME": (
+                "Time",
+                pd.date_range("2026-01-01", periods=NT, freq="h"),
+                {"standard_name": "time"},
+            ),
+            **lonlat("", NY, NX),
+            **lonlat("_U", NY, NX + 1, offset_x=-0.5),
+            **lonlat("_V", NY + 1, NX, offset_y=-0.5),
+        },
+    ).chunk({"Time": 1})
+
+
+def metadata():
+    def datavar(arr_name, lon, lat):
+        return {
+            "units": "m s-1",
+            "long_name": arr_name,
+            "standard_name": arr_name,
+            "arrName": arr_name,
+            "lon": lon,
+            "lat": lat,
+            "level": "",
+            "time": "XTIME",
+        }
+
+    return {
+        "datavars": {
+            "u": datavar("U", "XLONG_U", "XLAT_U"),
+            "v": datavar("V", "XLONG_V", "XLAT_V"),
+        },
+        "vectors": {
+            "wind": {
+                "units": "m s-1",
+                "long_name": "wind",
+                "standard_name": "wind",
+                "uArrName": "U",
+                "vArrName": "V",
+            }
+        },
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+
+
+def test_destagger_averages_onto_the_mass_grid():
+    ds = make_wrf_dataset()
+    ds.U.encoding["chunksizes"] = (1, NZ, 2, NX + 1)
+    u = destagger(ds.U, ds)
+
+    assert u.dims == ("Time", "bottom_top", "south_north", "west_east")
+    assert u.chunks is not None
+    expected = 0.5 * (ds.U.values[..., :-1] + ds.U.values[..., 1:])
+    np.testing.assert_allclose(u.values, expected, rtol=1e-6)
+    assert set(u.coords) == {"XTIME", "XLONG", "XLAT"}
+    assert u.attrs["stagger"] == ""
+    assert u.encoding["chunksizes"] == (1, NZ, 2, NX)
+
+
+def test_destagger_dataset_updates_metadata():
+    ds, meta = destagger_dataset(make_wrf_dataset(), metadata())
+
+    assert ds.U.sizes == ds.V.sizes == {**ds.T2.sizes, "bottom_top": NZ}
+    assert not {"XLONG_U", "XLAT_U", "XLONG_V", "XLAT_V"} & set(ds.coords)
+    for name in ("u", "v"):
+        assert meta["datavars"][name]["lon"] == "XLONG"
+        assert meta["datavars"][name]["lat"] == "XLAT"
+    assert metadata()["datavars"]["u"]["lon"] == "XLONG_U"
+
+
+def test_earth_relative_rotation():
+    ds, _ = destagger_dataset(make_wrf_dataset())
+    rotated, _ = destagger_dataset(make_wrf_dataset(), metadata(), rotate=True)
+
+    u, v = earth_relative(ds.U, ds.V, ds.COSALPHA, ds.SINALPHA)
+    np.testing.assert_allclose(rotated.U.values, u.values)
+    np.testing.assert_allclose(rotated.V.values, v.values)
+    assert rotated.U.dims == ds.U.dims
+    # the rotation keeps the speed
+    np.testing.assert_allclose(
+        np.hypot(rotated.U.values, rotated.V.values),
+        np.hypot(ds.U.values, ds.V.values),
+        rtol=1e-6,
+    )
+    cos, sin = np.cos(np.deg2rad(30.0)), np.sin(np.deg2rad(30.0))
+    np.testing.assert_allclose(
+        rotated.U.values, ds.U.values * cos - ds.V.values * sin, rtol=1e-6
+    )
+
+
+def test_earth_relative_needs_the_rotation_angle():
+    ds = make_wrf_dataset().drop_vars("SINALPHA")
+    with pytest.raises(ValueError, match="SINALPHA"):
+        destagger_dataset(ds, metadata(), rotate=True)
+
+
+def test_process_dataset_writes_destaggered_winds(tmp_path):
+    path = tmp_path / "wrfout.nc"
+    make_wrf_dataset().to_netcdf(path)
+    meta = tmp_path / "meta.json"
+    meta.write_text(json.dumps(metadata()))
+    out = tmp_path / "out.zarr"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(path),
+            "--metadata-file",
+            str(meta),
+            "--out",
+            str(out),
+            "--earth-relative",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    stored = zarr.open_group(str(out), mode="r")
+    assert stored["U"].shape == stored["V"].shape == (NT, NZ, NY, NX)
+    assert stored.attrs["datavars"]["u"]["lon"] == "XLONG"
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from vizima.manifest import (
+    changed_slabs,
+    reusable_packing,
+    slab_region,
+    slab_stats,
+    slabs_range,
+)
+
+
+def make_entry(slabs, encoding="enc", shape=(2, 3, 4)):
+    return {
+        "shape": list(shape),
+        "chunks": [1, 3, 4],
+        "coords": "coords",
+        "encoding": encoding,
+        "packing": {"min": 0.0, "max": 10.0},
+        "slabs": {k: {"hash": h} for k, h in slabs.items()},
+    }
+
+
+def test_slab_stats_per_time_step():
+    data = np.arange(24, dtype="f8").reshape(2, 3, 4)
+    data[1, 0, 0] = np.nan
+    var = xr.DataArray(data, dims=("time", "lat", "lon")).chunk({"time": 2})
+
+    stats = slab_stats(var, (1, 3, 4))
+
+    assert set(stats) == {"0", "1"}
+    assert stats["0"]["min"] == 0 and stats["0"]["max"] == 11
+    assert stats["1"]["min"] == 13 and stats["1"]["max"] == 23
+    assert stats["0"]["hash"] != stats["1"]["hash"]
+    assert slabs_range(stats) == (0, 23)
+
+
+def test_slab_stats_hash_is_stable_across_read_chunks():
+    data = np.random.rand(4, 3, 4)
+    var = xr.DataArray(data, dims=("time", "lat", "lon"))
+
+    by_one = slab_stats(var.chunk({"time": 1}), (1, 3, 4))
+    by_two = slab_stats(var.chunk({"time": 2}), (1, 3, 4))
+
+    assert by_one == by_two
+
+
+def test_slab_region():
+    assert slab_region("3.1", (1, 1, 5, 6)) == (
+        slice(3, 4),
+        slice(1, 2),
+        slice(None),
+        slice(None),
+    )
+    assert slab_region("0", (5, 6)) == (slice(None), slice(None))
+
+
+def test_changed_slabs_only_changed_hashes():
+    old = {"variables": {"t": make_entry({"0": "a", "1": "b"})}}
+    new = {"variables": {"t": make_entry({"0": "a", "1": "c"})}}
+
+    assert changed_slabs(old, new) == {"t": ["1"]}
+
+
+def test_changed_slabs_encoding_change_rewrites_variable():
+    old = {"variables": {"t": make_entry({"0": "a", "1": "b"})}}
+    new = {"variables": {"t": make_entry({"0": "a", "1": "b"}, encoding="new")}}
+
+    assert changed_slabs(old, new) == {"t": ["0", "1"]}
+
+
+@pytest.mark.parametrize(
+    "old",
+    [
+        None,
+        {"variables": {}},
+        {"variables": {"t": make_entry({"0": "a"}, shape=(1, 3, 4))}},
+    ],
+)
+def test_changed_slabs_full_rewrite(old):
+    new = {"variables": {"t": make_entry({"0": "a", "1": "b"})}}
+
+    assert changed_slabs(old, new) is None
+
+
+def test_reusable_packing():
+    entry = make_entry({})
+
+    assert reusable_packing(entry, (1.0, 9.0)) == {"min": 0.0, "max": 10.0}
+    assert reusable_packing(entry, (-1.0, 9.0)) is None
+    assert reusable_packing(None, (1.0, 9.0)) is None
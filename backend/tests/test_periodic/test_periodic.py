@@ -0,0 +1,165 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.periodic import halo_widths, periodic_lons, wrap_longitude
+from vizima.sharding import read_array
+from vizima.vizimacli import LonConvention, app
+
+runner = CliRunner()
+
+METADATA = {
+    "datavars": {
+        "temperature": {
+            "units": "K",
+            "long_name": "Temperature",
+            "standard_name": "air_temperature",
+            "arrName": "temp",
+            "lon": "lon",
+            "lat": "lat",
+            "level": "",
+            "time": "time",
+        }
+    },
+    "vectors": {},
+    "projection": {"name": "LonLat"},
+    "title": "Test",
+    "subtitle": "",
+    "description": "",
+}
+
+
+def make_dataset(lon):
+    return xr.Dataset(
+        {"temp": (("time", "lat", "lon"), np.random.rand(2, 3, len(lon)))},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=2, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", np.arange(3.0), {"units": "degrees_north"}),
+            "lon": ("lon", lon, {"units": "degrees_east"}),
+        },
+    )
+
+
+def test_periodic_lons():
+    assert periodic_lons(make_dataset(np.arange(0.0, 360.0, 30.0)), METADATA) == ["lon"]
+    assert periodic_lons(make_dataset(np.arange(0.0, 330.0, 30.0)), METADATA) == []
+
+
+def test_wrap_longitude():
+    ds = make_dataset(np.arange(0.0, 360.0, 30.0)).chunk()
+    out = wrap_longitude(ds, METADATA, LonConvention.signed)
+    np.testing.assert_array_equal(out["lon"], np.arange(-180.0, 180.0, 30.0))
+    np.testing.assert_array_equal(out["temp"][..., 0], ds["temp"][..., 6])
+
+    # already in the convention: nothing to roll
+    same = wrap_longitude(ds, METADATA, LonConvention.positive)
+    xr.testing.assert_identical(same, ds)
+
+    # regional grids are left alone
+    regional = make_dataset(np.arange(0.0, 90.0, 30.0))
+    xr.testing.assert_identical(
+        wrap_longitude(regional, METADATA, LonConvention.signed), regional
+    )
+
+
+def test_process_dataset_wraps_longitude(tmp_path):
+    ds = make_dataset(np.arange(0.0, 360.0, 30.0))
+    ds.to_netcdf(tmp_path / "in.nc")
+    (tmp_path / "meta.json").write_text(json.dumps(METADATA))
+    out = tmp_path / "out.zarr"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+            "--lon-convention",
+            "180",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    with xr.open_zarr(out) as store:
+        assert store["lon"].values[0] == -180.0
+        assert store["temp"].shape == (2, 3, 12)
+        np.testing.assert_allclose(
+            store["temp"].values[..., 0], ds["temp"].values[..., 6], atol=1e-4
+        )
+        assert store.attrs["lons"]["lon"] == {
+            "start": -180.0,
+            "end": 150.0,
+            "count": 12,
+        }
+
+
+def test_halo_widths():
+    # the whole grid fits one tile
+    assert halo_widths(12, 1, 256) == (1, 1)
+    # 13 columns end mid-tile: 5 grid columns share the east tile with the halo
+    assert halo_widths(12, 1, 8) == (1, 1)
+    # 1 + 15 columns would end a tile, leaving the east halo in a tile of its own
+    assert halo_widths(15, 1, 8) == (2, 1)
+    with pytest.raises(ValueError):
+        halo_widths(12, 4, 8)
+
+
+def test_wrap_longitude_halo():
+    ds = make_dataset(np.arange(0.0, 360.0, 30.0)).chunk()
+    out = wrap_longitude(ds, METADATA, LonConvention.signed, halo=1, tile_size=8)
+    np.testing.assert_array_equal(out["lon"], np.arange(-210.0, 210.0, 30.0))
+    np.testing.assert_array_equal(out["temp"][..., 0], out["temp"][..., 12])
+    np.testing.assert_array_equal(out["temp"][..., 13], out["temp"][..., 1])
+    assert out["lon"].attrs["lonHalo"] == {"west": 1, "east": 1}
+    assert out["temp"].encoding == ds["temp"].encoding
+
+
+def test_process_dataset_lon_halo(tmp_path):
+    ds = make_dataset(np.arange(0.0, 360.0, 30.0))
+    ds.to_netcdf(tmp_path / "in.nc")
+    (tmp_path / "meta.json").write_text(json.dumps(METADATA))
+    out = tmp_path / "out.zarr"
+
+    args = [
+        "process-dataset",
+        str(tmp_path / "in.nc"),
+        "--metadata-file",
+        str(tmp_path / "meta.json"),
+        "--out",
+        str(out),
+        "--lon-halo",
+        "1",
+    ]
+    result = runner.invoke(app, args)
+    assert result.exit_code != 0
+    assert "--zarr-format 3" in result.output
+
+    result = runner.invoke(app, args + ["--zarr-format", "3", "--tile-size", "8"])
+    assert result.exit_code == 0, result.output
+
+    attrs = json.loads((out / "zarr.json").read_text())["attributes"]
+    assert attrs["lonHalo"] == {"lon": {"west": 1, "east": 1}}
+    # the summary still describes the grid without its halo
+    assert attrs["lons"]["lon"] == {"start": 0.0, "end": 330.0, "count": 12}
+
+    meta = json.loads((out / "temp" / "zarr.json").read_text())
+    tile = meta["codecs"][0]["configuration"]["chunk_shape"][-1]
+    assert tile == 8
+    packed = read_array(out / "temp")
+    assert packed.shape == (2, 3, 14)
+    west_tile, east_tile = packed[..., :tile], packed[..., tile:]
+    # each edge tile holds the column across the seam next to its own
+    np.testing.assert_array_equal(west_tile[..., 0], packed[..., 12])
+    np.testing.assert_array_equal(east_tile[..., -1], packed[..., 1])
+    np.testing.assert_array_equal(read_array(out / "lon")[[0, -1]], [-30.0, 360.0])
@@ -0,0 +1,70 @@
+import numpy as np
+import zarr
+from numcodecs.registry import codec_registry
+
+from vizima.profiling import ProfiledStore, Profiler, TimedCodec, profile_compressors
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler("test")
+    with profiler.stage("open"):
+        pass
+    profiler.count("var", bytes_written=10)
+
+    report = profiler.report()
+    assert report["stages"] == {}
+    assert report["variables"] == {}
+
+
+def test_stage_and_counters_per_variable():
+    profiler = Profiler("test", enabled=True)
+    with profiler.stage("stats", "temp"):
+        pass
+    profiler.count("temp", bytes_decoded=8)
+    profiler.count("wind", bytes_decoded=4)
+
+    report = profiler.report()
+    assert report["stages"]["stats"]["calls"] == 1
+    assert report["bytes_decoded"] == 12
+    assert report["variables"]["temp"]["bytes_decoded"] == 8
+    assert report["variables"]["temp"]["stages"]["stats"]["calls"] == 1
+
+
+def test_profiled_store_attributes_deferred_compress_to_variable():
+    profiler = Profiler("test", enabled=True)
+    store = ProfiledStore({}, profiler, {"temp": "temperature"})
+
+    profiler.defer("compress", 0.5, 0.25)
+    store["temp/0.0.0"] = b"1234"
+    store["temp/.zarray"] = b"{}"
+
+    report = profiler.report()
+    temperature = report["variables"]["temperature"]
+    assert temperature["stages"]["compress"]["wall_s"] == 0.5
+    assert temperature["stages"]["write"]["calls"] == 2
+    assert temperature["chunks_written"] == 1
+    assert temperature["bytes_written"] == 6
+
+
+def test_profile_compressors_wraps_only_the_given_arrays():
+    profiler = Profiler("test", enabled=True)
+    store = ProfiledStore({}, profiler, {"temp": "temperature"})
+    group = zarr.open_group(store)
+    timed = group.zeros("temp", shape=(4, 4), chunks=(2, 2), dtype="i2")
+    other = group.zeros("wind", shape=(4, 4), chunks=(2, 2), dtype="i2")
+    registry = dict(codec_registry)
+
+    profile_compressors(profiler, [timed])
+    timed[:] = np.arange(16).reshape(4, 4)
+
+    assert isinstance(timed.compressor, TimedCodec)
+    assert not isinstance(other.compressor, TimedCodec)
+    assert codec_registry == registry
+    assert (
+        profiler.report()["variables"]["temperature"]["stages"]["compress"]["calls"]
+        == 4
+    )
+    # the stored metadata still names the wrapped codec
+    reopened = zarr.open_group(store)["temp"]
+    assert reopened.compressor.get_config() == timed.compressor.get_config()
+    np.testing.assert_array_equal(reopened[:], np.arange(16).reshape(4, 4))
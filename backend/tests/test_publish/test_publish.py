@@ -0,0 +1,77 @@
+import json
+
+import fsspec
+import numpy as np
+import xarray as xr
+
+from vizima.publish import PublishedStore, prune_chunks, publish_store
+from vizima.server import ChunkServer
+
+
+def make_store(path, values):
+    xr.Dataset(
+        {"temp": (("time", "lat", "lon"), values)},
+        coords={"lat": np.arange(4.0), "lon": np.arange(5.0)},
+    ).to_zarr(path, mode="w", encoding={"temp": {"chunks": (1, 4, 5)}})
+
+
+def test_publish_reuses_unchanged_chunks(tmp_path):
+    values = np.arange(60.0).reshape(3, 4, 5)
+    store, dest = tmp_path / "out.zarr", tmp_path / "site"
+    make_store(store, values)
+
+    first = publish_store(store, dest)
+    assert first["new"] > 0
+    index = json.loads((dest / "out" / "index.json").read_text())
+    assert "temp/.zarray" in index["metadata"]
+    assert set(index["chunks"]) >= {"temp/0.0.0", "temp/1.0.0", "temp/2.0.0"}
+
+    # republishing the same store writes nothing but the index
+    assert publish_store(store, dest) == {"new": 0, "reused": first["new"]}
+
+    # only the changed time step gets a new chunk
+    values[1] += 100
+    make_store(store, values)
+    second = publish_store(store, dest)
+    assert second["new"] == 1
+    new_index = json.loads((dest / "out" / "index.json").read_text())
+    changed = {
+        k for k in index["chunks"] if index["chunks"][k] != new_index["chunks"][k]
+    }
+    assert changed == {"temp/1.0.0"}
+
+    with xr.open_zarr(PublishedStore(dest / "out" / "index.json")) as ds:
+        np.testing.assert_array_equal(ds["temp"].values, values)
+
+    assert prune_chunks(dest) == 1
+    assert not (dest / "chunks" / index["chunks"]["temp/1.0.0"]).exists()
+
+
+def test_published_chunks_are_served_immutable(tmp_path):
+    store, dest = tmp_path / "out.zarr", tmp_path / "site"
+    make_store(store, np.zeros((1, 4, 5)))
+    publish_store(store, dest, name="zeros")
+    index = json.loads((dest / "zeros" / "index.json").read_text())
+
+    server = ChunkServer(dest)
+    chunk = server.respond("GET", f"/chunks/{index['chunks']['temp/0.0.0']}", {})
+    assert "immutable" in chunk.headers["Cache-Control"]
+    assert server.respond("GET", "/zeros/index.json", {}).headers["Cache-Control"] == (
+        "no-cache"
+    )
+
+
+def test_publish_to_url(tmp_path):
+    store = tmp_path / "out.zarr"
+    make_store(store, np.arange(60.0).reshape(3, 4, 5))
+    dest = f"memory://{tmp_path.name}/site"
+
+    first = publish_store(store, dest, concurrency=4)
+    assert publish_store(store, dest) == {"new": 0, "reused": first["new"]}
+    fs = fsspec.filesystem("memory")
+    index = json.loads(fs.cat_file(f"/{tmp_path.name}/site/out/index.json"))
+    assert len(fs.ls(f"/{tmp_path.name}/site/chunks")) == len(
+        set(index["chunks"].values())
+    )
+    assert prune_chunks(dest) == 0
+    fs.rm(f"/{tmp_path.name}", recursive=True)
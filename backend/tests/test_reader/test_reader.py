@@ -0,0 +1,121 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.reader import StoreReader, Window
+from vizima.vizimacli import app
+
+runner = CliRunner()
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("reader")
+    temp = np.random.rand(3, 2, 10, 12) * 30
+    temp[0, 0, 0, 0] = np.nan
+    xr.Dataset(
+        {"temp": (("time", "level", "lat", "lon"), temp)},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=3, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "level": ("level", [1000.0, 500.0], {"units": "hPa", "positive": "down"}),
+            "lat": ("lat", np.arange(10.0), {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(12.0), {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "level",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    return tmp_path, temp
+
+
+def process(tmp_path, out, *args):
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+            *args,
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+
+@pytest.mark.parametrize("zarr_format", ["2", "3"])
+def test_read_windows(source, zarr_format):
+    tmp_path, temp = source
+    out = tmp_path / f"v{zarr_format}.zarr"
+    process(tmp_path, out, "--zarr-format", zarr_format, "--tile-size", "4")
+    reader = StoreReader(out, cache_bytes=10**6)
+    assert reader.dataset.title == "Test"
+
+    whole = reader.read(Window("temperature", time=0, level=0))
+    assert whole.dtype == np.float32
+    assert np.isnan(whole[0, 0])
+    np.testing.assert_allclose(whole, temp[0, 0], atol=1e-3)
+
+    window = Window("temp", time=2, level=1, xs=3, ys=5, nx=7, ny=4)
+    np.testing.assert_allclose(reader.read(window), temp[2, 1, 5:9, 3:10], atol=1e-3)
+    with pytest.raises(ValueError):
+        reader.read(Window("temperature", level=0))
+    with pytest.raises(ValueError):
+        reader.read(Window("temperature", time=0, level=0, xs=10, nx=5))
+
+
+def test_read_many_decodes_each_chunk_once(source):
+    tmp_path, temp = source
+    out = tmp_path / "many.zarr"
+    process(tmp_path, out)
+    reader = StoreReader(out)
+    windows = [
+        Window("temperature", time=t, level=1, xs=x, nx=4)
+        for t in range(3)
+        for x in (0, 4, 8)
+    ]
+    values = reader.read_many(windows)
+    for window, value in zip(windows, values):
+        np.testing.assert_allclose(
+            value, temp[window.time, 1, :, window.xs : window.xs + 4], atol=1e-3
+        )
+    # one (time, level) grid per chunk: three decoded, then served from cache
+    assert len(reader.cache) == 3
+    reader.read(windows[0])
+    assert reader.cache.hits >= 1
+
+
+def test_bbox_window(source):
+    tmp_path, temp = source
+    out = tmp_path / "bbox.zarr"
+    process(tmp_path, out)
+    reader = StoreReader(out)
+    window = reader.bbox_window("temperature", (2.0, 3.0, 5.0, 4.0), time=1, level=0)
+    assert (window.xs, window.ys, window.nx, window.ny) == (2, 3, 4, 2)
+    np.testing.assert_allclose(reader.read(window), temp[1, 0, 3:5, 2:6], atol=1e-3)
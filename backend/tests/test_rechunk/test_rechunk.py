@@ -0,0 +1,167 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import zarr
+from typer.testing import CliRunner
+
+from vizima.manifest import MANIFEST_KEY
+from vizima.rechunk import SWAP_KEY, parse_chunks, plan_rechunk, rechunk_store
+from vizima.vizimacli import app
+
+runner = CliRunner()
+
+
+def test_parse_chunks():
+    assert parse_chunks("time=24,lat=-1") == {"time": 24, "lat": -1}
+    assert parse_chunks("") == {}
+    with pytest.raises(ValueError):
+        parse_chunks("time=0")
+    with pytest.raises(ValueError):
+        parse_chunks("time")
+
+
+def test_plan_rechunk():
+    # aligned blocks of 24 full grids fit: direct copy
+    assert plan_rechunk((48, 10, 10), (1, 10, 10), (24, 5, 5), 2, 10**6) is None
+    # they do not: through (1, 5, 5) chunks, each phase one full grid or one
+    # target chunk at a time
+    assert plan_rechunk((48, 10, 10), (1, 10, 10), (24, 5, 5), 2, 1200) == (1, 5, 5)
+    # misaligned chunks fall back to their gcd
+    assert plan_rechunk((1, 24, 24), (1, 6, 6), (1, 4, 4), 2, 200) == (1, 2, 4)
+    assert plan_rechunk((1, 24, 24), (1, 6, 6), (1, 4, 4), 2, 100) == (1, 2, 2)
+    with pytest.raises(ValueError):
+        plan_rechunk((48, 10, 10), (1, 10, 10), (24, 5, 5), 2, 100)
+
+
+def make_store(tmp_path):
+    xr.Dataset(
+        {"temp": (("time", "lat", "lon"), np.random.rand(6, 7, 9))},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=6, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", np.arange(7.0), {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(9.0), {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    store = tmp_path / "out.zarr"
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(store),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    return store
+
+
+def test_rechunk(tmp_path):
+    store = make_store(tmp_path)
+    out = tmp_path / "new.zarr"
+    args = ["rechunk", str(store), "--chunks", "time=6,lat=2,lon=2"]
+    # too small a block for a direct copy: goes through intermediate chunks
+    args += ["--compressor", "zstd:3", "--max-mem", "400B"]
+    result = runner.invoke(app, [*args, "--out", str(out)])
+    assert result.exit_code == 0, result.output
+
+    arr = zarr.open_array(str(out / "temp"), mode="r")
+    assert arr.chunks == (6, 2, 2)
+    assert arr.compressor.codec_id == "zstd"
+    assert arr.dtype == np.int16
+    # its slabs are the old chunks
+    assert not (out / MANIFEST_KEY).exists()
+    with xr.open_zarr(store) as expected, xr.open_zarr(out) as actual:
+        xr.testing.assert_identical(actual, expected)
+
+    # in place
+    expected = xr.open_zarr(store).load()
+    result = runner.invoke(app, ["rechunk", str(store), "--chunks", "lat=-1,lon=-1"])
+    assert result.exit_code == 0, result.output
+    assert zarr.open_array(str(store / "temp"), mode="r").chunks == (1, 7, 9)
+    with xr.open_zarr(store) as actual:
+        xr.testing.assert_identical(actual, expected)
+    assert not list(tmp_path.glob("out.zarr.*"))
+
+    result = runner.invoke(app, ["rechunk", str(store), "--chunks", "depth=2"])
+    assert result.exit_code != 0
+
+
+def test_rechunk_keeps_subgroups(tmp_path):
+    store = make_store(tmp_path)
+    result = runner.invoke(app, ["contour", str(store), "--level", "0.5"])
+    assert result.exit_code == 0, result.output
+    before = zarr.open_group(str(store), mode="r")
+    expected = {name: arr[...] for name, arr in before["contours/temp"].arrays()}
+    attrs = before["contours"].attrs.asdict()
+
+    # the slabs (one time step, the whole grid) are unchanged
+    result = runner.invoke(app, ["rechunk", str(store), "--compressor", "zstd"])
+    assert result.exit_code == 0, result.output
+
+    after = zarr.open_group(str(store), mode="r")
+    assert list(after.group_keys()) == ["contours"]
+    assert after["contours"].attrs.asdict() == attrs
+    for name, values in expected.items():
+        np.testing.assert_array_equal(after["contours/temp"][name][...], values)
+    assert (store / MANIFEST_KEY).exists()
+
+
+@pytest.mark.parametrize("renamed", [1, 2])
+def test_rechunk_completes_an_interrupted_swap(tmp_path, renamed):
+    store = make_store(tmp_path)
+    expected = xr.open_zarr(store).load()
+    dest, old = tmp_path / "out.zarr.rechunk", tmp_path / "out.zarr.old"
+    rechunk_store(store, dest, {"lat": -1, "lon": -1})
+    # killed after the copy was marked complete and `renamed` of its renames
+    (dest / SWAP_KEY).write_text("{}")
+    store.rename(old)
+    if renamed == 2:
+        dest.rename(store)
+
+    result = runner.invoke(app, ["rechunk", str(store)])
+    assert result.exit_code == 0, result.output
+    assert zarr.open_array(str(store / "temp"), mode="r").chunks == (1, 7, 9)
+    with xr.open_zarr(store) as actual:
+        xr.testing.assert_identical(actual, expected)
+    assert not (store / SWAP_KEY).exists()
+    assert not list(tmp_path.glob("out.zarr.*"))
+
+
+def test_rechunk_refuses_to_replace_an_old_store(tmp_path):
+    store = make_store(tmp_path)
+    (tmp_path / "out.zarr.old").mkdir()
+
+    result = runner.invoke(app, ["rechunk", str(store), "--chunks", "lat=-1"])
+    assert result.exit_code == 2
+    assert "exists" in result.output
+    assert not (tmp_path / "out.zarr.rechunk").exists()
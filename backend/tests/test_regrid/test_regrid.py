@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from vizima import regrid
+from vizima.regrid import project, regrid_dataset, regrid_weights
+
+LCC = {
+    "name": "ConicConformal",
+    "cenLon": 10.0,
+    "cenLat": 40.0,
+    "standLon": 10.0,
+    "trueLat1": 30.0,
+    "trueLat2": 60.0,
+}
+
+
+def lcc_grid(ny=40, nx=50, dx=0.002):
+    """2-D lon/lat of a grid that is regular in the LCC projection."""
+    phi1, phi2 = np.radians([LCC["trueLat1"], LCC["trueLat2"]])
+    n = np.log(np.cos(phi1) / np.cos(phi2)) / np.log(
+        np.tan(np.pi / 4 + phi2 / 2) / np.tan(np.pi / 4 + phi1 / 2)
+    )
+    x0, y0 = project(np.array(LCC["cenLon"]), np.array(LCC["cenLat"]), LCC, 10.0)
+    rows, cols = np.mgrid[0:ny, 0:nx]
+    x = x0 + dx * (cols - nx / 2)
+    y = y0 + dx * (rows - ny / 2)
+    rho = np.sqrt(x**2 + y**2)
+    lon = LCC["standLon"] + np.degrees(np.arctan2(x, -y) / n)
+    lat = np.degrees(2 * np.arctan((n * rho) ** (-1 / n)) - np.pi / 2)
+    return lon, lat
+
+
+def test_regrid_dataset_lcc(tmp_path):
+    lon, lat = lcc_grid()
+    field = lon + 2 * lat
+    ds = xr.Dataset(
+        {"T2": (("Time", "south_north", "west_east"), np.stack([field, field + 1]))},
+        coords={
+            "XLONG": (("Time", "south_north", "west_east"), np.stack([lon, lon])),
+            "XLAT": (("Time", "south_north", "west_east"), np.stack([lat, lat])),
+        },
+    ).chunk({"Time": 1})
+    metadata = {
+        "datavars": {"t2": {"arrName": "T2", "lon": "XLONG", "lat": "XLAT"}},
+        "projection": LCC,
+    }
+
+    out, out_metadata = regrid_dataset(ds, metadata, 0.5, tmp_path)
+
+    assert out_metadata["projection"] == {"name": "LonLat"}
+    assert out_metadata["datavars"]["t2"]["lon"] == "lon"
+    assert out.T2.dims == ("Time", "lat", "lon")
+    assert out.T2.encoding["preferred_chunks"]["Time"] == 1
+    np.testing.assert_allclose(np.diff(out.lon), 0.5)
+    expected = out.lon.values[None, :] + 2 * out.lat.values[:, None]
+    values = out.T2.values
+    inside = ~np.isnan(values[0])
+    # corners of the target box are outside the conic domain
+    assert 0.5 < inside.mean() < 1
+    np.testing.assert_allclose(values[0][inside], expected[inside], atol=0.01)
+    np.testing.assert_allclose(values[1][inside], expected[inside] + 1, atol=0.01)
+
+
+def test_regrid_weights_are_cached(tmp_path, monkeypatch):
+    lon, lat = lcc_grid()
+    first = regrid_weights(lon, lat, LCC, 0.5, tmp_path)
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    def fail(*args):
+        raise AssertionError("weights computed again")
+
+    monkeypatch.setattr(regrid, "fit_grid", fail)
+    second = regrid_weights(lon, lat, LCC, 0.5, tmp_path)
+    np.testing.assert_array_equal(first.weights, second.weights)
+
+    # another projection is another set of weights
+    with pytest.raises(AssertionError):
+        regrid_weights(lon, lat, {**LCC, "trueLat2": 50.0}, 0.5, tmp_path)
+
+
+def test_regrid_weights_irregular_grid(tmp_path):
+    lon, lat = lcc_grid()
+    lat = lat + np.random.default_rng(0).normal(0, 0.2, lat.shape)
+    with pytest.raises(ValueError, match="not regular"):
+        regrid_weights(lon, lat, LCC, 0.5, tmp_path)
+
+
+def test_apply_skips_missing_neighbours():
+    weights = regrid.RegridWeights(
+        indices=np.array([[0, 1, 2, 3]]),
+        weights=np.array([[0.25, 0.25, 0.25, 0.25]]),
+        lon=np.array([0.5]),
+        lat=np.array([0.5]),
+    )
+    block = np.array([[[1.0, np.nan], [3.0, 5.0]]])
+    np.testing.assert_allclose(weights.apply(block), [[[3.0]]])
+    assert np.isnan(weights.apply(np.full((1, 2, 2), np.nan))).all()
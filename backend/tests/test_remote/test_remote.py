@@ -0,0 +1,138 @@
+import json
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.remote import UploadStore
+from vizima.vizimacli import app
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def url(tmp_path):
+    url = f"memory://{tmp_path.name}/out.zarr"
+    yield url
+    fs = fsspec.filesystem("memory")
+    if fs.exists(f"/{tmp_path.name}"):
+        fs.rm(f"/{tmp_path.name}", recursive=True)
+
+
+def test_upload_store_retries_and_orders_metadata(url, monkeypatch):
+    store = UploadStore(url, concurrency=4, retries=2, backoff=0)
+    put = store.fs.pipe_file
+    failures = {"temp/0.0": 2}
+    written = []
+
+    def flaky_pipe_file(path, data, **kwargs):
+        key = path.split("out.zarr/", 1)[1]
+        if failures.get(key):
+            failures[key] -= 1
+            raise ConnectionError("connection reset")
+        written.append(key)
+        return put(path, data, **kwargs)
+
+    # filesystem instances are shared, so patch with undo
+    monkeypatch.setattr(store.fs, "pipe_file", flaky_pipe_file)
+    for i in range(8):
+        store[f"temp/{i}.0"] = bytes([i]) * 10
+    store[".zmetadata"] = b"{}"
+    store.close()
+
+    # metadata is written after every chunk, including the retried one
+    assert written[-1] == ".zmetadata"
+    assert sorted(written[:-1]) == [f"temp/{i}.0" for i in range(8)]
+    assert store["temp/0.0"] == bytes([0]) * 10
+    assert sorted(store.listdir("temp")) == [f"{i}.0" for i in range(8)]
+
+
+def test_upload_store_raises_after_retries(url, monkeypatch):
+    store = UploadStore(url, concurrency=2, retries=1, backoff=0)
+
+    def broken_pipe_file(path, data, **kwargs):
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(store.fs, "pipe_file", broken_pipe_file)
+    store["temp/0.0"] = b"x"
+    with pytest.raises(ConnectionError):
+        store.close()
+
+
+def test_upload_store_never_leaves_partial_local_files(tmp_path, monkeypatch):
+    store = UploadStore(str(tmp_path / "out.zarr"), retries=0, part_size=4)
+    store["temp/0.0"] = b"complete"
+    store.flush()
+
+    def interrupted_mv(path1, path2, **kwargs):
+        raise ConnectionError("interrupted")
+
+    monkeypatch.setattr(store.fs, "mv", interrupted_mv)
+    store["temp/0.0"] = b"partial data"
+    store["temp/1.0"] = b"partial data"
+    with pytest.raises(ConnectionError):
+        store.close()
+
+    # the old content stays in place and nothing else is left behind
+    assert sorted(p.name for p in (tmp_path / "out.zarr/temp").iterdir()) == ["0.0"]
+    assert (tmp_path / "out.zarr/temp/0.0").read_bytes() == b"complete"
+
+
+def test_upload_store_writes_large_objects_in_parts(url):
+    store = UploadStore(url, part_size=1000)
+    data = bytes(range(256)) * 20
+    store["big.json"] = data
+    store.close()
+    assert store["big.json"] == data
+
+
+def test_process_dataset_to_url(tmp_path, url):
+    xr.Dataset(
+        {"temp": (("time", "lat", "lon"), np.random.rand(3, 4, 5))},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=3, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", np.arange(4.0), {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(5.0), {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    args = ["process-dataset", str(tmp_path / "in.nc")]
+    args += ["--metadata-file", str(tmp_path / "meta.json")]
+
+    local = tmp_path / "local.zarr"
+    result = runner.invoke(app, [*args, "--out", str(local)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(app, [*args, "--out", url, "--upload-concurrency", "4"])
+    assert result.exit_code == 0, result.output
+
+    with xr.open_zarr(local) as expected, xr.open_zarr(url) as actual:
+        xr.testing.assert_identical(actual, expected)
+    assert fsspec.filesystem("memory").exists(
+        url.removeprefix("memory://") + "/vizima_manifest.json"
+    )
@@ -0,0 +1,155 @@
+import asyncio
+import gzip
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from vizima.server import (
+    ByteLRU,
+    ChunkServer,
+    Entry,
+    asgi_app,
+    bench_server,
+    make_http_server,
+    parse_range,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = tmp_path / "out.zarr"
+    (store / "temp").mkdir(parents=True)
+    (store / ".zmetadata").write_text(json.dumps({"metadata": {"x": "y" * 1000}}))
+    for i in range(4):
+        (store / "temp" / f"{i}.0.0").write_bytes(bytes(range(256)) * (i + 1))
+    return store
+
+
+def test_byte_lru_evicts_least_recently_used():
+    cache = ByteLRU(250)
+    for key in "abc":
+        cache.put(key, Entry(b"x" * 100, key, (0, 0)))
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    cache.put("d", Entry(b"x" * 100, "d", (0, 0)))
+    # b was used more recently than c
+    assert cache.get("c") is None and cache.get("b") is not None
+    assert cache.nbytes == 200 and len(cache) == 2
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 10)
+    assert parse_range("bytes=90-", 100) == (90, 100)
+    assert parse_range("bytes=-10", 100) == (90, 100)
+    assert parse_range("bytes=50-500", 100) == (50, 100)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_respond(store):
+    server = ChunkServer(store)
+    response = server.respond("GET", "/temp/1.0.0", {})
+    assert response.status == 200
+    assert response.body == bytes(range(256)) * 2
+    assert response.headers["Cache-Control"] == "public, max-age=86400"
+    etag = response.headers["ETag"]
+
+    # revalidation of an unchanged chunk
+    response = server.respond("GET", "/temp/1.0.0", {"if-none-match": etag})
+    assert response.status == 304 and response.body == b""
+
+    response = server.respond("GET", "/temp/1.0.0", {"range": "bytes=10-19"})
+    assert response.status == 206
+    assert response.body == bytes(range(10, 20))
+    assert response.headers["Content-Range"] == "bytes 10-19/512"
+
+    metadata = server.respond("GET", "/.zmetadata", {"accept-encoding": "gzip, br"})
+    assert metadata.headers["Cache-Control"] == "no-cache"
+    assert metadata.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(metadata.body) == (store / ".zmetadata").read_bytes()
+
+    assert server.respond("GET", "/../secret", {}).status == 404
+    assert server.respond("PUT", "/temp/1.0.0", {}).status == 405
+    assert server.cache.hits >= 2
+
+    # a rewritten chunk gets a new ETag
+    (store / "temp" / "1.0.0").write_bytes(b"new")
+    response = server.respond("GET", "/temp/1.0.0", {"if-none-match": etag})
+    assert response.status == 200 and response.body == b"new"
+    assert response.headers["ETag"] != etag
+
+
+def test_range_reads_only_the_range(store, monkeypatch):
+    server = ChunkServer(store)
+    etag = server.respond("GET", "/temp/2.0.0", {}).headers["ETag"]
+    server.cache = ByteLRU(0)
+
+    def read_bytes(path):
+        raise AssertionError(f"{path} read whole")
+
+    monkeypatch.setattr(Path, "read_bytes", read_bytes)
+    headers = {"range": "bytes=256-259", "if-range": etag}
+    response = server.respond("GET", "/temp/2.0.0", headers)
+    assert response.status == 206
+    assert response.body == bytes(range(4))
+    assert response.headers["ETag"] == etag
+    assert response.headers["Content-Range"] == "bytes 256-259/768"
+    assert server.respond("GET", "/temp/2.0.0", {"range": "bytes=768-"}).status == 416
+
+
+def test_gzip_has_its_own_etag(store):
+    server = ChunkServer(store)
+    identity = server.respond("GET", "/.zmetadata", {})
+    gzipped = server.respond("GET", "/.zmetadata", {"accept-encoding": "gzip"})
+    assert identity.headers["ETag"] != gzipped.headers["ETag"]
+    assert identity.headers["Vary"] == gzipped.headers["Vary"] == "Accept-Encoding"
+
+    etag = gzipped.headers["ETag"]
+    response = server.respond(
+        "GET", "/.zmetadata", {"accept-encoding": "gzip", "if-none-match": etag}
+    )
+    assert response.status == 304
+    # a cached gzip body does not answer a client that does not accept gzip
+    response = server.respond("GET", "/.zmetadata", {"if-none-match": etag})
+    assert response.status == 200 and "Content-Encoding" not in response.headers
+
+
+def test_asgi_app(store):
+    app = asgi_app(ChunkServer(store))
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/temp/0.0.0",
+        "headers": [(b"Range", b"bytes=0-3")],
+    }
+    asyncio.run(app(scope, receive, send))
+    assert sent[0]["status"] == 206
+    assert sent[1]["body"] == bytes(range(4))
+
+
+def test_bench_server(store):
+    httpd = make_http_server(ChunkServer(store), "127.0.0.1", 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{httpd.server_address[1]}/"
+        result = bench_server(url, store, clients=3, requests=20, revisit=0.5)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert result["requests"] == 60
+    assert set(result["statuses"]) <= {"200", "304"}
+    assert result["statuses"]["304"] > 0
@@ -0,0 +1,39 @@
+"""
+Writes `zarr_python_3.zarr`, the store that `test_sharding.py` checks the
+sharding writer and reader against, with zarr-python 3 (tested with 3.0.8):
+
+    python make_zarr_python_3.py zarr_python_3.zarr
+"""
+
+import sys
+
+import numpy as np
+import zarr
+from zarr.codecs import BloscCodec, BytesCodec, ShardingCodec
+
+FILL = -32767
+data = np.arange(3 * 5 * 7, dtype=np.int16).reshape(3, 5, 7)
+# an empty inner chunk in every shard and empty shards
+data[:, :2, :2] = FILL
+data[2] = FILL
+group = zarr.open_group(sys.argv[1], mode="w")
+# the codec chain of vizima.sharding.write_sharded_array
+temp = group.create_array(
+    "temp",
+    shape=data.shape,
+    dtype="int16",
+    chunks=(1, 4, 8),
+    serializer=ShardingCodec(
+        chunk_shape=(1, 2, 2),
+        codecs=[
+            BytesCodec(endian="little"),
+            BloscCodec(cname="lz4", clevel=5, shuffle="shuffle", blocksize=0),
+        ],
+        index_codecs=[BytesCodec(endian="little")],
+        index_location="end",
+    ),
+    compressors=None,
+    fill_value=FILL,
+    dimension_names=("time", "lat", "lon"),
+)
+temp[:] = data
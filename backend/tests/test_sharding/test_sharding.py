@@ -0,0 +1,278 @@
+import json
+import math
+from pathlib import Path
+
+import numcodecs
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.sharding import (
+    EMPTY,
+    encode_shard,
+    plan_shards,
+    read_array,
+    write_sharded_dataset,
+)
+from vizima.vizimacli import FILL_VALUE, app
+
+runner = CliRunner()
+
+# written by zarr-python 3 with data/make_zarr_python_3.py
+ZARR_PYTHON_3 = Path(__file__).parent / "data" / "zarr_python_3.zarr"
+
+
+def zarr_python_3_data():
+    data = np.arange(3 * 5 * 7, dtype=np.int16).reshape(3, 5, 7)
+    data[:, :2, :2] = FILL_VALUE
+    data[2] = FILL_VALUE
+    return data
+
+
+def shard_chunks(path, grid):
+    """Decoded inner chunks of the shard at `path`, by position; None if empty."""
+    buf = path.read_bytes()
+    index = np.frombuffer(buf[-math.prod(grid) * 16 :], dtype="<u8")
+    index = index.reshape(grid + (2,))
+    return {
+        pos: None
+        if index[pos][0] == EMPTY
+        else numcodecs.Blosc().decode(buf[index[pos][0] : sum(index[pos])])
+        for pos in np.ndindex(*grid)
+    }
+
+
+def decode_v3_chunk(buf, codecs, shape, dtype, fill_value):
+    """
+    Decode a chunk of `shape` with the codec chain `codecs` of Zarr v3
+    metadata, as the specification (and zarrita) does, independently of
+    `vizima.sharding`.
+    """
+    array_to_bytes, *bytes_to_bytes = codecs
+    for codec in reversed(bytes_to_bytes):
+        assert codec["name"] == "blosc"
+        buf = numcodecs.Blosc().decode(buf)
+    config = array_to_bytes["configuration"]
+    if array_to_bytes["name"] == "bytes":
+        order = "<" if config["endian"] == "little" else ">"
+        return np.frombuffer(buf, dtype.newbyteorder(order)).reshape(shape)
+
+    assert array_to_bytes["name"] == "sharding_indexed"
+    inner = tuple(config["chunk_shape"])
+    grid = tuple(s // c for s, c in zip(shape, inner))
+    assert config["index_codecs"] == [
+        {"name": "bytes", "configuration": {"endian": "little"}}
+    ]
+    nindex = math.prod(grid) * 16
+    index = buf[-nindex:] if config["index_location"] == "end" else buf[:nindex]
+    offsets = np.frombuffer(index, dtype="<u8").reshape(grid + (2,))
+    out = np.full(shape, fill_value, dtype)
+    for pos in np.ndindex(*grid):
+        offset, nbytes = (int(v) for v in offsets[pos])
+        if offset == nbytes == 2**64 - 1:
+            continue
+        region = tuple(slice(p * c, (p + 1) * c) for p, c in zip(pos, inner))
+        out[region] = decode_v3_chunk(
+            buf[offset : offset + nbytes], config["codecs"], inner, dtype, fill_value
+        )
+    return out
+
+
+def read_v3_array(path):
+    """A Zarr v3 array read from its metadata alone (see `decode_v3_chunk`)."""
+    meta = json.loads((path / "zarr.json").read_text())
+    assert (meta["zarr_format"], meta["node_type"]) == (3, "array")
+    assert meta["chunk_grid"]["name"] == "regular"
+    assert meta["chunk_key_encoding"] == {
+        "name": "default",
+        "configuration": {"separator": "/"},
+    }
+    shape = tuple(meta["shape"])
+    chunks = tuple(meta["chunk_grid"]["configuration"]["chunk_shape"])
+    dtype = np.dtype(meta["data_type"])
+    fill_value = np.nan if meta["fill_value"] == "NaN" else meta["fill_value"]
+    out = np.full(shape, fill_value, dtype)
+    for index in np.ndindex(*(-(-s // c) for s, c in zip(shape, chunks))):
+        key = path.joinpath("c", *map(str, index))
+        if not key.exists():
+            continue
+        chunk = decode_v3_chunk(
+            key.read_bytes(), meta["codecs"], chunks, dtype, fill_value
+        )
+        region = tuple(
+            slice(i * c, min((i + 1) * c, s)) for i, c, s in zip(index, chunks, shape)
+        )
+        out[region] = chunk[tuple(slice(0, r.stop - r.start) for r in region)]
+    return out
+
+
+def test_plan_shards():
+    # whole rows first, then whole grids, then time steps
+    assert plan_shards((100, 10, 10), (1, 4, 4), 2, 2 * 4 * 12) == (1, 4, 12)
+    assert plan_shards((100, 10, 10), (1, 4, 4), 2, 2 * 12 * 12 * 3) == (3, 12, 12)
+    assert plan_shards((2, 10, 10), (1, 4, 4), 2, 10**9) == (2, 12, 12)
+    # a shard holds at least one inner chunk
+    assert plan_shards((100, 10, 10), (1, 4, 4), 2, 1) == (1, 4, 4)
+
+
+def test_encode_shard_skips_empty_chunks():
+    block = np.full((1, 3, 4), FILL_VALUE, dtype=np.int16)
+    assert encode_shard(block, (1, 2, 2), (1, 4, 4), FILL_VALUE) is None
+
+    block[0, 2, 3] = 5
+    data = encode_shard(block, (1, 2, 2), (1, 4, 4), FILL_VALUE)
+    assert data is not None
+    index = np.frombuffer(data[-4 * 16 :], dtype="<u8").reshape(2, 2, 2)
+    assert (index[:, :, 1] != 2**64 - 1).sum() == 1
+
+
+def test_read_array_reads_zarr_python_3_store():
+    np.testing.assert_array_equal(
+        read_array(ZARR_PYTHON_3 / "temp"), zarr_python_3_data()
+    )
+
+
+def test_spec_reader_reads_zarr_python_3_store():
+    np.testing.assert_array_equal(
+        read_v3_array(ZARR_PYTHON_3 / "temp"), zarr_python_3_data()
+    )
+
+
+def write_partial_shards(out):
+    """A store whose edge shards and inner chunks are partial, with coordinates."""
+    data = np.arange(3 * 5 * 7, dtype=np.int16).reshape(3, 5, 7)
+    data[1, :2, :] = FILL_VALUE
+    ds = xr.Dataset(
+        {"temp": (("time", "lat", "lon"), data)},
+        coords={"lat": ("lat", np.arange(5.0)), "lon": ("lon", np.arange(7.0))},
+    ).chunk()
+    write_sharded_dataset(ds, out, {"temp": (1, 2, 3)}, 2 * 2 * 4 * 6, FILL_VALUE)
+    return data
+
+
+def test_sharded_store_reads_per_the_specification(tmp_path):
+    data = write_partial_shards(tmp_path)
+
+    meta = json.loads((tmp_path / "temp" / "zarr.json").read_text())
+    assert meta["chunk_grid"]["configuration"]["chunk_shape"] == [1, 4, 9]
+    np.testing.assert_array_equal(read_v3_array(tmp_path / "temp"), data)
+    np.testing.assert_array_equal(read_v3_array(tmp_path / "lat"), np.arange(5.0))
+
+
+def test_sharded_store_reads_with_zarr_python_3(tmp_path):
+    zarr = pytest.importorskip("zarr", minversion="3")
+    data = write_partial_shards(tmp_path)
+
+    group = zarr.open_group(tmp_path, mode="r")
+    np.testing.assert_array_equal(group["temp"][:], data)
+    np.testing.assert_array_equal(group["lon"][:], np.arange(7.0))
+
+
+def test_sharded_array_matches_zarr_python_3(tmp_path):
+    ds = xr.Dataset(
+        {"temp": (("time", "lat", "lon"), zarr_python_3_data())},
+    ).chunk()
+    write_sharded_dataset(ds, tmp_path, {"temp": (1, 2, 2)}, 2 * 4 * 8, FILL_VALUE)
+
+    ours = json.loads((tmp_path / "temp" / "zarr.json").read_text())
+    theirs = json.loads((ZARR_PYTHON_3 / "temp" / "zarr.json").read_text())
+    for key in (
+        "shape",
+        "data_type",
+        "chunk_grid",
+        "chunk_key_encoding",
+        "fill_value",
+        "codecs",
+        "dimension_names",
+    ):
+        assert ours[key] == theirs[key], key
+
+    # the same shards, without the empty one
+    keys = sorted(p.relative_to(ZARR_PYTHON_3) for p in ZARR_PYTHON_3.rglob("c/*/*/*"))
+    assert sorted(p.relative_to(tmp_path) for p in tmp_path.rglob("c/*/*/*")) == keys
+    assert len(keys) == 4
+    # inner chunks may be stored in any order; the index at the end of the
+    # shard locates them and marks the empty ones
+    for key in keys:
+        assert shard_chunks(tmp_path / key, (1, 2, 4)) == shard_chunks(
+            ZARR_PYTHON_3 / key, (1, 2, 4)
+        )
+
+
+def test_process_dataset_zarr_v3(tmp_path):
+    temp = np.arange(4 * 5 * 7, dtype=float).reshape(4, 5, 7)
+    temp[:, :2, :2] = np.nan
+    xr.Dataset(
+        {"temp": (("time", "lat", "lon"), temp)},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=4, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", np.arange(5.0), {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(7.0), {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    out = tmp_path / "out.zarr"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+            "--zarr-format",
+            "3",
+            "--tile-size",
+            "2",
+            "--shard-size",
+            str(2 * 2 * 6 * 8),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    group = json.loads((out / "zarr.json").read_text())
+    assert group["node_type"] == "group"
+    assert group["attributes"]["times"]["time"][0] == "2026-01-01T00:00:00"
+
+    meta = json.loads((out / "temp" / "zarr.json").read_text())
+    assert meta["chunk_grid"]["configuration"]["chunk_shape"] == [2, 6, 8]
+    assert meta["codecs"][0]["configuration"]["chunk_shape"] == [1, 2, 2]
+    assert meta["dimension_names"] == ["time", "lat", "lon"]
+    # one object per shard instead of one per tile
+    shards = [p for p in (out / "temp" / "c").rglob("*") if p.is_file()]
+    assert len(shards) == 2
+
+    packed = read_array(out / "temp")
+    decoded = (
+        packed * meta["attributes"]["scale_factor"] + meta["attributes"]["add_offset"]
+    )
+    decoded[packed == FILL_VALUE] = np.nan
+    np.testing.assert_allclose(decoded, temp, atol=0.01)
+    np.testing.assert_array_equal(read_array(out / "lat"), np.arange(5.0))
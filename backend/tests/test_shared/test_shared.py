@@ -0,0 +1,194 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import zarr
+
+from vizima.profiling import Profiler
+from vizima.shared import LOCK_NAME, StoreLock, Writer, is_fresh, shared_write
+
+
+def make_dataset(hours, offset=0.0):
+    times = pd.Timestamp("2026-01-01") + pd.to_timedelta(hours, "h")
+    shape = (len(hours), 3, 4)
+    base = np.asarray(hours, dtype=float)[:, None, None] + np.zeros(shape)
+    return xr.Dataset(
+        {
+            "temp": (("time", "lat", "lon"), 280.0 + offset + base),
+            "rh": (("time", "lat", "lon"), 50.0 + base),
+        },
+        coords={
+            "time": ("time", times, {"standard_name": "time"}),
+            "step": ("time", np.asarray(hours, dtype=float)),
+            "lat": ("lat", [0.0, 1.0, 2.0], {"units": "degrees_north"}),
+            "lon": ("lon", [10.0, 11.0, 12.0, 13.0], {"units": "degrees_east"}),
+        },
+    )
+
+
+def datavar(arr_name):
+    return {
+        "units": "1",
+        "long_name": arr_name,
+        "standard_name": arr_name,
+        "arrName": arr_name,
+        "lon": "lon",
+        "lat": "lat",
+        "level": "",
+        "time": "time",
+    }
+
+
+def make_metadata(*arr_names):
+    return {
+        "datavars": {name: datavar(name) for name in arr_names},
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+
+
+def write(ds, metadata, out, **kwargs):
+    shared_write(ds, metadata, out, Profiler("test"), poll=0.01, **kwargs)
+
+
+def test_writers_of_different_variables(tmp_path):
+    out = tmp_path / "out.zarr"
+    ds = make_dataset([0, 1, 2])
+    write(ds, make_metadata("temp"), out)
+    write(ds, make_metadata("rh"), out)
+
+    stored = xr.open_zarr(out)
+    np.testing.assert_allclose(stored.temp.values, ds.temp.values, atol=1e-2)
+    np.testing.assert_allclose(stored.rh.values, ds.rh.values, atol=1e-2)
+    assert set(stored.attrs["datavars"]) == {"temp", "rh"}
+    assert len(stored.attrs["times"]["time"]) == 3
+    assert not (out / LOCK_NAME).exists()
+    assert not list((out / ".vizima.writers").glob("*"))
+
+
+def test_writers_of_time_ranges_in_any_order(tmp_path):
+    out = tmp_path / "out.zarr"
+    metadata = make_metadata("temp")
+    late, early = make_dataset([2, 3]), make_dataset([0, 1], offset=-40.0)
+    write(late, metadata, out)
+    # earlier steps move the stored ones, and a wider range re-packs them
+    write(early, metadata, out)
+
+    stored = xr.open_zarr(out)
+    expected = xr.concat([early, late], "time")
+    np.testing.assert_array_equal(stored.time.values, expected.time.values)
+    np.testing.assert_allclose(stored.temp.values, expected.temp.values, atol=1e-2)
+    np.testing.assert_array_equal(stored.step.values, [0, 1, 2, 3])
+    assert stored.attrs["times"]["time"][0] == "2026-01-01T00:00:00"
+
+    assert zarr.open_group(str(out))["temp"].shape == (4, 3, 4)
+
+
+def test_rewriting_unchanged_steps_is_skipped(tmp_path, caplog):
+    out = tmp_path / "out.zarr"
+    metadata = make_metadata("temp")
+    write(make_dataset([0, 1]), metadata, out)
+    with caplog.at_level("INFO"):
+        write(make_dataset([0, 1]), metadata, out)
+    assert "Wrote 0 slab(s)" in caplog.text
+
+
+def test_concurrent_writers(tmp_path):
+    out = tmp_path / "out.zarr"
+    ds = make_dataset([0, 1, 2, 3])
+    jobs = [
+        (ds.isel(time=slice(0, 2)), make_metadata("temp")),
+        (ds.isel(time=slice(0, 2)), make_metadata("rh")),
+        (ds.isel(time=slice(2, 4)), make_metadata("temp")),
+        (ds.isel(time=slice(2, 4)), make_metadata("rh")),
+    ]
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(write, part, metadata, out) for part, metadata in jobs]
+        for future in futures:
+            future.result()
+
+    stored = xr.open_zarr(out)
+    np.testing.assert_array_equal(stored.time.values, ds.time.values)
+    np.testing.assert_allclose(stored.temp.values, ds.temp.values, atol=1e-2)
+    np.testing.assert_allclose(stored.rh.values, ds.rh.values, atol=1e-2)
+    assert set(stored.attrs["datavars"]) == {"temp", "rh"}
+
+
+def test_moving_steps_waits_for_active_writers(tmp_path):
+    out = tmp_path / "out.zarr"
+    metadata = make_metadata("temp")
+    write(make_dataset([2, 3]), metadata, out)
+
+    other = Writer(out, stale=60.0)
+    other.register(["temp"], ["time"])
+    with pytest.raises(TimeoutError, match="still active"):
+        write(make_dataset([0, 1]), metadata, out, timeout=0.1)
+
+    # appended steps within the packing range move nothing and do not wait
+    write(make_dataset([4], offset=-2.0), metadata, out, timeout=0.1)
+    other.unregister()
+
+
+def test_projection_mismatch(tmp_path):
+    out = tmp_path / "out.zarr"
+    write(make_dataset([0]), make_metadata("temp"), out)
+    metadata = make_metadata("rh")
+    metadata["projection"] = {"name": "Mercator"}
+    with pytest.raises(ValueError, match="Projection"):
+        write(make_dataset([0]), metadata, out)
+
+
+def test_store_lock_timeout_and_stale_lock(tmp_path):
+    path = tmp_path / LOCK_NAME
+    with StoreLock(path), pytest.raises(TimeoutError):
+        StoreLock(path, poll=0.01, timeout=0.05).acquire()
+
+    path.write_text("{}")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    with StoreLock(path, poll=0.01, timeout=0.05, stale=60.0) as lock:
+        assert lock.held
+    assert not path.exists()
+
+
+def test_breaking_a_stale_lock_keeps_a_fresh_one(tmp_path, monkeypatch):
+    path = tmp_path / LOCK_NAME
+    path.write_text("{}")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    rename = os.rename
+
+    def break_first(src, dst):
+        # another writer breaks the stale lock and takes it in between
+        path.unlink()
+        StoreLock(path).acquire()
+        rename(src, dst)
+
+    monkeypatch.setattr(os, "rename", break_first)
+    assert StoreLock(path, stale=60.0).break_stale()
+
+    assert is_fresh(path, 60.0)
+    assert "token" in json.loads(path.read_text())
+    assert [p.name for p in tmp_path.iterdir()] == [LOCK_NAME]
+
+
+def test_releasing_a_broken_lock_keeps_the_next_one(tmp_path):
+    path = tmp_path / LOCK_NAME
+    lock = StoreLock(path)
+    lock.acquire()
+    path.unlink()
+    other = StoreLock(path)
+    other.acquire()
+
+    lock.release()
+    assert path.exists()
+    other.release()
+    assert not path.exists()
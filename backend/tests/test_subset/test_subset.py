@@ -0,0 +1,146 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.subset import parse_bbox, parse_time_range, subset_dataset
+from vizima.vizimacli import app
+
+runner = CliRunner()
+
+
+def make_metadata(lon="lon", lat="lat", level="", time="time"):
+    return {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": lon,
+                "lat": lat,
+                "level": level,
+                "time": time,
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+
+
+def test_parse():
+    assert parse_bbox("-20,0,20,30.5") == (-20.0, 0.0, 20.0, 30.5)
+    with pytest.raises(ValueError):
+        parse_bbox("0,10,20")
+    with pytest.raises(ValueError):
+        parse_bbox("0,30,20,10")
+    assert parse_time_range("/2026-01-02") == (None, pd.Timestamp("2026-01-02"))
+    with pytest.raises(ValueError):
+        parse_time_range("2026-01-02")
+
+
+def test_subset_across_the_seam():
+    lon = np.arange(0.0, 360.0, 10.0)
+    lat = np.arange(-80.0, 90.0, 10.0)
+    temp = np.random.rand(2, lat.size, lon.size)
+    ds = xr.Dataset(
+        {"temp": (("time", "lat", "lon"), temp)},
+        coords={"time": [0, 1], "lat": lat, "lon": lon},
+    ).chunk()
+    out = subset_dataset(ds, make_metadata(), bbox=(-20.0, 0.0, 20.0, 30.0))
+    np.testing.assert_array_equal(out["lon"], np.arange(-20.0, 30.0, 10.0))
+    np.testing.assert_array_equal(out["lat"], [0.0, 10.0, 20.0, 30.0])
+    expected = ds["temp"].sel(lat=slice(0, 30)).isel(lon=[34, 35, 0, 1, 2])
+    np.testing.assert_array_equal(out["temp"], expected)
+
+
+def test_subset_curvilinear():
+    y, x = np.mgrid[0:6, 0:8].astype(float)
+    ds = xr.Dataset(
+        {"temp": (("time", "y", "x"), np.random.rand(1, 6, 8))},
+        coords={
+            "time": [0],
+            "lon2d": (("y", "x"), 100 + x + 0.5 * y),
+            "lat2d": (("y", "x"), 10 + y),
+        },
+    )
+    metadata = make_metadata("lon2d", "lat2d")
+    out = subset_dataset(ds, metadata, bbox=(102.0, 11.0, 104.0, 13.0))
+    # rows 1..3; columns holding lon 102..104 on any of those rows
+    assert out.sizes == {"time": 1, "y": 3, "x": 3}
+    np.testing.assert_array_equal(out["lat2d"][:, 0], [11.0, 12.0, 13.0])
+    np.testing.assert_array_equal(out["temp"], ds["temp"][:, 1:4, 1:4])
+    with pytest.raises(ValueError):
+        subset_dataset(ds, metadata, bbox=(0.0, 0.0, 10.0, 10.0))
+
+
+def test_process_dataset_subset(tmp_path):
+    times = pd.date_range("2026-01-01", periods=6, freq="D")
+    xr.Dataset(
+        {
+            "temp": (
+                ("time", "level", "lat", "lon"),
+                np.random.rand(6, 3, 10, 20),
+            )
+        },
+        coords={
+            "time": ("time", times, {"standard_name": "time"}),
+            "level": (
+                "level",
+                [1000.0, 850.0, 500.0],
+                {"units": "hPa", "positive": "down"},
+            ),
+            "lat": ("lat", np.arange(10.0), {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(20.0), {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    (tmp_path / "meta.json").write_text(json.dumps(make_metadata(level="level")))
+    out = tmp_path / "out.zarr"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+            "--bbox=5,2,9.5,4",
+            "--time-range",
+            "2026-01-02/2026-01-03",
+            "--levels",
+            "850",
+            "--levels",
+            "500",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    with xr.open_zarr(out) as store:
+        assert store["temp"].shape == (2, 2, 3, 5)
+        assert store.attrs["lons"]["lon"] == {"start": 5.0, "end": 9.0, "count": 5}
+        assert store.attrs["lats"]["lat"] == {"start": 2.0, "end": 4.0, "count": 3}
+        assert store.attrs["times"]["time"][0].startswith("2026-01-02")
+        assert store.attrs["levels"]["level"] == ["850.0 hPa", "500.0 hPa"]
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+            "--bbox",
+            "5,2,9",
+        ],
+    )
+    assert result.exit_code != 0
@@ -0,0 +1,182 @@
+import json
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.tiles import (
+    TILES_MANIFEST,
+    colorize,
+    colormap_lut,
+    encode_png,
+    xyz_index,
+)
+from vizima.vizimacli import FILL_VALUE, Colormap, app
+
+runner = CliRunner()
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, {}
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        kind = data[pos + 4 : pos + 8]
+        chunks[kind] = data[pos + 8 : pos + 8 + length]
+        pos += 12 + length
+    width, height = struct.unpack(">II", chunks[b"IHDR"][:8])
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8)
+    return raw.reshape(height, 1 + width * 4)[:, 1:].reshape(height, width, 4)
+
+
+def test_colorize():
+    lut = colormap_lut(Colormap.viridis)
+    # packed with scale 0.01, offset 0: values -1, 0, 1, 5 and missing
+    packed = np.array([[-100, 0, 100, 500, FILL_VALUE]], dtype=np.int16)
+    rgba = colorize(packed, 0.01, 0.0, -1.0, 1.0, lut)
+
+    np.testing.assert_array_equal(rgba[0, 0], lut[0])
+    np.testing.assert_array_equal(rgba[0, 1], lut[128])
+    np.testing.assert_array_equal(rgba[0, 2], lut[255])
+    # clamped above vmax, transparent where missing
+    np.testing.assert_array_equal(rgba[0, 3], lut[255])
+    assert rgba[0, 4, 3] == 0
+    np.testing.assert_array_equal(lut[0, :3], [0x44, 0x01, 0x54])
+
+
+def test_encode_png_round_trip():
+    rgba = np.random.default_rng(0).integers(0, 256, (5, 7, 4), dtype=np.uint8)
+    np.testing.assert_array_equal(decode_png(encode_png(rgba)), rgba)
+
+
+def test_xyz_index_global_grid():
+    lon = np.arange(0.0, 360.0, 1.0)
+    lat = np.arange(-90.0, 90.1, 1.0)
+    cols, rows = xyz_index(lon, lat, 0)
+
+    assert len(cols) == len(rows) == 256
+    assert (cols >= 0).all() and (rows >= 0).all()
+    # the first pixel is centred at 179.3W, nearest to 181E
+    assert cols[0] == 181
+    # rows run from north to south
+    assert lat[rows[0]] > 80 and lat[rows[-1]] < -80
+
+
+def make_store(tmp_path, temp):
+    ny, nx = temp.shape[1:]
+    xr.Dataset(
+        {"temp": (("time", "lat", "lon"), temp)},
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=len(temp), freq="h"),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", np.linspace(-10, 10, ny), {"units": "degrees_north"}),
+            "lon": ("lon", np.linspace(100, 130, nx), {"units": "degrees_east"}),
+        },
+    ).to_netcdf(tmp_path / "in.nc")
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    (tmp_path / "meta.json").write_text(json.dumps(metadata))
+    out = tmp_path / "out.zarr"
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in.nc"),
+            "--metadata-file",
+            str(tmp_path / "meta.json"),
+            "--out",
+            str(out),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    return out
+
+
+def test_render_tiles_command(tmp_path):
+    y = np.linspace(0, 1, 21)[:, None] * np.ones((21, 31))
+    temp = np.stack([y, y])
+    temp[1, 0, 0] = np.nan
+    store = make_store(tmp_path, temp)
+    tiles = tmp_path / "tiles"
+    args = ["render-tiles", str(store), "--out", str(tiles), "--tile-size", "16"]
+
+    result = runner.invoke(app, args)
+    assert result.exit_code == 0, result.output
+
+    manifest = json.loads((tiles / TILES_MANIFEST).read_text())
+    info = manifest["variables"]["temperature"]
+    assert info["dims"] == ["time"] and info["shape"] == [21, 31]
+    # 2 time steps of 2 x 2 tiles
+    assert len(manifest["hashes"]) == 8
+    top_left = decode_png((tiles / "temp/0/0/0.png").read_bytes())
+    assert top_left.shape == (16, 16, 4)
+    # north up: the top row holds the largest values
+    lut = colormap_lut(Colormap.viridis)
+    np.testing.assert_array_equal(top_left[0, 0], lut[255])
+    # the missing value in the south-west corner is transparent
+    bottom_left = decode_png((tiles / "temp/1/1/0.png").read_bytes())
+    assert bottom_left.shape == (5, 16, 4)
+    assert bottom_left[-1, 0, 3] == 0 and bottom_left[-1, 1, 3] == 255
+
+    # nothing changed: only the deleted tile is written again
+    deleted = tiles / "temp/1/0/1.png"
+    mtimes = {p: p.stat().st_mtime_ns for p in tiles.rglob("*.png") if p != deleted}
+    deleted.unlink()
+    result = runner.invoke(app, args)
+    assert result.exit_code == 0, result.output
+    assert deleted.exists()
+    assert {p: p.stat().st_mtime_ns for p in mtimes} == mtimes
+
+
+def test_render_xyz_tiles(tmp_path):
+    temp = np.ones((1, 21, 31))
+    store = make_store(tmp_path, temp)
+    tiles = tmp_path / "tiles"
+
+    result = runner.invoke(
+        app,
+        [
+            "render-tiles",
+            str(store),
+            "--out",
+            str(tiles),
+            "--layout",
+            "xyz",
+            "--max-zoom",
+            "3",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    manifest = json.loads((tiles / TILES_MANIFEST).read_text())
+    assert manifest["variables"]["temperature"]["zooms"] == [0, 1, 2, 3]
+    # 100-130E, 10S-10N is within tile x=6, y=3/4 at zoom 3
+    tiles_zxy = {p.split("/", 2)[2] for p in manifest["hashes"]}
+    assert {p for p in tiles_zxy if p.startswith("3/")} == {"3/6/3.png", "3/6/4.png"}
+    world = decode_png((tiles / "temp/0/0/0/0.png").read_bytes())
+    opaque = np.nonzero(world[..., 3])
+    # the grid covers about 1/12 of the world's width around 115E
+    assert abs(opaque[1].mean() - (115 + 180) / 360 * 256) < 2
@@ -0,0 +1,184 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import zarr
+from typer.testing import CliRunner
+
+from vizima.server import ByteLRU
+from vizima.vertical import LEVELS, column_weights, interpolate, interpolate_dataset
+from vizima.vizimacli import VerticalCoordinate, app
+
+runner = CliRunner()
+
+NT, NZ, NY, NX = 2, 6, 3, 4
+DIMS = ("Time", "bottom_top", "south_north", "west_east")
+
+
+def make_wrf_dataset():
+    """WRF-like model levels whose pressure and height vary across columns."""
+    k = np.arange(NZ)[None, :, None, None]
+    column = np.linspace(0.0, 0.1, NY * NX).reshape(1, 1, NY, NX)
+    step = np.arange(NT)[:, None, None, None] * 0.01
+    pressure = 1000.0 * np.exp(-0.2 * k - column - step)  # hPa, 1000..~330
+    height = 800.0 * k + 1000.0 * column + 0.0 * step  # m
+    return xr.Dataset(
+        {
+            "P": (DIMS, 10.0 * pressure),
+            "PB": (DIMS, 90.0 * pressure),
+            "PH": (DIMS, 0.1 * 9.81 * height),
+            "PHB": (DIMS, 0.9 * 9.81 * height),
+            # linear in log-pressure and in height, so interpolation is exact
+            "T": (DIMS, 300.0 + 20.0 * np.log(pressure / 1000.0), {"units": "K"}),
+            "QVAPOR": (DIMS, 0.01 - height / 1e6, {"units": "kg kg-1"}),
+            "T2": (DIMS[:1] + DIMS[2:], np.full((NT, NY, NX), 290.0)),
+        },
+        coords={
+            "XTIME": (
+                "Time",
+                pd.date_range("2026-01-01", periods=NT, freq="h"),
+                {"standard_name": "time"},
+            ),
+            "XLONG": (DIMS[2:], np.tile(np.arange(NX, dtype=float), (NY, 1))),
+            "XLAT": (DIMS[2:], np.tile(np.arange(NY, dtype=float), (NX, 1)).T),
+            "ZNU": (DIMS[:2], np.tile(np.linspace(1, 0.1, NZ), (NT, 1))),
+        },
+    ).chunk({"Time": 1})
+
+
+def metadata():
+    def datavar(arr_name, level="ZNU"):
+        return {
+            "units": "1",
+            "long_name": arr_name,
+            "standard_name": arr_name,
+            "arrName": arr_name,
+            "lon": "XLONG",
+            "lat": "XLAT",
+            "level": level,
+            "time": "XTIME",
+        }
+
+    return {
+        "datavars": {
+            "temperature": datavar("T"),
+            "humidity": datavar("QVAPOR"),
+            "t2": datavar("T2", level=""),
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+
+
+def test_column_weights_match_np_interp():
+    rng = np.random.default_rng(0)
+    coord = np.cumsum(rng.random((5, NZ, 7)), axis=1)
+    targets = np.array([0.0, 1.0, 2.0, coord[:, -1].max() + 1])
+    values = rng.random(coord.shape)
+
+    weights = column_weights(coord, targets, axis=1)
+
+    assert weights.index.shape == (5, len(targets), 7)
+    for i in range(5):
+        for j in range(7):
+            expected = np.interp(
+                targets, coord[i, :, j], values[i, :, j], left=np.nan, right=np.nan
+            )
+            lower = values[i, weights.index[i, :, j], j]
+            upper = values[i, weights.index[i, :, j] + 1, j]
+            actual = lower + weights.weight[i, :, j] * (upper - lower)
+            np.testing.assert_allclose(actual, expected, rtol=1e-6)
+
+
+def test_interpolate_dataset_to_pressure_levels():
+    ds, meta = interpolate_dataset(
+        make_wrf_dataset(), metadata(), VerticalCoordinate.pressure, [500, 850, 300]
+    )
+
+    assert ds.T.dims == ("Time", "pressure", "south_north", "west_east")
+    assert ds.T.chunks is not None
+    np.testing.assert_array_equal(ds.pressure.values, [850.0, 500.0, 300.0])
+    assert ds.pressure.attrs["units"] == "hPa"
+    expected = 300.0 + 20.0 * np.log([0.85, 0.5])
+    np.testing.assert_allclose(
+        ds.T.values[:, :2],
+        np.broadcast_to(expected[:, None, None], (NT, 2, NY, NX)),
+        rtol=1e-5,
+    )
+    # below the model top
+    assert np.isnan(ds.T.values[:, 2]).all()
+    assert meta["datavars"]["temperature"]["level"] == "pressure"
+    assert meta["datavars"]["t2"]["level"] == ""
+    assert "ZNU" not in ds.coords
+
+
+def test_interpolate_dataset_to_height_levels():
+    ds, meta = interpolate_dataset(
+        make_wrf_dataset(), metadata(), VerticalCoordinate.height, [1000, 2500]
+    )
+    z = np.array([1000.0, 2500.0])[:, None, None]
+    np.testing.assert_allclose(
+        ds.QVAPOR.values, np.broadcast_to(0.01 - z / 1e6, (NT, 2, NY, NX)), rtol=1e-5
+    )
+    assert meta["datavars"]["humidity"]["level"] == "height"
+
+
+def test_weights_are_shared_by_variables():
+    ds = make_wrf_dataset()
+    for name in ("P", "PB", "T", "QVAPOR"):
+        ds[name].encoding["chunksizes"] = (1, NZ, NY, NX)
+    spec = LEVELS[VerticalCoordinate.pressure]
+    level = xr.DataArray([850.0, 500.0], dims="pressure", name="pressure")
+    coord = spec.increasing(spec.compute(ds))
+    targets = np.asarray(spec.increasing(level.values))
+    cache = ByteLRU(2**20)
+
+    t = interpolate(ds.T, coord, level, targets, cache)
+    q = interpolate(ds.QVAPOR, coord, level, targets, cache)
+    xr.Dataset({"T": t, "QVAPOR": q}).compute()
+
+    assert (cache.misses, cache.hits) == (NT, NT)
+    assert len(cache) == NT
+
+
+def test_interpolate_dataset_needs_the_coordinate():
+    ds = make_wrf_dataset().drop_vars("PB")
+    with pytest.raises(ValueError, match="PB"):
+        interpolate_dataset(ds, metadata(), VerticalCoordinate.pressure, [500])
+
+
+def test_process_dataset_writes_pressure_levels(tmp_path):
+    path = tmp_path / "wrfout.nc"
+    make_wrf_dataset().to_netcdf(path)
+    meta = tmp_path / "meta.json"
+    meta.write_text(json.dumps(metadata()))
+    out = tmp_path / "out.zarr"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(path),
+            "--metadata-file",
+            str(meta),
+            "--out",
+            str(out),
+            "--vertical",
+            "pressure",
+            "--vertical-level",
+            "850",
+            "--vertical-level",
+            "500",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    stored = zarr.open_group(str(out), mode="r")
+    assert stored["T"].shape == (NT, 2, NY, NX)
+    assert stored.attrs["levels"]["pressure"] == ["850.0 hPa", "500.0 hPa"]
+    assert stored.attrs["datavars"]["temperature"]["level"] == "pressure"
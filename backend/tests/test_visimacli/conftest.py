@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+
+@pytest.fixture
+def make_hourly_files(tmp_path):
+    """Write `nfiles` files of one hour each, like wrfout or hourly reanalysis dumps."""
+
+    def make(nfiles=3):
+        files = []
+        for i in range(nfiles):
+            ds = xr.Dataset(
+                {"temp": (("time", "lat", "lon"), np.full((1, 2, 3), float(i)))},
+                coords={
+                    "time": (
+                        "time",
+                        pd.date_range("2026-01-01", periods=1) + i * pd.Timedelta("1h"),
+                        {"standard_name": "time"},
+                    ),
+                    "lat": ("lat", [0.0, 1.0], {"units": "degrees_north"}),
+                    "lon": ("lon", [10.0, 11.0, 12.0], {"units": "degrees_east"}),
+                },
+            )
+            path = tmp_path / f"in_{i:02d}.nc"
+            ds.to_netcdf(path)
+            files.append(path)
+        return files
+
+    return make
@@ -47,3 +47,20 @@ def test_handle_levels_scalar_coordinate():
     results = handle_levels(ds)
 
     assert results == {}
+
+
+def test_handle_levels_time_varying():
+    # WRF-style (Time, bottom_top): the first step's levels
+    ds = xr.Dataset(
+        coords={
+            "ZNU": (
+                ("Time", "bottom_top"),
+                [[0.9, 0.5], [0.8, 0.4]],
+                {"standard_name": "atmosphere_sigma_coordinate", "positive": "down"},
+            )
+        },
+    )
+
+    results = handle_levels(ds)
+
+    assert results["ZNU"] == ["0.9", "0.5"]
@@ -5,7 +5,7 @@ import numpy as np
 import pytest
 import xarray as xr
 from vizima.dataset_model import LatAxis, LonAxis
-from vizima.vizimacli import handle_lonlats
+from vizima.vizimacli import handle_lonlats, regular_step
 
 # --- The Tests ---
 
@@ -73,12 +73,63 @@ def test_handle_lonlat_invalid_coord_name():
         handle_lonlats(ds, "altitude")  # type: ignore
 
 
-def test_handle_lonlat_invalid_ndim():
-    # Create 3D coordinates which should fail
-    vals = np.zeros((2, 2, 2))
+def test_handle_lonlat_time_varying_2d():
+    # WRF-style (Time, south_north, west_east): the first step's grid
+    vals = np.zeros((2, 3, 4))
+    vals[0] = np.arange(4.0)
+    vals[1] = np.arange(4.0) + 100
     ds = xr.Dataset(
-        coords={"lon_3d": (["x", "y", "z"], vals, {"standard_name": "longitude"})}
+        coords={
+            "XLONG": (
+                ["Time", "south_north", "west_east"],
+                vals,
+                {"standard_name": "longitude"},
+            )
+        }
     )
 
-    with pytest.raises(ValueError, match="Dimension of longitude should be 1 or 2"):
+    result = handle_lonlats(ds, "longitude")
+
+    assert result["XLONG"] == LonAxis(start=0.0, end=3.0, count=4)
+
+
+def test_handle_lonlat_reads_only_the_corners():
+    import dask.array as da
+
+    read = []
+
+    def block(block_info=None):
+        assert block_info is not None
+        (t0, _), (y0, y1), (x0, x1) = block_info[None]["array-location"]
+        read.append((t0, y0, x0))
+        y, x = np.mgrid[y0:y1, x0:x1]
+        return (x + 0.1 * y + t0).astype(float)[None]
+
+    lon = da.map_blocks(block, chunks=((1,) * 3, (10,) * 5, (10,) * 6), dtype=float)
+    ds = xr.Dataset(
+        coords={"XLONG": (["Time", "y", "x"], lon, {"standard_name": "longitude"})}
+    )
+
+    result = handle_lonlats(ds, "longitude")
+
+    assert result["XLONG"] == LonAxis(start=0.0, end=63.9, count=60)
+    # the corner blocks of the first step, out of 90
+    assert len(read) <= 4 and {step for step, _, _ in read} == {0}
+
+
+def test_regular_step():
+    assert regular_step(xr.DataArray(np.arange(0.0, 10.0, 0.25))) == 0.25
+    # float32 rounding is still regular
+    assert regular_step(xr.DataArray(np.linspace(0, 1, 1001, dtype="f4"))) == (
+        pytest.approx(0.001)
+    )
+    irregular = np.arange(100.0)
+    irregular[50] += 0.5
+    assert regular_step(xr.DataArray(irregular)) is None
+
+
+def test_handle_lonlat_invalid_ndim():
+    ds = xr.Dataset(coords={"lon": ((), 0.0, {"standard_name": "longitude"})})
+
+    with pytest.raises(ValueError, match="Dimension of longitude should be at least 1"):
         handle_lonlats(ds, "longitude")
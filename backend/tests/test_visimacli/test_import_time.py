@@ -0,0 +1,57 @@
+import subprocess
+import sys
+
+from typer.testing import CliRunner
+
+from vizima.vizimacli import app
+
+HEAVY_MODULES = {
+    "cf_xarray",
+    "dask",
+    "numpy",
+    "pandas",
+    "pydantic",
+    "questionary",
+    "xarray",
+    "zarr",
+}
+
+# Generous upper bound; the CLI module imports in well under 0.2 s without
+# the heavy dependencies, and several seconds with them.
+IMPORT_TIME_BUDGET_US = 1_000_000
+
+
+def importtime(module: str) -> dict[str, int]:
+    """Cumulative import time (us) per module, from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_skips_heavy_modules():
+    times = importtime("vizima.vizimacli")
+
+    assert HEAVY_MODULES.isdisjoint(name.split(".")[0] for name in times)
+
+
+def test_cli_import_time_budget():
+    times = importtime("vizima.vizimacli")
+
+    assert times["vizima.vizimacli"] < IMPORT_TIME_BUDGET_US
+
+
+def test_cli_help():
+    result = CliRunner().invoke(app, ["process-dataset", "--help"])
+
+    assert result.exit_code == 0
+    assert "--metadata-file" in result.output
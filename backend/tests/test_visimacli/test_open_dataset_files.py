@@ -0,0 +1,57 @@
+import pickle
+
+import numpy as np
+import pytest
+import typer
+
+from vizima import vizimacli
+from vizima.vizimacli import SOURCE_LOCK, expand_dataset_files, open_dataset_files
+
+
+def test_expand_dataset_files_glob(tmp_path, make_hourly_files):
+    files = make_hourly_files()
+    assert expand_dataset_files([str(tmp_path / "in_*.nc")]) == files
+
+
+def test_expand_dataset_files_list_and_duplicates(make_hourly_files):
+    files = make_hourly_files()
+    patterns = [str(files[1]), str(files[0]), str(files[1])]
+    assert expand_dataset_files(patterns) == [files[1], files[0]]
+
+
+def test_expand_dataset_files_no_match(tmp_path):
+    with pytest.raises(typer.BadParameter, match="No dataset file found"):
+        expand_dataset_files([str(tmp_path / "missing_*.nc")])
+
+
+def test_open_dataset_files_concatenates_time(make_hourly_files):
+    files = make_hourly_files()
+    ds = open_dataset_files(files)
+
+    assert ds.sizes["time"] == 3
+    assert ds.temp.chunks is not None  # lazy
+    assert ds.lat.dims == ("lat",)  # static coords are not concatenated
+    np.testing.assert_array_equal(ds.temp.isel(lat=0, lon=0).values, [0, 1, 2])
+
+
+def test_open_dataset_files_single_file_is_lazy(make_hourly_files):
+    files = make_hourly_files(nfiles=1)
+    ds = open_dataset_files(files)
+
+    assert ds.sizes["time"] == 1
+    assert ds.temp.chunks is not None
+
+
+def test_open_dataset_files_in_worker_processes(monkeypatch, make_hourly_files):
+    monkeypatch.setattr(vizimacli, "PARALLEL_OPEN_MIN_FILES", 2)
+    files = make_hourly_files(nfiles=4)
+    ds = open_dataset_files(files)
+
+    np.testing.assert_array_equal(ds.temp.isel(lat=0, lon=0).values, [0, 1, 2, 3])
+    ds.close()
+
+
+def test_source_lock_pickles_to_the_lock_of_the_process():
+    lock = pickle.loads(pickle.dumps(SOURCE_LOCK))
+    with lock, SOURCE_LOCK:
+        assert lock._lock is SOURCE_LOCK._lock
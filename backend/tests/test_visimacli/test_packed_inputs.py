@@ -0,0 +1,194 @@
+import json
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+from typer.testing import CliRunner
+
+from vizima.vizimacli import (
+    FILL_VALUE,
+    app,
+    decode_packed,
+    open_dataset_files,
+    pack_block,
+    packing_params_from_range,
+    remap_block,
+    source_packing,
+)
+
+runner = CliRunner()
+
+
+def make_packed_files(tmp_path, packings, fill_value=FILL_VALUE):
+    """One hourly file per packing, like ERA5 downloads, with a missing value."""
+    files = []
+    rng = np.random.default_rng(0)
+    for i, (scale_factor, add_offset) in enumerate(packings):
+        values = 250.0 + 50.0 * rng.random((1, 4, 5))
+        values[0, 0, 0] = np.nan
+        ds = xr.Dataset(
+            {"t2m": (("time", "lat", "lon"), values)},
+            coords={
+                "time": (
+                    "time",
+                    pd.date_range("2026-01-01", periods=1) + i * pd.Timedelta("1h"),
+                    {"standard_name": "time"},
+                ),
+                "lat": ("lat", np.arange(4.0), {"units": "degrees_north"}),
+                "lon": ("lon", np.arange(5.0), {"units": "degrees_east"}),
+            },
+        )
+        path = tmp_path / f"in_{i:02d}.nc"
+        ds.to_netcdf(
+            path,
+            encoding={
+                "t2m": {
+                    "dtype": "int16",
+                    "scale_factor": scale_factor,
+                    "add_offset": add_offset,
+                    "_FillValue": fill_value,
+                }
+            },
+        )
+        files.append(path)
+    return files
+
+
+def test_open_dataset_files_keeps_packed_integers(tmp_path):
+    files = make_packed_files(tmp_path, [(0.002, 275.0)] * 2)
+    ds = open_dataset_files(files)
+
+    assert ds.t2m.dtype == np.int16
+    assert source_packing(ds.t2m) == {
+        "scale_factor": 0.002,
+        "add_offset": 275.0,
+        "fill_values": [FILL_VALUE],
+    }
+    decoded = decode_packed(ds.t2m)
+    assert decoded.dtype == np.float32
+    assert "scale_factor" not in decoded.attrs
+    expected = xr.open_mfdataset(files, combine="nested", concat_dim="time").t2m
+    np.testing.assert_allclose(decoded.values, expected.values, rtol=1e-6)
+
+
+def test_open_dataset_files_decodes_mixed_packings(tmp_path):
+    files = make_packed_files(tmp_path, [(0.002, 275.0), (0.003, 270.0)])
+    ds = open_dataset_files(files)
+
+    assert ds.t2m.dtype == np.float32
+    assert source_packing(ds.t2m) is None
+    expected = xr.open_mfdataset(files, combine="nested", concat_dim="time").t2m
+    np.testing.assert_allclose(ds.t2m.values, expected.values, rtol=1e-6)
+
+
+def test_open_dataset_files_decodes_unsigned_integers(tmp_path):
+    ds = xr.Dataset(
+        {"t2m": (("time", "lat", "lon"), np.array([[[0.0, 50.0], [228.0, 253.0]]]))},
+        coords={
+            "time": ("time", pd.date_range("2026-01-01", periods=1)),
+            "lat": ("lat", [0.0, 1.0], {"units": "degrees_north"}),
+            "lon": ("lon", [0.0, 1.0], {"units": "degrees_east"}),
+        },
+    )
+    path = tmp_path / "in.nc"
+    encoding = {"dtype": "i1", "_Unsigned": "true", "scale_factor": 1.0}
+    ds.to_netcdf(path, encoding={"t2m": {**encoding, "_FillValue": -1}})
+
+    opened = open_dataset_files([path])
+    assert source_packing(opened.t2m) is None
+    np.testing.assert_array_equal(decode_packed(opened.t2m).values, ds.t2m.values)
+
+
+def test_remap_block_passes_matching_packing_through():
+    block = np.array([[FILL_VALUE, -32766, 0, 32766]], dtype=np.int16)
+    source = {"scale_factor": 0.5, "add_offset": 10.0, "fill_values": [FILL_VALUE]}
+    packing = {"scale_factor": 0.5, "add_offset": 10.0}
+
+    assert remap_block(block, source, packing) is block
+
+
+def test_remap_block_matches_float_repacking():
+    rng = np.random.default_rng(1)
+    block = rng.integers(-32766, 32767, (50, 60)).astype(np.int16)
+    block[0, :3] = -999
+    source = {"scale_factor": 0.002, "add_offset": 275.0, "fill_values": [-999]}
+    packing = packing_params_from_range(200.0, 350.0)
+
+    remapped = remap_block(block, source, packing)
+
+    values = block * 0.002 + 275.0
+    values[block == -999] = np.nan
+    expected = pack_block(values, **packing)
+    assert remapped.dtype == np.int16
+    np.testing.assert_array_equal(remapped[0, :3], FILL_VALUE)
+    assert np.abs(remapped.astype(int) - expected).max() <= 1
+
+
+def write_metadata(tmp_path):
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "2 metre temperature",
+                "standard_name": "air_temperature",
+                "arrName": "t2m",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    path = tmp_path / "meta.json"
+    path.write_text(json.dumps(metadata))
+    return path
+
+
+def process(tmp_path, files):
+    out = tmp_path / "out.zarr"
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            *map(str, files),
+            "--metadata-file",
+            str(write_metadata(tmp_path)),
+            "--out",
+            str(out),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    return out
+
+
+def test_process_dataset_writes_packed_integers_as_they_are(tmp_path):
+    files = make_packed_files(tmp_path, [(0.002, 275.0)] * 2)
+    out = process(tmp_path, files)
+
+    stored = zarr.open_group(str(out), mode="r")["t2m"]
+    assert stored.attrs["scale_factor"] == 0.002
+    assert stored.attrs["add_offset"] == 275.0
+    raw = xr.open_mfdataset(
+        files, combine="nested", concat_dim="time", mask_and_scale=False
+    ).t2m
+    np.testing.assert_array_equal(stored[...], raw.values)
+
+
+def test_process_dataset_remaps_other_fill_values(tmp_path):
+    files = make_packed_files(tmp_path, [(0.002, 275.0)], fill_value=-32768)
+    out = process(tmp_path, files)
+
+    stored = zarr.open_group(str(out), mode="r")["t2m"]
+    assert stored.dtype == np.int16
+    assert stored[0, 0, 0] == FILL_VALUE
+    values = stored[...] * stored.attrs["scale_factor"] + stored.attrs["add_offset"]
+    expected = xr.open_dataset(files[0]).t2m.values
+    np.testing.assert_allclose(
+        values[0, 1:], expected[0, 1:], atol=stored.attrs["scale_factor"]
+    )
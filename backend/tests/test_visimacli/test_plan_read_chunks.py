@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from vizima.vizimacli import get_native_chunks, plan_read_chunks, read_amplification
+
+
+def test_plan_read_chunks_multiple_of_native_and_output():
+    # native time chunk of 4 steps, one step per output chunk
+    assert plan_read_chunks((10, 90, 180), (4, 45, 90), (1, 90, 180)) == (4, 90, 180)
+
+
+def test_plan_read_chunks_capped_at_dim_size():
+    assert plan_read_chunks((10, 50, 60), (3, 50, 60), (4, 50, 60)) == (10, 50, 60)
+
+
+def test_plan_read_chunks_capped_in_bytes():
+    # 12 steps (lcm of 4 and 3) of 100x100 float32 would be 480 kB
+    shape, native, out = (24, 100, 100), (4, 100, 100), (3, 100, 100)
+    assert plan_read_chunks(shape, native, out, 4, 10**6) == (12, 100, 100)
+    assert plan_read_chunks(shape, native, out, 4, 250_000) == (6, 100, 100)
+    # never less than an output chunk
+    assert plan_read_chunks(shape, native, out, 4, 1) == (3, 100, 100)
+
+
+def test_read_amplification_aligned_is_one():
+    assert read_amplification((10, 90, 180), (4, 45, 90), (4, 90, 180)) == 1.0
+
+
+def test_read_amplification_misaligned_time():
+    # Each single-step read decompresses the full 4-step native chunk,
+    # except for the last chunk which only has 2 steps
+    amp = read_amplification((10,), (4,), (1,))
+    assert amp == pytest.approx((8 * 4 + 2 * 2) / 10)
+
+
+def test_get_native_chunks_from_netcdf(tmp_path):
+    ds = xr.Dataset({"temp": (("time", "lat", "lon"), np.zeros((6, 4, 8)))})
+    path = tmp_path / "chunked.nc"
+    ds.to_netcdf(path, encoding={"temp": {"chunksizes": (3, 2, 8), "zlib": True}})
+
+    with xr.open_dataset(path) as opened:
+        assert get_native_chunks(opened.temp) == (3, 2, 8)
+
+
+def test_get_native_chunks_contiguous(tmp_path):
+    ds = xr.Dataset({"temp": (("time", "lat", "lon"), np.zeros((50, 90, 180)))})
+    path = tmp_path / "contiguous.nc"
+    ds.to_netcdf(path)
+
+    with xr.open_dataset(path) as opened:
+        native = get_native_chunks(opened.temp)
+    # freely sliceable: read one output chunk at a time, without amplification
+    assert native == (1, 1, 1)
+    read = plan_read_chunks((50, 90, 180), native, (1, 90, 180))
+    assert read == (1, 90, 180)
+    assert read_amplification((50, 90, 180), native, read) == 1.0
@@ -0,0 +1,138 @@
+import json
+
+import numpy as np
+import xarray as xr
+from typer.testing import CliRunner
+
+from vizima.vizimacli import app
+
+runner = CliRunner()
+
+
+def make_metadata(tmp_path):
+    metadata = {
+        "datavars": {
+            "temperature": {
+                "units": "K",
+                "long_name": "Temperature",
+                "standard_name": "air_temperature",
+                "arrName": "temp",
+                "lon": "lon",
+                "lat": "lat",
+                "level": "",
+                "time": "time",
+            }
+        },
+        "vectors": {},
+        "projection": {"name": "LonLat"},
+        "title": "Test",
+        "subtitle": "",
+        "description": "",
+    }
+    path = tmp_path / "meta.json"
+    path.write_text(json.dumps(metadata))
+    return path
+
+
+def test_process_dataset_multi_file(tmp_path, make_hourly_files):
+    make_hourly_files()
+    meta = make_metadata(tmp_path)
+    out = tmp_path / "out.zarr"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in_*.nc"),
+            "--metadata-file",
+            str(meta),
+            "--out",
+            str(out),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    ds = xr.open_zarr(out)
+    assert ds.temp.encoding["chunks"] == (1, 2, 3)
+    assert ds.temp.encoding["dtype"] == np.int16
+    assert len(ds.attrs["times"]["time"]) == 3
+    np.testing.assert_allclose(ds.temp.isel(lat=0, lon=0).values, [0, 1, 2], atol=1e-3)
+
+
+def test_process_dataset_profile_report(tmp_path, make_hourly_files):
+    make_hourly_files()
+    meta = make_metadata(tmp_path)
+    report_path = tmp_path / "profile.json"
+
+    result = runner.invoke(
+        app,
+        [
+            "process-dataset",
+            str(tmp_path / "in_*.nc"),
+            "--metadata-file",
+            str(meta),
+            "--out",
+            str(tmp_path / "out.zarr"),
+            "--profile",
+            str(report_path),
+            "--profile-hook",
+            "tracemalloc",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    report = json.loads(report_path.read_text())
+    assert set(report["stages"]) >= {
+        "open",
+        "inspect",
+        "stats",
+        "pack",
+        "compress",
+        "write",
+        "store",
+    }
+    assert report["peak_rss_bytes"] > 0
+    assert report["input_file_bytes"] > 0
+
+    temperature = report["variables"]["temperature"]
+    assert temperature["chunks_written"] == 3
+    assert temperature["bytes_decoded"] == 3 * 2 * 3 * 8
+    assert temperature["bytes_written"] > 0
+    assert "tracemalloc" in report["hooks"]["store"]
+
+
+def test_process_dataset_incremental_rewrites_changed_slabs(
+    tmp_path, make_hourly_files
+):
+    files = make_hourly_files()
+    meta = make_metadata(tmp_path)
+    out = tmp_path / "out.zarr"
+    args = [
+        "process-dataset",
+        str(tmp_path / "in_*.nc"),
+        "--metadata-file",
+        str(meta),
+        "--out",
+        str(out),
+    ]
+
+    assert runner.invoke(app, args).exit_code == 0
+    mtimes = {p.name: p.stat().st_mtime_ns for p in (out / "temp").glob("*.*.*")}
+
+    # correct one hour, within the range of the original data
+    with xr.open_dataset(files[1]) as ds:
+        corrected = ds.load()
+    corrected["temp"][:] = 0.5
+    files[1].unlink()
+    corrected.to_netcdf(files[1])
+
+    result = runner.invoke(app, args)
+    assert result.exit_code == 0, result.output
+
+    new_mtimes = {p.name: p.stat().st_mtime_ns for p in (out / "temp").glob("*.*.*")}
+    assert [k for k in mtimes if mtimes[k] != new_mtimes[k]] == ["1.0.0"]
+
+    ds = xr.open_zarr(out)
+    np.testing.assert_allclose(
+        ds.temp.isel(lat=0, lon=0).values, [0, 0.5, 2], atol=1e-3
+    )
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import zarr
+
+from vizima import vizimacli
+from vizima.profiling import Profiler
+from vizima.vizimacli import REPACK_DIR, update_store, write_dataset
+
+METADATA = {
+    "datavars": {
+        "temperature": {
+            "units": "K",
+            "long_name": "Temperature",
+            "standard_name": "air_temperature",
+            "arrName": "temp",
+            "lon": "lon",
+            "lat": "lat",
+            "level": "",
+            "time": "time",
+        }
+    },
+    "vectors": {},
+    "projection": {"name": "LonLat"},
+    "title": "Test",
+    "subtitle": "",
+    "description": "",
+}
+
+
+def make_hours(start, values):
+    return xr.Dataset(
+        {
+            "temp": (
+                ("time", "lat", "lon"),
+                np.array(values, dtype="f8")[:, None, None] * np.ones((1, 2, 3)),
+            )
+        },
+        coords={
+            "time": (
+                "time",
+                pd.date_range("2026-01-01", periods=len(values), freq="h")
+                + pd.Timedelta(hours=start),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", [0.0, 1.0], {"units": "degrees_north"}),
+            "lon": ("lon", [10.0, 11.0, 12.0], {"units": "degrees_east"}),
+        },
+    ).chunk()
+
+
+def read_temp(out):
+    with xr.open_zarr(out) as ds:
+        return ds.temp.isel(lat=0, lon=0).values, ds.attrs["times"]["time"]
+
+
+def test_update_store_appends_new_times(tmp_path):
+    out = tmp_path / "out.zarr"
+    write_dataset(make_hours(0, [0, 1, 2]), METADATA, out, Profiler("test"))
+
+    update_store(make_hours(3, [1.5, 0.5]), METADATA, out, Profiler("test"))
+
+    values, times = read_temp(out)
+    np.testing.assert_allclose(values, [0, 1, 2, 1.5, 0.5], atol=1e-3)
+    assert times[-1] == "2026-01-01T04:00:00"
+
+
+def test_update_store_overwrites_existing_times(tmp_path):
+    out = tmp_path / "out.zarr"
+    write_dataset(make_hours(0, [0, 1, 2]), METADATA, out, Profiler("test"))
+
+    update_store(make_hours(1, [0.25]), METADATA, out, Profiler("test"))
+
+    values, times = read_temp(out)
+    np.testing.assert_allclose(values, [0, 0.25, 2], atol=1e-3)
+    assert len(times) == 3
+
+
+def test_update_store_widens_packing_range(tmp_path):
+    out = tmp_path / "out.zarr"
+    write_dataset(make_hours(0, [0, 1, 2]), METADATA, out, Profiler("test"))
+
+    update_store(make_hours(3, [10.0]), METADATA, out, Profiler("test"))
+
+    values, _ = read_temp(out)
+    np.testing.assert_allclose(values, [0, 1, 2, 10], atol=1e-3)
+
+
+def test_update_store_completes_an_interrupted_repack(tmp_path, monkeypatch):
+    out = tmp_path / "out.zarr"
+    write_dataset(make_hours(0, [0, 1, 2]), METADATA, out, Profiler("test"))
+    finish_repack = vizimacli.finish_repack
+
+    def crash_after_journal(*args):
+        monkeypatch.setattr(vizimacli, "finish_repack", finish_repack)
+        raise MemoryError
+
+    monkeypatch.setattr(vizimacli, "finish_repack", crash_after_journal)
+    with pytest.raises(MemoryError):
+        update_store(make_hours(3, [10.0]), METADATA, out, Profiler("test"))
+    # the stored values and their packing are still the old ones
+    assert (out / REPACK_DIR).exists()
+    values, _ = read_temp(out)
+    np.testing.assert_allclose(values[:3], [0, 1, 2], atol=1e-3)
+
+    update_store(make_hours(3, [10.0]), METADATA, out, Profiler("test"))
+
+    values, _ = read_temp(out)
+    np.testing.assert_allclose(values, [0, 1, 2, 10], atol=1e-3)
+    assert not (out / REPACK_DIR).exists()
+    assert "vizima.repack" not in str(zarr.open_consolidated(str(out)).tree())
+
+
+def test_update_store_rejects_times_before_end(tmp_path):
+    out = tmp_path / "out.zarr"
+    write_dataset(make_hours(2, [0, 1]), METADATA, out, Profiler("test"))
+
+    with pytest.raises(ValueError, match="must come after the last one"):
+        update_store(make_hours(0, [5]), METADATA, out, Profiler("test"))
+
+
+def test_update_store_without_store_writes_it(tmp_path):
+    out = tmp_path / "out.zarr"
+
+    update_store(make_hours(0, [0, 1]), METADATA, out, Profiler("test"))
+
+    values, _ = read_temp(out)
+    np.testing.assert_allclose(values, [0, 1], atol=1e-3)
@@ -0,0 +1,138 @@
+import json
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from vizima.watch import StatusFile, Watcher, load_routes, match_route
+
+METADATA = {
+    "datavars": {
+        "temperature": {
+            "units": "K",
+            "long_name": "Temperature",
+            "standard_name": "air_temperature",
+            "arrName": "temp",
+            "lon": "lon",
+            "lat": "lat",
+            "level": "",
+            "time": "time",
+        }
+    },
+    "vectors": {},
+    "projection": {"name": "LonLat"},
+    "title": "Test",
+    "subtitle": "",
+    "description": "",
+}
+
+
+def write_hour(path, hour, var="temp"):
+    ds = xr.Dataset(
+        {var: (("time", "lat", "lon"), np.full((1, 2, 3), float(hour)))},
+        coords={
+            "time": (
+                "time",
+                pd.DatetimeIndex(
+                    [pd.Timestamp("2026-01-01") + pd.Timedelta(hours=hour)]
+                ),
+                {"standard_name": "time"},
+            ),
+            "lat": ("lat", [0.0, 1.0], {"units": "degrees_north"}),
+            "lon": ("lon", [10.0, 11.0, 12.0], {"units": "degrees_east"}),
+        },
+    )
+    ds.to_netcdf(path)
+
+
+def make_watcher(tmp_path, **kwargs):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir(exist_ok=True)
+    meta = tmp_path / "era5.json"
+    meta.write_text(json.dumps(METADATA))
+    routes = load_routes([meta], tmp_path / "stores")
+    status = StatusFile(tmp_path / "status.json")
+    return inbox, Watcher(inbox, routes, status, pattern="*.nc", **kwargs)
+
+
+def test_match_route(tmp_path):
+    meta = tmp_path / "era5.json"
+    meta.write_text(json.dumps(METADATA))
+    routes = load_routes([meta], tmp_path)
+    write_hour(tmp_path / "a.nc", 0)
+    write_hour(tmp_path / "b.nc", 0, var="other")
+
+    route = match_route(tmp_path / "a.nc", routes)
+    assert route is not None and route.out == tmp_path / "era5.zarr"
+    assert match_route(tmp_path / "b.nc", routes) is None
+
+
+def test_watch_ingests_and_appends(tmp_path):
+    inbox, watcher = make_watcher(tmp_path)
+    for hour in range(2):
+        write_hour(inbox / f"hour_{hour:02d}.nc", hour)
+
+    watcher.run(once=True)
+    write_hour(inbox / "hour_02.nc", 2)
+    watcher.run(once=True)
+
+    with xr.open_zarr(tmp_path / "stores" / "era5.zarr") as ds:
+        np.testing.assert_allclose(
+            ds.temp.isel(lat=0, lon=0).values, [0, 1, 2], atol=1e-3
+        )
+
+    status = json.loads((tmp_path / "status.json").read_text())["files"]
+    assert {info["state"] for info in status.values()} == {"done"}
+    assert all(info["latency_s"] >= 0 for info in status.values())
+
+
+def test_watch_unmatched_and_failed(tmp_path):
+    inbox, watcher = make_watcher(tmp_path, retries=1, backoff=0)
+    write_hour(inbox / "other.nc", 0, var="other")
+    # a time step before the end of the store cannot be appended
+    write_hour(inbox / "hour_05.nc", 5)
+    watcher.run(once=True)
+    write_hour(inbox / "hour_03.nc", 3)
+    watcher.run(once=True)
+
+    status = watcher.status.files
+    assert status[str(inbox / "other.nc")]["state"] == "unmatched"
+    assert status[str(inbox / "hour_03.nc")]["state"] == "failed"
+    assert status[str(inbox / "hour_03.nc")]["attempts"] == 2
+
+
+def test_watch_archives_ingested_files(tmp_path):
+    inbox, watcher = make_watcher(tmp_path, archive_dir=tmp_path / "archive")
+    write_hour(inbox / "hour_00.nc", 0)
+
+    watcher.run(once=True)
+
+    assert not (inbox / "hour_00.nc").exists()
+    assert (tmp_path / "archive" / "hour_00.nc").exists()
+
+
+def test_watch_frees_the_route_when_archiving_fails(tmp_path, monkeypatch):
+    inbox, watcher = make_watcher(tmp_path, archive_dir=tmp_path / "archive")
+    write_hour(inbox / "hour_00.nc", 0)
+
+    def archive(files):
+        raise PermissionError(files[0])
+
+    monkeypatch.setattr(watcher, "archive", archive)
+    watcher.run(once=True)
+    monkeypatch.undo()
+    write_hour(inbox / "hour_01.nc", 1)
+    watcher.run(once=True)
+
+    assert not watcher._busy
+    assert watcher.status.files[str(inbox / "hour_01.nc")]["state"] == "done"
+    assert (tmp_path / "archive" / "hour_01.nc").exists()
+
+
+def test_watch_skips_unreadable_files(tmp_path):
+    inbox, watcher = make_watcher(tmp_path)
+    (inbox / "broken.nc").write_bytes(b"not netcdf")
+
+    watcher.run(once=True)
+
+    assert str(inbox / "broken.nc") not in watcher.status.files
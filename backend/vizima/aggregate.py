@@ -0,0 +1,129 @@
+import logging
+import typing as t
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+
+from .dataset_model import Dataset
+from .profiling import Profiler
+from .vizimacli import AggregateStat, ClimatologyPeriod, format_to_iso, pack_variable
+
+logger = logging.getLogger(__name__)
+
+
+def is_aggregate(var: xr.DataArray) -> bool:
+    return "time:" in var.attrs.get("cell_methods", "")
+
+
+def climatology_times(period: ClimatologyPeriod, groups: np.ndarray, year: int):
+    """Representative dates of the climatology `groups`, in the first `year`."""
+    start = pd.Timestamp(year=year, month=1, day=1)
+    if period == ClimatologyPeriod.month:
+        return pd.DatetimeIndex([start.replace(month=int(m)) for m in groups])
+    return start + pd.to_timedelta(groups - 1, unit="D")
+
+
+def aggregates(
+    var: xr.DataArray,
+    time_name: str,
+    freqs: list[str],
+    stats: list[AggregateStat],
+    climatologies: list[ClimatologyPeriod],
+) -> t.Iterator[tuple[str, str, xr.DataArray]]:
+    """(suffix, new time name, lazy aggregate) of `var` along `time_name`."""
+    for freq in freqs:
+        new_time = f"{time_name}_{freq}"
+        resampled = var.resample({time_name: freq})
+        for stat in stats:
+            agg = getattr(resampled, stat.value)()
+            yield f"{freq}_{stat.value}", new_time, agg.rename({time_name: new_time})
+
+    year = int(pd.Timestamp(var[time_name].values[0]).year)
+    for period in climatologies:
+        new_time = f"{time_name}_clim_{period.value}"
+        grouped = var.groupby(f"{time_name}.{period.value}")
+        for stat in stats:
+            agg = getattr(grouped, stat.value)()
+            agg = agg.rename({period.value: new_time})
+            agg = agg.assign_coords(
+                {new_time: climatology_times(period, agg[new_time].values, year)}
+            )
+            yield f"clim_{period.value}_{stat.value}", new_time, agg
+
+
+def aggregate_store(
+    out: Path,
+    freqs: list[str],
+    stats: list[AggregateStat],
+    climatologies: list[ClimatologyPeriod],
+    profiler: Profiler,
+) -> list[str]:
+    """
+    Add resampled and climatological aggregates of the variables in the
+    processed store at `out`, as sibling variables with their own time axis.
+
+    Aggregates are computed lazily from the stored chunks in one pass and
+    packed with the packing of their source variable (a mean, min or max
+    stays within its range). Running it again replaces them. Returns the
+    names of the new `DataVar` entries.
+    """
+    store = zarr.DirectoryStore(out)
+    ds = xr.open_zarr(store)
+    attrs = dict(ds.attrs)
+    datavars = dict(attrs["datavars"])
+    times = dict(attrs["times"])
+
+    new = xr.Dataset()
+    encoding: dict[str, dict] = {}
+    added = []
+    for name, dataarray in attrs["datavars"].items():
+        var = ds[dataarray["arrName"]]
+        if not dataarray["time"] or is_aggregate(var):
+            continue
+        packing = {k: var.encoding[k] for k in ("scale_factor", "add_offset")}
+        for suffix, new_time, agg in aggregates(
+            var, dataarray["time"], freqs, stats, climatologies
+        ):
+            arr_name = f"{dataarray['arrName']}_{suffix}"
+            agg = agg.chunk({new_time: 1})
+            agg.attrs = {
+                **var.attrs,
+                "cell_methods": f"{dataarray['time']}: {suffix.rsplit('_', 1)[1]}",
+            }
+            new[arr_name] = pack_variable(agg, packing, profiler, arr_name)
+            encoding[arr_name] = {
+                "chunks": tuple(1 if d == new_time else n for d, n in agg.sizes.items())
+            }
+            times[new_time] = [format_to_iso(v) for v in agg[new_time].values]
+            datavars[f"{name}_{suffix}"] = {
+                **dataarray,
+                "arrName": arr_name,
+                "long_name": f"{dataarray['long_name']} ({suffix.replace('_', ' ')})",
+                "time": new_time,
+            }
+            added.append(f"{name}_{suffix}")
+
+    if not added:
+        logger.info(f"No time-dependent variables to aggregate in {out}")
+        return added
+
+    # replace aggregates of a previous run; shared coordinates are kept as is
+    group = zarr.open_group(store, mode="r+")
+    new_times = {datavars[name]["time"] for name in added}
+    for name in [*new.data_vars, *new_times]:
+        if name in group:
+            del group[name]
+    new = new.drop_vars([c for c in new.coords if c not in new_times])
+
+    attrs.update(datavars=datavars, times=times)
+    attrs = Dataset(**attrs).model_dump()
+
+    with profiler.stage("store"):
+        new.to_zarr(store, mode="a", encoding=encoding, consolidated=False)
+    group.attrs.update(attrs)
+    zarr.consolidate_metadata(store)
+    logger.info(f"Added {len(added)} aggregate(s) to {out}")
+    return added
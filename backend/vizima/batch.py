@@ -0,0 +1,368 @@
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sqlite3
+import typing as t
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import dask
+from dask.utils import parse_bytes
+
+from .derive import derive_variables
+from .destagger import destagger_dataset
+from .manifest import hash_json
+from .profiling import Profiler
+from .vizimacli import (
+    data_ranges,
+    expand_dataset_files,
+    open_dataset_files,
+    update_store,
+    write_dataset,
+)
+from .watch import now_iso
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    spec TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    ntimes INTEGER,
+    inputs TEXT,
+    error TEXT,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    idx INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    finished_at TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+@dataclass(frozen=True)
+class BatchJob:
+    """Input file(s) or glob pattern(s), metadata file and output store of a job."""
+
+    inputs: tuple[str, ...]
+    metadata_file: str
+    out: str
+
+    @property
+    def key(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True)
+
+
+def load_jobs(path: Path) -> list[BatchJob]:
+    """
+    Jobs from a JSON list of {"input": ..., "metadata": ..., "out": ...}.
+
+    `input` is a path or glob pattern, or a list of them. Relative paths are
+    taken relative to the jobs file.
+    """
+    with open(path) as f:
+        specs = json.load(f)
+
+    def resolve(p: str) -> str:
+        return str(path.parent / p) if not os.path.isabs(p) else p
+
+    jobs = []
+    for spec in specs:
+        inputs = spec["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        jobs.append(
+            BatchJob(
+                tuple(resolve(p) for p in inputs),
+                resolve(spec["metadata"]),
+                resolve(spec["out"]),
+            )
+        )
+    return jobs
+
+
+def input_fingerprint(paths: list[Path]) -> str:
+    """Hash of the paths, sizes and modification times of the input files."""
+    stats = [(str(p), p.stat().st_size, p.stat().st_mtime_ns) for p in paths]
+    return hash_json(stats)
+
+
+def time_chunks(ntimes: int, size: int) -> list[tuple[int, int]]:
+    """[start, stop) time index ranges of `size` steps covering `ntimes` steps."""
+    return [(start, min(start + size, ntimes)) for start in range(0, ntimes, size)]
+
+
+class Ledger:
+    """
+    Progress of batch jobs and their time chunks in a SQLite database.
+
+    Every process opens its own connection; a chunk is marked done only after
+    it is written, so a killed run resumes at the first unfinished chunk.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add_jobs(self, jobs: list[BatchJob]) -> list[int]:
+        """Ids of `jobs`, adding the ones not in the ledger yet."""
+        ids = []
+        for job in jobs:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (key, spec) VALUES (?, ?)",
+                (job.key, job.key),
+            )
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE key = ?", (job.key,)
+            ).fetchone()
+            ids.append(row["id"])
+        return ids
+
+    def job(self, job_id: int) -> sqlite3.Row:
+        return self.conn.execute(
+            "SELECT * FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+
+    def update_job(self, job_id: int, **fields: t.Any):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self.conn.execute(
+            f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+    def chunks(self, job_id: int) -> list[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM chunks WHERE job_id = ? ORDER BY idx", (job_id,)
+        ).fetchall()
+
+    def set_chunks(
+        self, job_id: int, ntimes: int, inputs: str, bounds: list[tuple[int, int]]
+    ):
+        """Replace the chunks of a job, e.g. when its input changed."""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+            self.conn.executemany(
+                "INSERT INTO chunks (job_id, idx, start, stop) VALUES (?, ?, ?, ?)",
+                [(job_id, i, start, stop) for i, (start, stop) in enumerate(bounds)],
+            )
+            self.conn.execute(
+                "UPDATE jobs SET ntimes = ?, inputs = ? WHERE id = ?",
+                (ntimes, inputs, job_id),
+            )
+
+    def chunk_done(self, job_id: int, idx: int):
+        self.conn.execute(
+            "UPDATE chunks SET state = 'done', finished_at = ? "
+            "WHERE job_id = ? AND idx = ?",
+            (now_iso(), job_id, idx),
+        )
+
+    def summary(self) -> dict[str, int]:
+        rows = self.conn.execute(
+            "SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"
+        ).fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+
+def limit_memory(memory_limit: int | None):
+    """Limit the address space of this process, so a job fails with MemoryError."""
+    if memory_limit is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+
+def run_job(
+    ledger_path: Path,
+    job_id: int,
+    chunk_size: int,
+    memory_limit: int | None = None,
+    threads: int | None = None,
+) -> str:
+    """
+    Process one job from the ledger, chunk by chunk, in a worker process,
+    skipping the chunks already done. Returns the final state of the job.
+    """
+    limit_memory(memory_limit)
+    ledger = Ledger(ledger_path)
+    try:
+        row = ledger.job(job_id)
+        spec = json.loads(row["spec"])
+        job = BatchJob(tuple(spec["inputs"]), spec["metadata_file"], spec["out"])
+        ledger.update_job(
+            job_id,
+            state="running",
+            attempts=row["attempts"] + 1,
+            started_at=now_iso(),
+            error=None,
+        )
+        try:
+            with dask.config.set(num_workers=threads):
+                run_chunks(ledger, job_id, job, chunk_size)
+        except Exception as e:
+            logger.exception(f"Job {job_id} ({job.out}) failed")
+            ledger.update_job(
+                job_id, state="failed", error=repr(e), finished_at=now_iso()
+            )
+            return "failed"
+        ledger.update_job(job_id, state="done", finished_at=now_iso())
+        return "done"
+    finally:
+        ledger.close()
+
+
+def run_chunks(ledger: Ledger, job_id: int, job: BatchJob, chunk_size: int):
+    """
+    Write the unfinished chunks of `job`. The first one (re)creates the store,
+    packed for the range of the whole job; later ones are appended.
+    """
+    files = expand_dataset_files(list(job.inputs))
+    with open(job.metadata_file) as f:
+        metadata = json.load(f)
+    ds, metadata = destagger_dataset(open_dataset_files(files), metadata)
+    ds = derive_variables(ds, metadata)
+    out = Path(job.out)
+
+    time_names = {dv["time"] for dv in metadata["datavars"].values()} - {""}
+    time_dims = {ds[name].dims[0] for name in time_names}
+    if len(time_dims) > 1:
+        raise ValueError(f"Variables of {job.out} use several time dimensions")
+    time_dim = time_dims.pop() if time_dims else None
+    ntimes = ds.sizes[time_dim] if time_dim else 1
+
+    # chunks done on other input files (or metadata) are written again
+    inputs = input_fingerprint([*files, Path(job.metadata_file)])
+    chunks = ledger.chunks(job_id)
+    row = ledger.job(job_id)
+    if not chunks or (row["ntimes"], row["inputs"]) != (ntimes, inputs):
+        if chunks:
+            logger.warning(f"Input of {job.out} changed, restarting the job")
+        ledger.set_chunks(
+            job_id,
+            ntimes,
+            inputs,
+            time_chunks(ntimes, chunk_size if time_dim else 1),
+        )
+        chunks = ledger.chunks(job_id)
+
+    for chunk in chunks:
+        if chunk["state"] == "done":
+            continue
+        profiler = Profiler("process_batch")
+        if time_dim is None:
+            write_dataset(ds, metadata, out, profiler, incremental=False)
+        else:
+            part = ds.isel({time_dim: slice(chunk["start"], chunk["stop"])})
+            if chunk["idx"] == 0:
+                # packed for the whole job, so that appending the later
+                # chunks never widens the range and re-packs the store
+                ranges = data_ranges(ds, metadata)
+                write_dataset(
+                    part, metadata, out, profiler, incremental=False, ranges=ranges
+                )
+            else:
+                update_store(part, metadata, out, profiler)
+        ledger.chunk_done(job_id, chunk["idx"])
+        logger.info(
+            f"{job.out}: chunk {chunk['idx'] + 1}/{len(chunks)} "
+            f"(time steps {chunk['start']}-{chunk['stop']}) done"
+        )
+    ds.close()
+
+
+def run_pool(
+    ledger: Ledger,
+    job_ids: list[int],
+    workers: int,
+    args: tuple[t.Any, ...],
+) -> dict[int, BrokenProcessPool]:
+    """
+    Run `job_ids` with `run_job(ledger_path, job_id, *args)` on a pool of
+    worker processes. Returns the jobs left unfinished by a worker that died.
+    """
+    for job_id in job_ids:
+        ledger.update_job(job_id, state="pending")
+    # spawn: forking a process that runs dask/HDF5 threads is unsafe
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = {
+            pool.submit(run_job, ledger.path, job_id, *args): job_id
+            for job_id in job_ids
+        }
+        broken = {}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except BrokenProcessPool as e:
+                broken[futures[future]] = e
+    return dict(sorted(broken.items()))
+
+
+def run_batch(
+    jobs: list[BatchJob],
+    ledger_path: Path,
+    workers: int = 2,
+    chunk_size: int = 24,
+    memory_limit: str | None = None,
+) -> dict[str, int]:
+    """
+    Run the jobs not done yet in the ledger on a pool of worker processes.
+
+    Each process gets an equal share of the CPUs for its dask threads and,
+    optionally, a memory limit such as "4GB". Returns the job counts per state.
+    """
+    ledger = Ledger(ledger_path)
+    try:
+        job_ids = [
+            job_id
+            for job_id in ledger.add_jobs(jobs)
+            if ledger.job(job_id)["state"] != "done"
+        ]
+        logger.info(
+            f"{len(jobs) - len(job_ids)} of {len(jobs)} job(s) already done, "
+            f"running {len(job_ids)}"
+        )
+
+        limit = parse_bytes(memory_limit) if memory_limit else None
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        args = (chunk_size, limit, threads)
+        while job_ids:
+            # a dying worker (e.g. killed for using too much memory) breaks
+            # the whole pool: the jobs that were running are run again one
+            # at a time to find it, the others are queued again
+            broken = run_pool(ledger, job_ids, workers, args)
+            running = [
+                i for i in broken if ledger.job(i)["state"] == "running"
+            ] or list(broken)
+            for job_id in running:
+                for e in run_pool(ledger, [job_id], 1, args).values():
+                    logger.error(f"Worker of job {job_id} died: {e!r}")
+                    ledger.update_job(
+                        job_id, state="failed", error=repr(e), finished_at=now_iso()
+                    )
+            job_ids = [i for i in broken if i not in running]
+        return ledger.summary()
+    finally:
+        ledger.close()
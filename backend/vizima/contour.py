@@ -0,0 +1,287 @@
+import logging
+import math
+import typing as t
+from collections import defaultdict
+from pathlib import Path
+
+import dask
+import numpy as np
+import xarray as xr
+import zarr
+
+from .vizimacli import FILL_VALUE, range_from_packing_params
+
+logger = logging.getLogger(__name__)
+
+CONTOURS_GROUP = "contours"
+QUANT_MAX = np.iinfo(np.uint16).max
+FLAT_CHUNK = 65536
+
+# Edge pairs crossed by the contour in each marching squares case. Corners
+# are numbered 1 (row i, col j), 2 (i, j+1), 4 (i+1, j+1), 8 (i+1, j); edges
+# are bottom (row i), right (col j+1), top (row i+1) and left (col j).
+# Saddles (5, 10) keep the corners above the level apart.
+SEGMENTS: dict[int, list[tuple[str, str]]] = {
+    1: [("l", "b")],
+    2: [("b", "r")],
+    3: [("l", "r")],
+    4: [("r", "t")],
+    5: [("l", "b"), ("r", "t")],
+    6: [("b", "t")],
+    7: [("l", "t")],
+    8: [("t", "l")],
+    9: [("b", "t")],
+    10: [("b", "r"), ("t", "l")],
+    11: [("r", "t")],
+    12: [("l", "r")],
+    13: [("b", "r")],
+    14: [("l", "b")],
+}
+
+
+def nice_levels(vmin: float, vmax: float, n: int = 10) -> list[float]:
+    """About `n` contour levels at a round interval within [vmin, vmax]."""
+    if not vmax > vmin:
+        return []
+    raw = (vmax - vmin) / n
+    magnitude = 10 ** math.floor(math.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw)
+    start = math.ceil(vmin / step) * step
+    values = np.arange(start, vmax + step / 2, step)
+    return [round(float(v), 10) for v in values if v <= vmax]
+
+
+def marching_squares(
+    field: np.ndarray, level: float, valid: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, dict[int, tuple[float, float]]]:
+    """
+    Contour segments of `field` at `level`, over all cells at once.
+
+    Returns the two edge ids of every segment and the (x, y) grid position
+    of the contour on each crossed edge. Cells with an invalid corner are
+    skipped.
+    """
+    ny, nx = field.shape
+    above = field > level
+    case = (
+        above[:-1, :-1] * 1
+        + above[:-1, 1:] * 2
+        + above[1:, 1:] * 4
+        + above[1:, :-1] * 8
+    )
+    ok = valid[:-1, :-1] & valid[:-1, 1:] & valid[1:, 1:] & valid[1:, :-1]
+    ci, cj = np.nonzero(ok & (case != 0) & (case != 15))
+    cases = case[ci, cj]
+
+    # horizontal edges (i, j)-(i, j+1) first, then vertical (i, j)-(i+1, j)
+    nh = ny * (nx - 1)
+    edges = {
+        "b": ci * (nx - 1) + cj,
+        "t": (ci + 1) * (nx - 1) + cj,
+        "l": nh + ci * nx + cj,
+        "r": nh + ci * nx + cj + 1,
+    }
+    first, second = [], []
+    for k, pairs in SEGMENTS.items():
+        mask = cases == k
+        for e1, e2 in pairs:
+            first.append(edges[e1][mask])
+            second.append(edges[e2][mask])
+    e1, e2 = np.concatenate(first), np.concatenate(second)
+
+    ids = np.unique(np.concatenate([e1, e2]))
+    horizontal = ids < nh
+    i = np.where(horizontal, ids // (nx - 1), (ids - nh) // nx)
+    j = np.where(horizontal, ids % (nx - 1), (ids - nh) % nx)
+    f0 = field[i, j]
+    f1 = np.where(
+        horizontal,
+        field[i, np.minimum(j + 1, nx - 1)],
+        field[np.minimum(i + 1, ny - 1), j],
+    )
+    frac = (level - f0) / (f1 - f0)
+    x = np.where(horizontal, j + frac, j)
+    y = np.where(horizontal, i, i + frac)
+    return e1, e2, dict(zip(ids.tolist(), zip(x.tolist(), y.tolist())))
+
+
+def link_segments(e1: np.ndarray, e2: np.ndarray) -> list[list[int]]:
+    """
+    Join segments sharing an edge into polylines of edge ids.
+
+    An edge is crossed by at most two segments, so the segments form open
+    lines (ending at the grid boundary or missing values) and closed rings;
+    rings repeat their first edge at the end.
+    """
+    neighbours: dict[int, list[int]] = defaultdict(list)
+    for a, b in zip(e1.tolist(), e2.tolist()):
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    visited: set[int] = set()
+
+    def walk(start: int) -> list[int]:
+        line = [start]
+        visited.add(start)
+        current = start
+        while True:
+            following = [n for n in neighbours[current] if n not in visited]
+            if not following:
+                return line
+            current = following[0]
+            visited.add(current)
+            line.append(current)
+
+    lines = []
+    for edge, nbrs in neighbours.items():
+        if len(nbrs) == 1 and edge not in visited:
+            lines.append(walk(edge))
+    for edge in neighbours:
+        if edge not in visited:
+            ring = walk(edge)
+            lines.append(ring + ring[:1])
+    return lines
+
+
+def contour_slab(
+    packed: np.ndarray, levels: list[float]
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Quantized polylines of one packed 2-D field at each (packed) level.
+
+    Per level, returns the point count of every polyline and their points
+    as (x, y) uint16 pairs, scaled so that the grid spans 0..65535.
+    """
+    field = packed.astype(np.float32)
+    valid = packed != FILL_VALUE
+    ny, nx = field.shape
+    scale = np.array([QUANT_MAX / max(nx - 1, 1), QUANT_MAX / max(ny - 1, 1)])
+
+    out = []
+    for level in levels:
+        e1, e2, positions = marching_squares(field, level, valid)
+        lines = link_segments(e1, e2)
+        counts = np.array([len(line) for line in lines], dtype=np.int64)
+        if lines:
+            xy = np.array([positions[e] for line in lines for e in line])
+            points = np.round(xy * scale).astype(np.uint16)
+        else:
+            points = np.empty((0, 2), dtype=np.uint16)
+        out.append((counts, points))
+    return out
+
+
+def contour_variable(
+    group: zarr.Group,
+    var: xr.DataArray,
+    levels: list[float],
+    batch: int = 32,
+):
+    """
+    Contour every time step/level of the packed `var` into `group`.
+
+    Arrays written:
+    - `levels`: contour values.
+    - `index`: [first line, line count] per (leading indices..., level).
+    - `lines`: [first point, point count] per polyline.
+    - `points`: quantized (x, y) grid positions.
+    The lines of one time step/level, and their points, are contiguous, so a
+    client reads one `index` entry and two ranges to draw them.
+    """
+    scale, offset = var.attrs["scale_factor"], var.attrs["add_offset"]
+    packed_levels = [(level - offset) / scale for level in levels]
+    lead_shape = var.shape[:-2]
+
+    group.array("levels", np.asarray(levels, dtype=np.float64), overwrite=True)
+    index = group.zeros(
+        "index",
+        shape=lead_shape + (len(levels), 2),
+        chunks=(1,) * len(lead_shape) + (len(levels), 2),
+        dtype=np.int64,
+        overwrite=True,
+    )
+    lines = group.zeros(
+        "lines", shape=(0, 2), chunks=(FLAT_CHUNK, 2), dtype=np.int64, overwrite=True
+    )
+    points = group.zeros(
+        "points", shape=(0, 2), chunks=(FLAT_CHUNK, 2), dtype=np.uint16, overwrite=True
+    )
+
+    slabs = list(np.ndindex(*lead_shape))
+    nlines = npoints = 0
+    for start in range(0, len(slabs), batch):
+        part = slabs[start : start + batch]
+        results = dask.compute(
+            *(
+                dask.delayed(contour_slab)(var.data[slab], packed_levels)
+                for slab in part
+            )
+        )
+        slab_index = []
+        for slab, per_level in zip(part, results):
+            entries = []
+            for counts, pts in per_level:
+                entries.append((nlines, len(counts)))
+                if len(counts):
+                    firsts = npoints + np.concatenate([[0], np.cumsum(counts)[:-1]])
+                    lines.append(np.column_stack([firsts, counts]))
+                    points.append(pts)
+                nlines += len(counts)
+                npoints += len(pts)
+            slab_index.append((slab, entries))
+        for slab, entries in slab_index:
+            index[slab] = np.array(entries, dtype=np.int64).reshape(len(levels), 2)
+    logger.info(
+        f"{var.name}: {nlines} contour line(s), {npoints} point(s) "
+        f"at {len(levels)} level(s)"
+    )
+
+
+def contour_store(
+    out: Path,
+    names: list[str],
+    levels: list[float],
+    nlevels: int = 10,
+) -> dict[str, list[float]]:
+    """
+    Precompute contour lines of the `names` datavars (all if empty) of the
+    processed store at `out`, into its `contours` group.
+
+    With no `levels`, about `nlevels` round levels over each variable's
+    packing range are used. The levels, grid shape and quantization of each
+    variable are recorded in the group attributes.
+    """
+    store = zarr.DirectoryStore(out)
+    ds = xr.open_zarr(store, mask_and_scale=False)
+    datavars = ds.attrs["datavars"]
+    unknown = set(names) - set(datavars)
+    if unknown:
+        raise ValueError(f"Unknown variable(s) {sorted(unknown)} in {out}")
+
+    root = zarr.open_group(store, mode="r+")
+    contours = root.require_group(CONTOURS_GROUP)
+    info: dict[str, t.Any] = dict(contours.attrs)
+    used = {}
+    for name in names or list(datavars):
+        dataarray = datavars[name]
+        var = ds[dataarray["arrName"]]
+        var_levels = levels or nice_levels(*packing_range(var), nlevels)
+        contour_variable(contours.require_group(dataarray["arrName"]), var, var_levels)
+        ny, nx = var.shape[-2:]
+        info[name] = {
+            "arrName": dataarray["arrName"],
+            "levels": var_levels,
+            "dims": list(var.dims[:-2]),
+            "shape": [ny, nx],
+            "xScale": max(nx - 1, 1) / QUANT_MAX,
+            "yScale": max(ny - 1, 1) / QUANT_MAX,
+        }
+        used[name] = var_levels
+    contours.attrs.put(info)
+    zarr.consolidate_metadata(store)
+    return used
+
+
+def packing_range(var: xr.DataArray) -> tuple[float, float]:
+    """Data range the packing of `var` was made for (see packing_params_from_range)."""
+    return range_from_packing_params(var.attrs["scale_factor"], var.attrs["add_offset"])
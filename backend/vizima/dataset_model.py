@@ -1,8 +1,9 @@
 # generated by datamodel-codegen:
 #   filename:  dataset-schema.json
-#   timestamp: 2026-01-27T06:47:04+00:00
+#   timestamp: 2026-10-19T14:36:31+00:00
 
 from typing import Annotated, Literal
+
 from pydantic import BaseModel, ConfigDict, Field
 
 
@@ -40,6 +41,7 @@ class DataVar(BaseModel):
     lat: str
     level: str
     time: str
+    expression: str | None = None
 
 
 class VectorVar(BaseModel):
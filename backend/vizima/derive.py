@@ -0,0 +1,150 @@
+"""
+Derived variables: datavars computed from an `expression` over the input
+variables, e.g. `sqrt(u10**2 + v10**2)`, `t2m - 273.15` or
+`tp * 1000 * 24`.
+
+Expressions are arithmetic over variable names and numbers, with the
+functions in `FUNCTIONS`. They are evaluated on the lazy (dask) input
+arrays, so a derived variable is computed slab by slab, vectorized, as it
+is packed and written, in the same pass that reads its inputs.
+"""
+
+import ast
+import logging
+import math
+import operator
+import typing as t
+
+import numpy as np
+import xarray as xr
+
+from .vizimacli import decode_packed, get_native_chunks
+
+logger = logging.getLogger(__name__)
+
+OPERATORS: dict[type, t.Callable[..., t.Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+FUNCTIONS: dict[str, t.Callable[..., t.Any]] = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "arctan2": np.arctan2,
+    "hypot": np.hypot,
+    "minimum": np.minimum,
+    "maximum": np.maximum,
+    "clip": lambda x, lo, hi: x.clip(lo, hi),
+    "where": xr.where,
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+
+def parse(expression: str) -> ast.Expression:
+    try:
+        return ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression `{expression}`: {e.msg}")
+
+
+def expression_names(expression: str) -> set[str]:
+    """Names of the input variables `expression` refers to."""
+    return {
+        node.id
+        for node in ast.walk(parse(expression))
+        if isinstance(node, ast.Name)
+        and node.id not in FUNCTIONS
+        and node.id not in CONSTANTS
+    }
+
+
+def evaluate(expression: str, variables: t.Mapping[str, t.Any]) -> t.Any:
+    """
+    Evaluate `expression` over `variables`, allowing only arithmetic,
+    comparisons and the functions in `FUNCTIONS`.
+    """
+
+    def visit(node: ast.AST) -> t.Any:
+        match node:
+            case ast.Expression(body=body):
+                return visit(body)
+            case ast.Constant(value=value) if isinstance(value, (int, float)):
+                return value
+            case ast.Name(id=name) if name in CONSTANTS:
+                return CONSTANTS[name]
+            case ast.Name(id=name) if name in variables:
+                return variables[name]
+            case ast.Name(id=name):
+                raise ValueError(f"Unknown variable `{name}` in `{expression}`")
+            case ast.BinOp(left=left, op=op, right=right) if type(op) in OPERATORS:
+                return OPERATORS[type(op)](visit(left), visit(right))
+            case ast.UnaryOp(op=op, operand=operand) if type(op) in OPERATORS:
+                return OPERATORS[type(op)](visit(operand))
+            case ast.Compare(left=left, ops=[op], comparators=[right]) if (
+                type(op) in OPERATORS
+            ):
+                return OPERATORS[type(op)](visit(left), visit(right))
+            case ast.Call(func=ast.Name(id=name), args=args, keywords=[]) if (
+                name in FUNCTIONS
+            ):
+                return FUNCTIONS[name](*(visit(a) for a in args))
+        raise ValueError(f"Unsupported syntax `{ast.unparse(node)}` in `{expression}`")
+
+    return visit(parse(expression))
+
+
+def derive_variables(ds: xr.Dataset, metadata: dict[str, t.Any]) -> xr.Dataset:
+    """
+    Add the datavars of `metadata` with an `expression` to `ds`, as `arrName`,
+    lazily. Their native chunks are those of their inputs, so that reads
+    stay aligned with the source chunks.
+    """
+    derived = {}
+    for name, dataarray in metadata["datavars"].items():
+        expression = dataarray.get("expression")
+        if not expression:
+            continue
+        inputs = {
+            v: decode_packed(ds[v]) for v in expression_names(expression) if v in ds
+        }
+        result = evaluate(expression, inputs)
+        if not isinstance(result, xr.DataArray):
+            raise TypeError(f"Expression of {name} does not use any variable")
+
+        chunks = {d: 1 for d in result.dims}
+        for var in inputs.values():
+            for dim, native in zip(var.dims, get_native_chunks(var)):
+                if dim in chunks:
+                    chunks[dim] = math.lcm(chunks[dim], native)
+        result = result.rename(dataarray["arrName"])
+        result.attrs = {
+            "units": dataarray["units"],
+            "long_name": dataarray["long_name"],
+            "standard_name": dataarray["standard_name"],
+        }
+        result.encoding = {
+            "chunksizes": tuple(min(chunks[d], result.sizes[d]) for d in result.dims)
+        }
+        derived[dataarray["arrName"]] = result
+        logger.info(f"{name}: derived as `{expression}`")
+    return ds.assign(derived)
@@ -0,0 +1,159 @@
+"""
+WRF staggered grids.
+
+WRF writes U, V and W on grids staggered by half a cell (the `*_stag`
+dimensions), with their own XLONG_U/XLAT_U and XLONG_V/XLAT_V coordinates,
+so they do not line up with the mass-grid variables nor with each other.
+Staggered variables are destaggered onto the mass grid by averaging each
+pair of adjacent points, lazily, on the source slabs, and the wind vectors
+can be rotated from grid-relative to earth-relative with the COSALPHA and
+SINALPHA of the domain.
+"""
+
+import logging
+import typing as t
+
+import numpy as np
+import xarray as xr
+
+from .vizimacli import (
+    decode_packed,
+    get_lat_name_for_var,
+    get_lon_name_for_var,
+    get_native_chunks,
+)
+
+logger = logging.getLogger(__name__)
+
+# staggered dimension -> mass-grid dimension
+STAGGERED_DIMS = {
+    "west_east_stag": "west_east",
+    "south_north_stag": "south_north",
+    "bottom_top_stag": "bottom_top",
+}
+
+
+def is_staggered(var: xr.DataArray) -> bool:
+    return bool(set(var.dims) & STAGGERED_DIMS.keys())
+
+
+def destagger(var: xr.DataArray, ds: xr.Dataset) -> xr.DataArray:
+    """
+    `var` averaged onto the mass grid along its staggered dimensions, with
+    the mass-grid coordinates of `ds`.
+    """
+    var = decode_packed(var)
+    native = dict(zip(var.dims, get_native_chunks(var)))
+    staggered = [d for d in var.dims if d in STAGGERED_DIMS]
+    result = var.drop_vars([c for c in var.coords if set(var[c].dims) & set(staggered)])
+    for dim in staggered:
+        result = 0.5 * (
+            result.isel({dim: slice(None, -1)}) + result.isel({dim: slice(1, None)})
+        )
+        result = result.rename({dim: STAGGERED_DIMS[dim]})
+        native[STAGGERED_DIMS[dim]] = native.pop(dim)
+
+    result = result.assign_coords(
+        {
+            name: coord
+            for name, coord in ds.coords.items()
+            if name not in result.coords
+            and coord.dims
+            and set(coord.dims) <= set(result.dims)
+        }
+    )
+    result.name = var.name
+    result.attrs = {**var.attrs, "stagger": ""}
+    result.encoding = {
+        "chunksizes": tuple(
+            min(native[d], n) for d, n in zip(result.dims, result.shape)
+        )
+    }
+    return result
+
+
+def earth_relative(
+    u: xr.DataArray, v: xr.DataArray, cosalpha: xr.DataArray, sinalpha: xr.DataArray
+) -> tuple[xr.DataArray, xr.DataArray]:
+    """Grid-relative wind components `u`, `v` rotated to earth-relative."""
+    rotated = (u * cosalpha - v * sinalpha, v * cosalpha + u * sinalpha)
+    out = []
+    for component, source in zip(rotated, (u, v)):
+        component = component.transpose(*source.dims)
+        component.name = source.name
+        component.attrs = source.attrs
+        component.encoding = {
+            k: value for k, value in source.encoding.items() if k == "chunksizes"
+        }
+        out.append(component)
+    return out[0], out[1]
+
+
+@t.overload
+def destagger_dataset(
+    ds: xr.Dataset, metadata: dict[str, t.Any], rotate: bool = False
+) -> tuple[xr.Dataset, dict[str, t.Any]]: ...
+
+
+@t.overload
+def destagger_dataset(
+    ds: xr.Dataset, metadata: None = None, rotate: bool = False
+) -> tuple[xr.Dataset, None]: ...
+
+
+def destagger_dataset(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any] | None = None,
+    rotate: bool = False,
+) -> tuple[xr.Dataset, dict[str, t.Any] | None]:
+    """
+    Destagger the staggered variables of `ds` onto the mass grid and point
+    the datavars of `metadata` at the mass-grid coordinates. With `rotate`,
+    the vectors of `metadata` are made earth-relative.
+    """
+    staggered = [
+        str(name)
+        for name, var in ds.data_vars.items()
+        if is_staggered(var) and np.issubdtype(var.dtype, np.number)
+    ]
+    if staggered:
+        logger.info(f"Destaggering {', '.join(staggered)} onto the mass grid")
+        ds = ds.assign({name: destagger(ds[name], ds) for name in staggered})
+        ds = ds.drop_vars(
+            [c for c in ds.coords if set(ds[c].dims) & STAGGERED_DIMS.keys()]
+        )
+
+    if metadata is None:
+        return ds, metadata
+
+    datavars = {}
+    for name, dataarray in metadata["datavars"].items():
+        if dataarray["arrName"] in staggered:
+            var = ds[dataarray["arrName"]]
+            dataarray = {
+                **dataarray,
+                "lon": get_lon_name_for_var(var),
+                "lat": get_lat_name_for_var(var),
+            }
+        datavars[name] = dataarray
+    metadata = {**metadata, "datavars": datavars}
+
+    if rotate and metadata.get("vectors"):
+        if "COSALPHA" not in ds or "SINALPHA" not in ds:
+            raise ValueError(
+                "Rotating winds needs COSALPHA and SINALPHA in the dataset"
+            )
+        cosalpha, sinalpha = (
+            decode_packed(ds["COSALPHA"]),
+            decode_packed(ds["SINALPHA"]),
+        )
+        for name, vector in metadata["vectors"].items():
+            u, v = ds[vector["uArrName"]], ds[vector["vArrName"]]
+            if u.dims != v.dims:
+                raise ValueError(f"Components of {name} are on different grids")
+            u, v = earth_relative(
+                decode_packed(u), decode_packed(v), cosalpha, sinalpha
+            )
+            ds = ds.assign({vector["uArrName"]: u, vector["vArrName"]: v})
+            logger.info(f"{name}: rotated to earth-relative")
+    return ds, metadata
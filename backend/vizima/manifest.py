@@ -0,0 +1,183 @@
+import hashlib
+import json
+import typing as t
+from collections.abc import MutableMapping
+from pathlib import Path
+
+import dask
+import numpy as np
+import xarray as xr
+
+MANIFEST_KEY = "vizima_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_bytes(*buffers: bytes | memoryview) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for buf in buffers:
+        h.update(buf)
+    return h.hexdigest()
+
+
+def hash_file(path: Path, block_size: int = 2**20) -> str:
+    """`hash_bytes` of the content of the file at `path`, read block by block."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_array(values: np.ndarray) -> str:
+    """Hash of the dtype, shape and bytes of an array."""
+    values = np.asarray(values)
+    header = f"{values.dtype.str}{values.shape}".encode()
+    if values.dtype == object:
+        return hash_bytes(header, repr(values.tolist()).encode())
+    return hash_bytes(
+        header, memoryview(np.ascontiguousarray(values).reshape(-1).view(np.uint8))
+    )
+
+
+def hash_json(obj: t.Any) -> str:
+    return hash_bytes(json.dumps(obj, sort_keys=True, default=str).encode())
+
+
+def coords_hash(var: xr.DataArray) -> str:
+    """Hash of all coordinate values of `var`, to detect a changed grid or time axis."""
+    return hash_json({name: hash_array(c.values) for name, c in var.coords.items()})
+
+
+def slab_key(index: tuple[int, ...]) -> str:
+    return ".".join(str(i) for i in index) or "0"
+
+
+def _block_slab_stats(
+    block: np.ndarray,
+    start: tuple[int, ...],
+    slab_chunks: tuple[int, ...],
+) -> dict[str, dict[str, t.Any]]:
+    stats = {}
+    nlead = len(slab_chunks)
+    for origin in np.ndindex(
+        *(-(-n // c) for n, c in zip(block.shape[:nlead], slab_chunks))
+    ):
+        slices = tuple(slice(o * c, (o + 1) * c) for o, c in zip(origin, slab_chunks))
+        slab = block[slices]
+        finite = slab[np.isfinite(slab)]
+        index = tuple(
+            (s + sl.start) // c for s, sl, c in zip(start, slices, slab_chunks)
+        )
+        stats[slab_key(index)] = {
+            "hash": hash_array(slab),
+            "min": float(finite.min()) if finite.size else None,
+            "max": float(finite.max()) if finite.size else None,
+        }
+    return stats
+
+
+def slab_stats(
+    var: xr.DataArray, chunks: tuple[int, ...]
+) -> dict[str, dict[str, t.Any]]:
+    """
+    Hash, min and max of the source values of every slab of `var`, in one pass.
+
+    A slab is one output chunk along the leading (time/level) dimensions,
+    spanning the full horizontal grid. The dask chunks of `var` along the
+    leading dimensions must be multiples of `chunks`.
+    """
+    nlead = var.ndim - 2
+    data = var.chunk({var.dims[-2]: -1, var.dims[-1]: -1}).data
+    offsets = [np.cumsum((0,) + c[:-1]) for c in data.chunks[:nlead]]
+    blocks = data.to_delayed()
+
+    tasks = [
+        dask.delayed(_block_slab_stats)(
+            blocks[index + (0, 0)],
+            tuple(int(offsets[d][i]) for d, i in enumerate(index)),
+            chunks[:nlead],
+        )
+        for index in np.ndindex(*data.numblocks[:nlead])
+    ]
+    stats: dict[str, dict[str, t.Any]] = {}
+    for block_stats in dask.compute(*tasks):
+        stats.update(block_stats)
+    return stats
+
+
+def slabs_range(slabs: dict[str, dict[str, t.Any]]) -> tuple[float, float] | None:
+    """Overall (min, max) of the slabs, or None if they hold no finite values."""
+    mins = [s["min"] for s in slabs.values() if s["min"] is not None]
+    maxs = [s["max"] for s in slabs.values() if s["max"] is not None]
+    if not mins:
+        return None
+    return min(mins), max(maxs)
+
+
+def reusable_packing(
+    old_entry: dict[str, t.Any] | None, data_range: tuple[float, float] | None
+) -> dict[str, float] | None:
+    """
+    Packing of the previous run, if it still covers the data range.
+
+    Reusing it keeps the packed values, and so the chunks, of unchanged slabs
+    valid.
+    """
+    if old_entry is None or data_range is None:
+        return None
+    packing = old_entry["packing"]
+    if packing["min"] <= data_range[0] and data_range[1] <= packing["max"]:
+        return packing
+    return None
+
+
+def load_manifest(store: MutableMapping) -> dict[str, t.Any] | None:
+    try:
+        manifest = json.loads(store[MANIFEST_KEY])
+    except KeyError:
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(store: MutableMapping, manifest: dict[str, t.Any]):
+    store[MANIFEST_KEY] = json.dumps(manifest, indent=1).encode()
+
+
+def slab_region(key: str, chunks: tuple[int, ...]) -> tuple[slice, ...]:
+    """Region of the output array covered by the slab `key`."""
+    index = [int(i) for i in key.split(".")] if len(chunks) > 2 else []
+    return tuple(slice(i * c, (i + 1) * c) for i, c in zip(index, chunks)) + (
+        slice(None),
+        slice(None),
+    )
+
+
+def changed_slabs(
+    old: dict[str, t.Any] | None, new: dict[str, t.Any]
+) -> dict[str, list[str]] | None:
+    """
+    Slabs to rewrite per variable, or None if the store must be rewritten.
+
+    The store is rewritten when the set of variables, their shape, chunks or
+    coordinates changed. A variable whose encoding changed has all its slabs
+    rewritten; otherwise only slabs whose source hash changed are.
+    """
+    if old is None or old["variables"].keys() != new["variables"].keys():
+        return None
+
+    changed = {}
+    for name, entry in new["variables"].items():
+        old_entry = old["variables"][name]
+        if any(old_entry[k] != entry[k] for k in ("shape", "chunks", "coords")):
+            return None
+        if old_entry["encoding"] != entry["encoding"]:
+            changed[name] = list(entry["slabs"])
+        else:
+            changed[name] = [
+                key
+                for key, slab in entry["slabs"].items()
+                if old_entry["slabs"].get(key, {}).get("hash") != slab["hash"]
+            ]
+    return changed
@@ -0,0 +1,146 @@
+"""
+Periodic (global) longitude handling.
+
+Global grids are rolled so that their longitudes follow one convention,
+-180..180 or 0..360. Rolling is lazy: it only reorders the source chunks,
+so the data is still read once, slab by slab, by the streaming write.
+
+Tiled (Zarr v3) stores can also get a wrap halo: copies of the columns across
+the seam on both edges, placed so that the west and east edge tiles each hold
+them next to their own columns. The halo widths are recorded as the
+`lonHalo` attribute of the longitude and of the store.
+"""
+
+import logging
+import typing as t
+
+import numpy as np
+import xarray as xr
+
+from .vizimacli import LonConvention, check_periodic_lon, regular_step
+
+logger = logging.getLogger(__name__)
+
+HALO_ATTR = "lonHalo"
+
+
+def wrap_lon_values(lon: np.ndarray, convention: LonConvention) -> np.ndarray:
+    """Longitudes wrapped to [-180, 180) or [0, 360)."""
+    if convention == LonConvention.signed:
+        return (lon + 180.0) % 360.0 - 180.0
+    return lon % 360.0
+
+
+def periodic_lons(ds: xr.Dataset, metadata: dict[str, t.Any]) -> list[str]:
+    """Names of the 1-D, evenly spaced and periodic longitudes of the datavars."""
+    names = {v["lon"] for v in metadata["datavars"].values() if v.get("lon")}
+    periodic = []
+    for name in sorted(names):
+        lon = ds[name]
+        if lon.ndim != 1 or lon.size < 2:
+            continue
+        step = regular_step(lon)
+        if step is None:
+            continue
+        if check_periodic_lon(float(lon[0]), step, lon.size):
+            periodic.append(name)
+    return periodic
+
+
+def roll_lon(ds: xr.Dataset, name: str, convention: LonConvention) -> xr.Dataset:
+    """Roll `ds` along longitude `name` so that it starts at the convention's west edge."""
+    lon = ds[name]
+    dim = lon.dims[0]
+    wrapped = wrap_lon_values(lon.values, convention)
+    shift = int(np.argmin(wrapped))
+    if shift == 0 and np.array_equal(wrapped, lon.values):
+        return ds
+    logger.info(
+        f"Rolling {name} by {-shift} column(s) to the {convention.value} convention"
+    )
+    encodings = {v: ds[v].encoding for v in ds.variables}
+    ds = ds.roll({dim: -shift}, roll_coords=True)
+    ds = ds.assign_coords({name: (dim, np.roll(wrapped, -shift), lon.attrs)})
+    for v, encoding in encodings.items():
+        ds[v].encoding = encoding
+    return ds
+
+
+def halo_widths(n: int, halo: int, tile_size: int) -> tuple[int, int]:
+    """
+    West and east halo widths of a grid of `n` columns written in tiles of
+    `tile_size` columns, so that each edge tile holds at least `halo` wrap
+    columns and at least one grid column. The east halo is `halo` columns; the
+    west one is widened until the last grid column does not end a tile.
+    """
+    if n + 2 * halo <= tile_size:
+        return halo, halo
+    if 2 * halo >= tile_size:
+        raise ValueError(
+            f"halo of {halo} columns must be less than half the tile size {tile_size}"
+        )
+    for west in range(halo, min(tile_size, n + 1)):
+        if 1 <= (west + n) % tile_size <= tile_size - halo:
+            return west, halo
+    raise ValueError(
+        f"halo of {halo} columns does not fit the {tile_size} column tiles "
+        f"of a {n} column grid"
+    )
+
+
+def add_halo(ds: xr.Dataset, name: str, west: int, east: int) -> xr.Dataset:
+    """
+    Prepend the last `west` columns of longitude `name` west of the first and
+    append the first `east` columns east of the last.
+    """
+    dim = ds[name].dims[0]
+    n = ds[name].size
+    west_edge = ds.isel({dim: slice(n - west, n)})
+    west_edge = west_edge.assign_coords({name: west_edge[name] - 360.0})
+    east_edge = ds.isel({dim: slice(0, east)})
+    east_edge = east_edge.assign_coords({name: east_edge[name] + 360.0})
+    encodings = {v: ds[v].encoding for v in ds.variables}
+    attrs = ds[name].attrs
+    ds = xr.concat(
+        [west_edge, ds, east_edge],
+        dim=dim,
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+    )
+    for v, encoding in encodings.items():
+        ds[v].encoding = encoding
+    ds[name].attrs = {**attrs, HALO_ATTR: {"west": west, "east": east}}
+    return ds
+
+
+def wrap_longitude(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    convention: LonConvention | None = None,
+    halo: int = 0,
+    tile_size: int = 256,
+) -> xr.Dataset:
+    """
+    Roll the periodic longitudes of `ds` to `convention` (None keeps them as
+    they are) and add `halo` wrap columns to the edge tiles of `tile_size`
+    columns. Grids that are not global are returned unchanged.
+    """
+    if halo < 0:
+        raise ValueError(f"halo must be non-negative. Got {halo}")
+    names = periodic_lons(ds, metadata)
+    if not names:
+        logger.info("No periodic longitude found; grid written as is")
+    for name in names:
+        if convention is not None:
+            ds = roll_lon(ds, name, convention)
+        if halo:
+            n = ds[name].size
+            if halo > n:
+                raise ValueError(
+                    f"halo of {halo} columns is wider than the grid of {name}"
+                )
+            west, east = halo_widths(n, halo, tile_size)
+            logger.info(f"Adding {west} west and {east} east wrap columns to {name}")
+            ds = add_halo(ds, name, west, east)
+    return ds
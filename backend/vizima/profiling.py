@@ -0,0 +1,285 @@
+import cProfile
+import io
+import json
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import typing as t
+from collections import defaultdict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+
+METADATA_KEYS = (".zarray", ".zattrs", ".zgroup", ".zmetadata")
+
+
+class ProfileHook(str, Enum):
+    cprofile = "cprofile"
+    tracemalloc = "tracemalloc"
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _new_stage() -> dict[str, float]:
+    return {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0}
+
+
+class Profiler:
+    """
+    Collects wall/CPU time per stage and byte counters, globally and per variable.
+
+    Stages run from the main thread are timed with `stage`; tasks run
+    concurrently on dask worker threads are timed with `task`, so their times
+    are summed over threads. A disabled profiler records nothing.
+    """
+
+    def __init__(
+        self,
+        command: str,
+        enabled: bool = False,
+        hooks: t.Iterable[ProfileHook] = (),
+        hot_stages: t.Iterable[str] = (),
+    ):
+        self.command = command
+        self.enabled = enabled
+        self.hooks = set(hooks) if enabled else set()
+        self.hot_stages = set(hot_stages)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._stages: dict[str, dict[str, float]] = defaultdict(_new_stage)
+        self._variables: dict[str, dict[str, t.Any]] = defaultdict(
+            lambda: {"stages": defaultdict(_new_stage), "counters": defaultdict(int)}
+        )
+        self._counters: dict[str, int] = defaultdict(int)
+        self._hook_reports: dict[str, dict[str, t.Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str, var: str | None = None):
+        """Time a stage run from the main thread, with hooks for hot stages."""
+        if not self.enabled:
+            yield
+            return
+
+        hooked = name in self.hot_stages
+        if hooked:
+            self._start_hooks()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._record(
+                name, var, time.perf_counter() - wall, time.process_time() - cpu
+            )
+            if hooked:
+                self._stop_hooks(name if var is None else f"{name}:{var}")
+
+    @contextmanager
+    def task(self, name: str, var: str | None = None):
+        """Time one task of a stage run on a (dask) worker thread."""
+        if not self.enabled:
+            yield
+            return
+
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self._record(
+                name, var, time.perf_counter() - wall, time.thread_time() - cpu
+            )
+
+    def _record(self, name: str, var: str | None, wall: float, cpu: float):
+        with self._lock:
+            targets = [self._stages[name]]
+            if var is not None:
+                targets.append(self._variables[var]["stages"][name])
+            for target in targets:
+                target["wall_s"] += wall
+                target["cpu_s"] += cpu
+                target["calls"] += 1
+
+    def defer(self, name: str, wall: float, cpu: float):
+        """Hold a task time on this thread until the variable is known."""
+        if self.enabled:
+            self._local.pending = getattr(self._local, "pending", []) + [
+                (name, wall, cpu)
+            ]
+
+    def flush(self, var: str | None):
+        """Record the times deferred on this thread against `var`."""
+        for name, wall, cpu in getattr(self._local, "pending", []):
+            self._record(name, var, wall, cpu)
+        self._local.pending = []
+
+    def count(self, var: str | None = None, **counters: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            for key, value in counters.items():
+                self._counters[key] += value
+                if var is not None:
+                    self._variables[var]["counters"][key] += value
+
+    def _start_hooks(self):
+        if ProfileHook.cprofile in self.hooks:
+            import dask
+
+            # cProfile only sees the calling thread, so run dask tasks on it
+            self._dask_config = dask.config.set(scheduler="synchronous")
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        if ProfileHook.tracemalloc in self.hooks:
+            tracemalloc.start()
+
+    def _stop_hooks(self, stage: str, top: int = 20):
+        report: dict[str, t.Any] = {}
+        if ProfileHook.cprofile in self.hooks:
+            self._cprofile.disable()
+            self._dask_config.__exit__(None, None, None)
+            stats = pstats.Stats(self._cprofile, stream=io.StringIO())
+            report["cprofile"] = [
+                {
+                    "function": f"{file}:{line}({func})",
+                    "ncalls": ncalls,
+                    "tottime_s": tottime,
+                    "cumtime_s": cumtime,
+                }
+                for (file, line, func), (_, ncalls, tottime, cumtime, _) in sorted(
+                    stats.stats.items(),  # ty:ignore[unresolved-attribute]
+                    key=lambda item: item[1][3],
+                    reverse=True,
+                )[:top]
+            ]
+        if ProfileHook.tracemalloc in self.hooks:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report["tracemalloc"] = {
+                "peak_traced_bytes": peak,
+                "top_allocations": [
+                    {"location": str(stat.traceback), "size_bytes": stat.size}
+                    for stat in snapshot.statistics("lineno")[:top]
+                ],
+            }
+        self._hook_reports[stage] = report
+
+    def report(self) -> dict[str, t.Any]:
+        return {
+            "command": self.command,
+            "wall_s": time.perf_counter() - self._start_wall,
+            "cpu_s": time.process_time() - self._start_cpu,
+            "peak_rss_bytes": peak_rss_bytes(),
+            **self._counters,
+            "stages": dict(self._stages),
+            "variables": {
+                var: {"stages": dict(v["stages"]), **v["counters"]}
+                for var, v in self._variables.items()
+            },
+            "hooks": self._hook_reports,
+        }
+
+    def dump(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+class TimedCodec:
+    """Compressor timing the `encode` of the codec it wraps as a `compress` task."""
+
+    def __init__(self, codec: t.Any, profiler: Profiler):
+        self.codec = codec
+        self.codec_id = codec.codec_id
+        self.profiler = profiler
+
+    def encode(self, buf):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return self.codec.encode(buf)
+        finally:
+            self.profiler.defer(
+                "compress", time.perf_counter() - wall, time.thread_time() - cpu
+            )
+
+    def decode(self, buf, out=None):
+        return self.codec.decode(buf, out)
+
+    def get_config(self) -> dict[str, t.Any]:
+        return self.codec.get_config()
+
+
+def profile_compressors(profiler: Profiler, arrays: t.Iterable[t.Any]):
+    """
+    Time the compressors of the zarr `arrays` while they are written.
+
+    zarr instantiates the compressor of an array object from its metadata, so
+    the compressor of each of these objects is wrapped; other arrays and the
+    stored metadata are unchanged. The time is attributed to a variable by the
+    `ProfiledStore` write that follows on the same thread.
+    """
+    if not profiler.enabled:
+        return
+    for array in arrays:
+        if array.compressor is not None and not isinstance(
+            array.compressor, TimedCodec
+        ):
+            array._compressor = TimedCodec(array.compressor, profiler)
+
+
+class ProfiledStore(MutableMapping):
+    """Times writes to a zarr store under the `write` stage and counts bytes/chunks."""
+
+    def __init__(
+        self,
+        store: MutableMapping,
+        profiler: Profiler,
+        var_names: dict[str, str],
+    ):
+        self.store = store
+        self.profiler = profiler
+        # output array name -> profiled variable name
+        self.var_names = var_names
+
+    def __setitem__(self, key, value):
+        array, _, leaf = key.rpartition("/")
+        var = self.var_names.get(array)
+        self.profiler.flush(var)
+        with self.profiler.task("write", var):
+            self.store[key] = value
+        is_chunk = leaf not in METADATA_KEYS
+        self.profiler.count(
+            var,
+            bytes_written=memoryview(value).nbytes,
+            chunks_written=int(is_chunk and var is not None),
+        )
+
+    def __getitem__(self, key):
+        return self.store[key]
+
+    def __delitem__(self, key):
+        del self.store[key]
+
+    def __contains__(self, key):
+        return key in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def close(self):
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,145 @@
+"""
+Content-addressed publishing of processed stores.
+
+A published store is a small, mutable `<name>/index.json` holding the Zarr
+metadata and a map from every chunk key to the hash of its bytes, and the
+chunks themselves under `chunks/<hash>`, shared by all stores published to
+the same destination. A chunk's URL changes exactly when its content does,
+so chunks can be cached forever and republishing only invalidates the
+index.
+"""
+
+import json
+import logging
+import typing as t
+from pathlib import Path
+
+import fsspec
+import zarr
+
+from .manifest import MANIFEST_KEY, hash_bytes
+from .remote import UploadStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+CHUNKS_DIR = "chunks"
+ZARR_METADATA = {".zarray", ".zattrs", ".zgroup", ".zmetadata", "zarr.json"}
+
+
+def store_files(store: Path) -> t.Iterator[tuple[str, Path]]:
+    """(key, path) of the files of a store, keys relative to it with `/`."""
+    for path in sorted(store.rglob("*")):
+        if path.is_file():
+            yield path.relative_to(store).as_posix(), path
+
+
+def publish_store(
+    store: Path,
+    dest: Path | str,
+    name: str | None = None,
+    concurrency: int = 16,
+) -> dict[str, int]:
+    """
+    Publish `store` into `dest` (a path or fsspec URL) as `<name>/index.json`
+    (name defaults to the store's name without suffix) and content-addressed
+    chunks, uploaded `concurrency` at a time.
+
+    Chunks already in `dest` are not written again. The index is written
+    once all chunks are, so clients never see an index referring to missing
+    chunks. Returns the numbers of new and reused chunks.
+    """
+    name = name or store.stem
+    target = UploadStore(str(dest), concurrency)
+    existing = set(target.listdir(CHUNKS_DIR))
+    metadata: dict[str, t.Any] = {}
+    chunks: dict[str, str] = {}
+    counts = {"new": 0, "reused": 0}
+    for key, path in store_files(store):
+        if path.name == MANIFEST_KEY or path.name.endswith(".tmp"):
+            continue
+        data = path.read_bytes()
+        if path.name in ZARR_METADATA:
+            metadata[key] = json.loads(data)
+            continue
+        digest = hash_bytes(data)
+        chunks[key] = digest
+        if digest in existing:
+            counts["reused"] += 1
+            continue
+        target[f"{CHUNKS_DIR}/{digest}"] = data
+        existing.add(digest)
+        counts["new"] += 1
+
+    index = {
+        "version": INDEX_VERSION,
+        "chunks_url": f"../{CHUNKS_DIR}/",
+        "metadata": metadata,
+        "chunks": chunks,
+    }
+    target[f"{name}/{INDEX_NAME}"] = json.dumps(index).encode()
+    target.close()
+    logger.info(
+        f"Published {store} as {name}/{INDEX_NAME} in {dest}: "
+        f"{counts['new']} new and {counts['reused']} reused chunk(s)"
+    )
+    return counts
+
+
+def prune_chunks(dest: Path | str) -> int:
+    """Delete the chunks in `dest` that no published index refers to."""
+    fs, root = fsspec.core.url_to_fs(str(dest))
+    root = root.rstrip("/")
+    used: set[str] = set()
+    for index_path in fs.glob(f"{root}/*/{INDEX_NAME}"):
+        used.update(json.loads(fs.cat_file(index_path))["chunks"].values())
+    try:
+        blobs = fs.ls(f"{root}/{CHUNKS_DIR}", detail=False)
+    except FileNotFoundError:
+        blobs = []
+    unused = [b for b in blobs if str(b).rstrip("/").rsplit("/", 1)[-1] not in used]
+    if unused:
+        fs.rm(unused)
+    logger.info(f"Removed {len(unused)} unused chunk(s) from {dest}")
+    return len(unused)
+
+
+class PublishedStore(zarr.storage.BaseStore):
+    """
+    Read-only zarr store over a published index, e.g. for
+    `xr.open_zarr(PublishedStore(path))`.
+    """
+
+    _writeable = False
+    _erasable = False
+
+    def __init__(self, index_path: Path):
+        self.index_path = index_path
+        index = json.loads(index_path.read_text())
+        if index.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {index_path}")
+        self.metadata = index["metadata"]
+        self.chunks = index["chunks"]
+        self.chunks_dir = (index_path.parent / index["chunks_url"]).resolve()
+
+    def __getitem__(self, key: str) -> bytes:
+        if key in self.metadata:
+            return json.dumps(self.metadata[key]).encode()
+        return (self.chunks_dir / self.chunks[key]).read_bytes()
+
+    def __setitem__(self, key: str, value: bytes):
+        raise zarr.errors.ReadOnlyError()
+
+    def __delitem__(self, key: str):
+        raise zarr.errors.ReadOnlyError()
+
+    def __iter__(self):
+        yield from self.metadata
+        yield from self.chunks
+
+    def __len__(self) -> int:
+        return len(self.metadata) + len(self.chunks)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.metadata or key in self.chunks
@@ -0,0 +1,313 @@
+"""
+Reading processed stores from Python.
+
+`StoreReader` opens a store written by `process_dataset` (Zarr v2, local or
+at an fsspec URL, or a local sharded Zarr v3 store), parses its attributes
+into the `Dataset` model and returns decoded float32 windows of its
+variables, like `fetchZarrGrid` does in the browser: a window is a
+variable, a time and level index and a rectangle of grid cells
+(`xs`, `ys`, `nx`, `ny`).
+
+Decoded chunks are kept in a byte-bounded LRU cache shared by all reads,
+and `read_many` decodes every chunk needed by a batch of windows once, in
+parallel.
+"""
+
+import json
+import logging
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+import zarr
+
+from .dataset_model import Dataset, DataVar
+from .server import ByteLRU
+from .sharding import EMPTY, chunk_key, get_compressor
+from .vizimacli import FILL_VALUE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Window:
+    """
+    Part of a variable (a datavar name or array name) to read. Like the
+    frontend's `GridConfig`, `time` and `level` are indices and the window
+    is `ny` rows from `ys` and `nx` columns from `xs`; None is the whole
+    grid.
+    """
+
+    variable: str
+    time: int | None = None
+    level: int | None = None
+    xs: int = 0
+    ys: int = 0
+    nx: int | None = None
+    ny: int | None = None
+
+
+class ZarrArray:
+    """Chunks of a Zarr v2 array."""
+
+    def __init__(self, array: zarr.Array):
+        self.array = array
+        self.shape: tuple[int, ...] = array.shape
+        self.chunks: tuple[int, ...] = array.chunks
+        self.dtype = array.dtype
+        self.attrs = array.attrs.asdict()
+        self.dims = tuple(self.attrs.get("_ARRAY_DIMENSIONS", ()))
+        self.fill_value = array.fill_value
+
+    def read_chunk(self, index: tuple[int, ...]) -> np.ndarray:
+        return self.array.blocks[index]
+
+    def read_all(self) -> np.ndarray:
+        return self.array[...]
+
+
+class ShardedArray:
+    """Inner chunks of a Zarr v3 array written by `vizima.sharding`."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        meta = json.loads((path / "zarr.json").read_text())
+        self.shape = tuple(meta["shape"])
+        self.dtype = np.dtype(meta["data_type"]).newbyteorder("<")
+        self.attrs = meta.get("attributes", {})
+        self.dims = tuple(meta.get("dimension_names") or ())
+        fill_value = meta["fill_value"]
+        self.fill_value = np.nan if fill_value == "NaN" else fill_value
+        self.grid_chunks = tuple(meta["chunk_grid"]["configuration"]["chunk_shape"])
+        codec = meta["codecs"][0]
+        self.sharded = codec["name"] == "sharding_indexed"
+        self.chunks = (
+            tuple(codec["configuration"]["chunk_shape"])
+            if self.sharded
+            else self.grid_chunks
+        )
+        self.compressor = get_compressor()
+
+    def read_bytes(self, index: tuple[int, ...]) -> bytes | None:
+        if not self.sharded:
+            path = self.path / chunk_key(index)
+            return path.read_bytes() if path.exists() else None
+        per_shard = tuple(s // c for s, c in zip(self.grid_chunks, self.chunks))
+        shard = tuple(i // p for i, p in zip(index, per_shard))
+        inner = tuple(i % p for i, p in zip(index, per_shard))
+        path = self.path / chunk_key(shard)
+        if not path.exists():
+            return None
+        nindex = int(np.prod(per_shard)) * 16
+        with open(path, "rb") as f:
+            f.seek(-nindex, 2)
+            offsets = np.frombuffer(f.read(nindex), dtype="<u8")
+            offset, nbytes = offsets.reshape(per_shard + (2,))[inner]
+            if offset == EMPTY:
+                return None
+            f.seek(int(offset))
+            return f.read(int(nbytes))
+
+    def read_chunk(self, index: tuple[int, ...]) -> np.ndarray:
+        region = tuple(
+            slice(i * c, min((i + 1) * c, n))
+            for i, c, n in zip(index, self.chunks, self.shape)
+        )
+        data = self.read_bytes(index)
+        if data is None:
+            return np.full(
+                tuple(r.stop - r.start for r in region),
+                self.fill_value,
+                dtype=self.dtype,
+            )
+        chunk = np.frombuffer(self.compressor.decode(data), dtype=self.dtype)
+        chunk = chunk.reshape(self.chunks)
+        return chunk[tuple(slice(0, r.stop - r.start) for r in region)]
+
+    def read_all(self) -> np.ndarray:
+        out = np.empty(self.shape, dtype=self.dtype)
+        nchunks = (-(-n // c) for n, c in zip(self.shape, self.chunks))
+        for index in product(*map(range, nchunks)):
+            chunk = self.read_chunk(index)
+            out[
+                tuple(
+                    slice(i * c, i * c + s)
+                    for i, c, s in zip(index, self.chunks, chunk.shape)
+                )
+            ] = chunk
+        return out
+
+
+def decode(raw: np.ndarray, attrs: dict[str, t.Any], fill_value: t.Any) -> np.ndarray:
+    """Packed values as float32, with fill values as NaN."""
+    if fill_value is None and "scale_factor" in attrs:
+        # v2 stores do not record the fill value of packed arrays
+        fill_value = FILL_VALUE
+    values = raw.astype(np.float32)
+    values *= np.float32(attrs.get("scale_factor", 1.0))
+    values += np.float32(attrs.get("add_offset", 0.0))
+    if fill_value is not None and not np.issubdtype(raw.dtype, np.floating):
+        values[raw == fill_value] = np.nan
+    return values
+
+
+class StoreReader:
+    """
+    Decoded windows of a processed store, with an LRU cache of at most
+    `cache_bytes` of decoded chunks; `workers` chunks are decoded at once.
+    """
+
+    def __init__(
+        self,
+        store: Path | str,
+        cache_bytes: int = 256 * 2**20,
+        workers: int = 8,
+    ):
+        self.store = store
+        self.v3 = isinstance(store, Path) and (store / "zarr.json").exists()
+        if self.v3:
+            attrs = json.loads((Path(store) / "zarr.json").read_text())["attributes"]
+        else:
+            self.group = zarr.open_group(str(store), mode="r")
+            attrs = self.group.attrs.asdict()
+        self.dataset = Dataset(**attrs)
+        self.cache: ByteLRU[np.ndarray] = ByteLRU(cache_bytes)
+        self.workers = workers
+        self._arrays: dict[str, ZarrArray | ShardedArray] = {}
+
+    def array(self, name: str) -> ZarrArray | ShardedArray:
+        if name not in self._arrays:
+            if self.v3:
+                self._arrays[name] = ShardedArray(Path(self.store) / name)
+            else:
+                self._arrays[name] = ZarrArray(self.group[name])
+        return self._arrays[name]
+
+    def datavar(self, variable: str) -> DataVar:
+        if variable in self.dataset.datavars:
+            return self.dataset.datavars[variable]
+        for datavar in self.dataset.datavars.values():
+            if datavar.arrName == variable:
+                return datavar
+        raise ValueError(f"No variable {variable} in {self.store}")
+
+    def selection(self, window: Window) -> tuple[str, tuple[slice, ...]]:
+        """Array name and region of `window`, with a size 1 slice per index."""
+        datavar = self.datavar(window.variable)
+        shape = self.array(datavar.arrName).shape
+        region = []
+        for name, index in (("time", window.time), ("level", window.level)):
+            if not getattr(datavar, name):
+                continue
+            if index is None:
+                raise ValueError(f"{window.variable} needs a {name} index")
+            region.append(slice(index, index + 1))
+        ny, nx = shape[-2:]
+        region.append(slice(window.ys, window.ys + (window.ny or ny - window.ys)))
+        region.append(slice(window.xs, window.xs + (window.nx or nx - window.xs)))
+        for r, n in zip(region, shape):
+            if r.start < 0 or r.stop > n or r.start >= r.stop:
+                raise ValueError(f"Window {window} is outside {shape}")
+        return datavar.arrName, tuple(region)
+
+    def chunk_indices(self, name: str, region: tuple[slice, ...]):
+        chunks = self.array(name).chunks
+        return product(
+            *(range(r.start // c, -(-r.stop // c)) for r, c in zip(region, chunks))
+        )
+
+    def decoded_chunk(self, name: str, index: tuple[int, ...]) -> np.ndarray:
+        key = f"{name}/{'.'.join(map(str, index))}"
+        chunk = self.cache.get(key)
+        if chunk is None:
+            arr = self.array(name)
+            chunk = decode(arr.read_chunk(index), arr.attrs, arr.fill_value)
+            self.cache.put(key, chunk)
+        return chunk
+
+    def assemble(
+        self,
+        name: str,
+        region: tuple[slice, ...],
+        chunks: t.Mapping[tuple[int, ...], np.ndarray],
+    ) -> np.ndarray:
+        sizes = self.array(name).chunks
+        out = np.empty(tuple(r.stop - r.start for r in region), dtype=np.float32)
+        for index in self.chunk_indices(name, region):
+            origin = [i * c for i, c in zip(index, sizes)]
+            src, dst = [], []
+            for r, o, c in zip(region, origin, sizes):
+                start, stop = max(r.start, o), min(r.stop, o + c)
+                src.append(slice(start - o, stop - o))
+                dst.append(slice(start - r.start, stop - r.start))
+            out[tuple(dst)] = chunks[index][tuple(src)]
+        return out[(0,) * (out.ndim - 2)]
+
+    def read(self, window: Window) -> np.ndarray:
+        """Decoded (ny, nx) float32 values of `window`."""
+        name, region = self.selection(window)
+        chunks = {
+            index: self.decoded_chunk(name, index)
+            for index in self.chunk_indices(name, region)
+        }
+        return self.assemble(name, region, chunks)
+
+    def read_many(self, windows: list[Window]) -> list[np.ndarray]:
+        """`read` of every window, decoding each chunk they need once."""
+        selections = [self.selection(w) for w in windows]
+        needed = {
+            (name, index)
+            for name, region in selections
+            for index in self.chunk_indices(name, region)
+        }
+        with ThreadPoolExecutor(self.workers) as pool:
+            decoded = dict(
+                zip(needed, pool.map(lambda k: self.decoded_chunk(*k), needed))
+            )
+        return [
+            self.assemble(
+                name,
+                region,
+                {i: decoded[(name, i)] for i in self.chunk_indices(name, region)},
+            )
+            for name, region in selections
+        ]
+
+    def bbox_window(
+        self,
+        variable: str,
+        bbox: tuple[float, float, float, float],
+        time: int | None = None,
+        level: int | None = None,
+    ) -> Window:
+        """Window of the grid cells of `variable` inside `bbox` (W, S, E, N)."""
+        from .subset import bbox_indexers
+
+        datavar = self.datavar(variable)
+        coords = xr.Dataset(
+            coords={
+                name: (
+                    self.array(name).dims,
+                    self.array(name).read_all(),
+                )
+                for name in (datavar.lon, datavar.lat)
+            }
+        )
+        indexers = bbox_indexers(coords, datavar.lon, datavar.lat, bbox)
+        dims = self.array(datavar.arrName).dims
+        rows, cols = indexers[dims[-2]], indexers[dims[-1]]
+        if not isinstance(rows, slice) or not isinstance(cols, slice):
+            raise ValueError(f"{bbox} crosses the edge of the grid of {variable}")
+        return Window(
+            variable,
+            time,
+            level,
+            xs=cols.start,
+            ys=rows.start,
+            nx=cols.stop - cols.start,
+            ny=rows.stop - rows.start,
+        )
@@ -0,0 +1,287 @@
+"""
+Rechunking and re-encoding of existing processed (Zarr v2) stores.
+
+Arrays are copied at the Zarr level, so packed values, packing parameters
+and all attributes (including the `Dataset` attributes of the store) are
+kept bit for bit; only the chunk shape and compressor change. Subgroups
+(e.g. `contours`) are copied too. The manifest of incremental writes is
+kept only while its slabs still match the chunks of the stored arrays. In
+place, the store is swapped with its rechunked copy once the copy is marked
+complete, and a swap interrupted by a crash is completed by the next run.
+
+Memory is bounded with a two-phase algorithm. A copy of blocks aligned to
+both the source and target chunks (their least common multiple) is used
+when such a block fits in `max_mem`. Otherwise the array is first copied to
+an intermediate array whose chunks divide both the source and target
+chunks, then from it to the target: every block of either phase is then
+made of whole source (or target) chunks only.
+"""
+
+import json
+import logging
+import math
+import shutil
+import tempfile
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+
+import numcodecs
+import zarr
+from numcodecs.abc import Codec
+
+from .manifest import load_manifest, save_manifest
+
+logger = logging.getLogger(__name__)
+
+
+def parse_chunks(text: str) -> dict[str, int]:
+    """`dim=size,...` chunk sizes per dimension; -1 is the whole dimension."""
+    chunks = {}
+    for item in filter(None, text.split(",")):
+        dim, _, size = item.partition("=")
+        try:
+            size = int(size)
+        except ValueError:
+            size = 0
+        if not dim.strip() or size == 0 or size < -1:
+            raise ValueError(f"chunks must be DIM=SIZE,... Got {text!r}")
+        chunks[dim.strip()] = size
+    return chunks
+
+
+def parse_compressor(text: str) -> Codec | None:
+    """`none`, or a numcodecs codec id with an optional level, e.g. `zstd:5`."""
+    codec_id, _, level = text.partition(":")
+    if codec_id == "none":
+        return None
+    config: dict[str, t.Any] = {"id": codec_id}
+    if level:
+        config["clevel" if codec_id == "blosc" else "level"] = int(level)
+    try:
+        return numcodecs.get_codec(config)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Unknown compressor {text!r}: {e}")
+
+
+def block_shape(
+    shape: tuple[int, ...], a: tuple[int, ...], b: tuple[int, ...]
+) -> tuple[int, ...]:
+    """Smallest blocks made of whole chunks `a` and whole chunks `b`."""
+    return tuple(min(math.lcm(x, y), n) for n, x, y in zip(shape, a, b))
+
+
+def nbytes(shape: tuple[int, ...], itemsize: int) -> int:
+    return math.prod(shape) * itemsize
+
+
+def plan_rechunk(
+    shape: tuple[int, ...],
+    source: tuple[int, ...],
+    target: tuple[int, ...],
+    itemsize: int,
+    max_mem: int,
+) -> tuple[int, ...] | None:
+    """
+    Intermediate chunks to rechunk from `source` to `target` in blocks of at
+    most `max_mem` bytes, or None if a direct copy fits.
+    """
+    if nbytes(block_shape(shape, source, target), itemsize) <= max_mem:
+        return None
+
+    def peak(inter):
+        return max(
+            nbytes(block_shape(shape, source, inter), itemsize),
+            nbytes(block_shape(shape, inter, target), itemsize),
+        )
+
+    # the larger intermediate chunks the better; fall back to the gcd of
+    # source and target (blocks of single source or target chunks), one
+    # dimension at a time, until both phases fit
+    inter = [min(s, c) for s, c in zip(source, target)]
+    while peak(inter) > max_mem:
+        candidates = [
+            [math.gcd(s, c) if i == d else x for i, x in enumerate(inter)]
+            for d, (s, c) in enumerate(zip(source, target))
+            if inter[d] != math.gcd(s, c)
+        ]
+        if not candidates:
+            raise ValueError(
+                f"Rechunking {source} to {target} needs more than "
+                f"{max_mem} bytes per block; raise the memory limit"
+            )
+        inter = min(candidates, key=peak)
+    return tuple(inter)
+
+
+def copy_blocks(src: zarr.Array, dst: zarr.Array, block: tuple[int, ...]):
+    """Copy `src` to `dst` one block at a time."""
+    for index in product(*(range(0, n, b) for n, b in zip(src.shape, block))):
+        region = tuple(
+            slice(i, min(i + b, n)) for i, b, n in zip(index, block, src.shape)
+        )
+        dst[region] = src[region]
+
+
+def rechunk_array(
+    src: zarr.Array,
+    dst: zarr.Array,
+    scratch: zarr.Group,
+    max_mem: int,
+):
+    if src.ndim == 0:
+        dst[...] = src[...]
+        return
+    inter = plan_rechunk(src.shape, src.chunks, dst.chunks, src.itemsize, max_mem)
+    if inter is None:
+        copy_blocks(src, dst, block_shape(src.shape, src.chunks, dst.chunks))
+        return
+    logger.info(f"{src.name}: rechunking through intermediate chunks {inter}")
+    tmp = scratch.empty_like(src.name, src, chunks=inter, compressor=None)
+    copy_blocks(src, tmp, block_shape(src.shape, src.chunks, inter))
+    copy_blocks(tmp, dst, block_shape(src.shape, inter, dst.chunks))
+    scratch.store.rmdir(tmp.path)
+
+
+def walk_groups(group: zarr.Group, path: str = ""):
+    """`(path, group)` of `group` and all its subgroups."""
+    yield path, group
+    for name, sub in group.groups():
+        yield from walk_groups(sub, f"{path}/{name}".lstrip("/"))
+
+
+def walk_arrays(group: zarr.Group):
+    """Arrays of `group` and all its subgroups."""
+    for _, sub in walk_groups(group):
+        for _, arr in sub.arrays():
+            yield arr
+
+
+SWAP_KEY = ".vizima.rechunk"
+
+
+def swap_paths(store: Path) -> tuple[Path, Path]:
+    """The rechunked copy of `store` and the old store, while rechunked in place."""
+    return (
+        store.with_name(store.name + ".rechunk"),
+        store.with_name(store.name + ".old"),
+    )
+
+
+def finish_swap(store: Path) -> bool:
+    """
+    Swap the rechunked copy of `store` in, or complete the swap an interrupted
+    in-place rechunk left behind. The copy holds the swap marker from the time
+    it is complete until the old store is removed, so every step is redone
+    only if it was not done yet. Returns whether there was a swap to complete.
+    """
+    dest, old = swap_paths(store)
+    if (dest / SWAP_KEY).exists():
+        if store.exists():
+            store.rename(old)
+        dest.rename(store)
+    elif not (store / SWAP_KEY).exists():
+        return False
+    if old.exists():
+        shutil.rmtree(old)
+    (store / SWAP_KEY).unlink()
+    return True
+
+
+def rechunk_store(
+    store: Path,
+    out: Path | None = None,
+    chunks: dict[str, int] | None = None,
+    compressor: t.Any = "keep",
+    max_mem: int = 256 * 2**20,
+    workers: int = 4,
+):
+    """
+    Rewrite `store` with `chunks` (per dimension; other dimensions keep
+    their chunks) and `compressor` ("keep" keeps each array's) to `out`, or
+    in place when `out` is None. Arrays are rewritten `workers` at a time,
+    each holding at most `max_mem` bytes of data.
+    """
+    if out is None and finish_swap(store):
+        logger.warning(f"Completed the interrupted rechunk of {store} in place")
+    if not store.is_dir():
+        raise ValueError(f"{store} is not a directory")
+    if (store / "zarr.json").exists():
+        raise ValueError(f"{store} is a Zarr v3 store; only v2 stores can be rechunked")
+    chunks = chunks or {}
+    dest, old = swap_paths(store)
+    if out is None and old.exists():
+        raise ValueError(f"{old} exists: move it back to {store} or remove it first")
+    dest = out or dest
+    if dest.exists():
+        raise ValueError(f"{dest} already exists")
+
+    source = zarr.open_group(zarr.DirectoryStore(store), mode="r")
+    target = zarr.open_group(zarr.DirectoryStore(dest), mode="w")
+
+    arrays = list(walk_arrays(source))
+    unknown = set(chunks) - {
+        d for src in arrays for d in src.attrs.get("_ARRAY_DIMENSIONS", [])
+    }
+    if unknown:
+        raise ValueError(f"No dimension(s) {sorted(unknown)} in {store}")
+
+    # groups (e.g. `contours`) with their attributes, then their arrays
+    for path, group in walk_groups(source):
+        (target.require_group(path) if path else target).attrs.update(
+            group.attrs.asdict()
+        )
+    jobs = []
+    for src in arrays:
+        dims = src.attrs.get("_ARRAY_DIMENSIONS", [])
+        new_chunks = tuple(
+            n if chunks.get(d, c) == -1 else min(chunks.get(d, c), n)
+            for d, c, n in zip(dims, src.chunks, src.shape)
+        )
+        # arrays without named dimensions keep their chunks
+        new_chunks = new_chunks + src.chunks[len(new_chunks) :]
+        dst = target.create(
+            src.path,
+            shape=src.shape,
+            chunks=new_chunks or src.shape,
+            dtype=src.dtype,
+            fill_value=src.fill_value,
+            order=src.order,
+            filters=src.filters,
+            compressor=src.compressor if compressor == "keep" else compressor,
+        )
+        dst.attrs.update(src.attrs.asdict())
+        jobs.append((src, dst))
+
+    with (
+        tempfile.TemporaryDirectory(dir=dest.parent, prefix=".rechunk-") as tmp,
+        ThreadPoolExecutor(workers) as pool,
+    ):
+        scratch = zarr.open_group(zarr.DirectoryStore(tmp), mode="w")
+        for src, dst in jobs:
+            logger.info(f"{src.name}: chunks {src.chunks} -> {dst.chunks}")
+        futures = [
+            pool.submit(rechunk_array, src, dst, scratch, max_mem) for src, dst in jobs
+        ]
+        for future in futures:
+            future.result()
+
+    # slab hashes describe the values, which are unchanged, but the slabs
+    # are output chunks: with other chunks, the next write starts afresh
+    manifest = load_manifest(source.store)
+    if manifest is not None:
+        if all(
+            tuple(entry["chunks"]) == target[name].chunks
+            for name, entry in manifest["variables"].items()
+        ):
+            save_manifest(target.store, manifest)
+        else:
+            logger.info(f"Dropped the manifest of {store}: its slabs are other chunks")
+    zarr.consolidate_metadata(target.store)
+
+    if out is None:
+        (dest / SWAP_KEY).write_text(json.dumps({"store": store.name}))
+        finish_swap(store)
+        dest = store
+    logger.info(f"Rechunked {store} into {dest}")
@@ -0,0 +1,300 @@
+import logging
+import os
+import time
+import typing as t
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from .manifest import hash_array, hash_json
+from .vizimacli import decode_packed
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_VERSION = 1
+
+# largest distance, in grid cells, of a source point from the fitted regular
+# projected grid
+MAX_GRID_RESIDUAL = 0.05
+
+
+def default_cache_dir() -> Path:
+    cache = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(cache) / "vizima" / "regrid"
+
+
+def wrap_lon(lon: np.ndarray) -> np.ndarray:
+    """Longitudes in degrees wrapped to [-180, 180)."""
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def project(
+    lon: np.ndarray, lat: np.ndarray, projection: dict[str, t.Any], cen_lon: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Coordinates in which the grid of `projection` is regular, up to an affine
+    transform (so constant factors and offsets are left out). `cen_lon` is
+    the central longitude of the grid.
+    """
+    match projection["name"]:
+        case "LonLat" | "Mercator":
+            x = np.radians(wrap_lon(lon - cen_lon))
+            phi = np.radians(lat)
+            if projection["name"] == "Mercator":
+                return x, np.log(np.tan(np.pi / 4 + phi / 2))
+            return x, phi
+        case "ConicConformal":
+            phi1, phi2 = np.radians([projection["trueLat1"], projection["trueLat2"]])
+            if np.isclose(phi1, phi2):
+                n = np.sin(phi1)
+            else:
+                n = np.log(np.cos(phi1) / np.cos(phi2)) / np.log(
+                    np.tan(np.pi / 4 + phi2 / 2) / np.tan(np.pi / 4 + phi1 / 2)
+                )
+            rho = np.tan(np.pi / 4 + np.radians(lat) / 2) ** -n / n
+            theta = n * np.radians(wrap_lon(lon - projection["standLon"]))
+            return rho * np.sin(theta), -rho * np.cos(theta)
+        case "Stereographic":
+            hemisphere = 1.0 if projection["cenLat"] >= 0 else -1.0
+            rho = np.tan(np.pi / 4 - hemisphere * np.radians(lat) / 2)
+            theta = np.radians(wrap_lon(lon - projection["standLon"]))
+            return rho * np.sin(theta), -hemisphere * rho * np.cos(theta)
+        case "Equirectangular":
+            if np.isclose(projection["poleLat"], 90.0):
+                return project(lon, lat, {"name": "LonLat"}, cen_lon)
+            return rotate_to_center(
+                lon, lat, projection["cenLon"], projection["cenLat"]
+            )
+    raise ValueError(f"Cannot regrid from projection {projection['name']}")
+
+
+def rotate_to_center(
+    lon: np.ndarray, lat: np.ndarray, cen_lon: float, cen_lat: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Rotated longitude/latitude (radians) with (cen_lon, cen_lat) at (0, 0)."""
+    lam, phi = np.radians(wrap_lon(lon - cen_lon)), np.radians(lat)
+    x, y, z = np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)
+    c, s = np.cos(np.radians(cen_lat)), np.sin(np.radians(cen_lat))
+    x, z = c * x + s * z, -s * x + c * z
+    return np.arctan2(y, x), np.arcsin(np.clip(z, -1, 1))
+
+
+def fit_grid(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Affine map from projected (x, y, 1) to fractional (row, column) indices
+    of the 2-D source grid with projected coordinates `x`, `y`.
+    """
+    ny, nx = x.shape
+    rows, cols = np.mgrid[0:ny, 0:nx]
+    design = np.column_stack([rows.ravel(), cols.ravel(), np.ones(x.size)])
+    coef, *_ = np.linalg.lstsq(design, np.column_stack([x.ravel(), y.ravel()]))
+    residual = np.abs(design @ coef - np.column_stack([x.ravel(), y.ravel()]))
+    cell = np.abs(coef[:2]).max(axis=0)
+    if (residual / cell).max() > MAX_GRID_RESIDUAL:
+        raise ValueError("The source grid is not regular in its projection")
+    forward = np.vstack([coef.T, [0.0, 0.0, 1.0]])
+    return np.linalg.inv(forward)[:2]
+
+
+def target_axes(
+    lon: np.ndarray, lat: np.ndarray, res: float, cen_lon: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Regular 1-D lon/lat axes at `res` degrees covering the source grid."""
+    rel = wrap_lon(lon - cen_lon)
+    lon_min, lon_max = cen_lon + rel.min(), cen_lon + rel.max()
+    if lon_min < -180:
+        lon_min, lon_max = lon_min + 360, lon_max + 360
+    lons = np.arange(np.ceil(lon_min / res), np.floor(lon_max / res) + 1) * res
+    lats = np.arange(np.ceil(lat.min() / res), np.floor(lat.max() / res) + 1) * res
+    return lons, lats
+
+
+def bilinear_weights(
+    rows: np.ndarray, cols: np.ndarray, shape: tuple[int, int]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Flat source indices and weights of the 4 neighbours of each target point.
+
+    Together they are a sparse matrix in ELLPACK layout (a fixed number of
+    entries per row). Points outside the source grid get zero weights.
+    """
+    ny, nx = shape
+    eps = 1e-9
+    valid = (
+        (rows > -eps) & (rows < ny - 1 + eps) & (cols > -eps) & (cols < nx - 1 + eps)
+    )
+    r0 = np.clip(np.floor(rows), 0, ny - 2).astype(np.int64)
+    c0 = np.clip(np.floor(cols), 0, nx - 2).astype(np.int64)
+    dr, dc = rows - r0, cols - c0
+    base = r0 * nx + c0
+    indices = np.stack([base, base + 1, base + nx, base + nx + 1], axis=-1)
+    weights = np.stack(
+        [(1 - dr) * (1 - dc), (1 - dr) * dc, dr * (1 - dc), dr * dc], axis=-1
+    )
+    indices[~valid] = 0
+    weights[~valid] = 0.0
+    return indices, weights
+
+
+@dataclass
+class RegridWeights:
+    """Bilinear weights from a projected source grid to a regular lon/lat grid."""
+
+    indices: np.ndarray
+    weights: np.ndarray
+    lon: np.ndarray
+    lat: np.ndarray
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp, indices=self.indices, weights=self.weights, lon=self.lon, lat=self.lat
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "RegridWeights":
+        with np.load(path) as f:
+            return cls(f["indices"], f["weights"], f["lon"], f["lat"])
+
+    def apply(self, block: np.ndarray) -> np.ndarray:
+        """
+        Regrid the last two dimensions of `block`, one slab (sparse mat-vec)
+        at a time.
+
+        NaN source values are left out and the remaining weights renormalised.
+        """
+        flat = block.reshape(block.shape[:-2] + (-1,))
+        out = np.empty(block.shape[:-2] + (self.lat.size * self.lon.size,))
+        for index in np.ndindex(*block.shape[:-2]):
+            values = flat[index][self.indices]
+            missing = np.isnan(values)
+            weights = np.where(missing, 0.0, self.weights)
+            total = weights.sum(axis=-1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                slab = np.where(missing, 0.0, values * weights).sum(axis=-1) / total
+            slab[total == 0] = np.nan
+            out[index] = slab
+        return out.reshape(block.shape[:-2] + (self.lat.size, self.lon.size))
+
+
+def grid_lonlat(
+    ds: xr.Dataset, lon_name: str, lat_name: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """2-D lon/lat arrays of a grid (the first time step of time-varying ones)."""
+    lon, lat = ds[lon_name], ds[lat_name]
+    lon = lon.isel({dim: 0 for dim in lon.dims[:-2]}).values
+    lat = lat.isel({dim: 0 for dim in lat.dims[:-2]}).values
+    if lon.ndim == 1 and lat.ndim == 1:
+        lon, lat = np.meshgrid(lon, lat)
+    return lon, lat
+
+
+def regrid_weights(
+    lon: np.ndarray,
+    lat: np.ndarray,
+    projection: dict[str, t.Any],
+    res: float,
+    cache_dir: Path | None = None,
+    axes: tuple[np.ndarray, np.ndarray] | None = None,
+) -> RegridWeights:
+    """
+    Weights from the grid `lon`/`lat` to a regular `res` degree lon/lat grid.
+
+    Weights are cached in `cache_dir`, keyed by the source grid, projection
+    and target grid, so repeated runs on the same domain load them.
+    """
+    cen_lon = float(lon[lon.shape[0] // 2, lon.shape[1] // 2])
+    if axes is None:
+        axes = target_axes(lon, lat, res, cen_lon)
+    key = hash_json(
+        {
+            "version": WEIGHTS_VERSION,
+            "method": "bilinear",
+            "projection": projection,
+            "lon": hash_array(lon),
+            "lat": hash_array(lat),
+            "target_lon": hash_array(axes[0]),
+            "target_lat": hash_array(axes[1]),
+        }
+    )
+    path = (cache_dir or default_cache_dir()) / f"{key}.npz"
+    if path.exists():
+        logger.info(f"Loading regrid weights from {path}")
+        return RegridWeights.load(path)
+
+    start = time.perf_counter()
+    to_index = fit_grid(*project(lon, lat, projection, cen_lon))
+    target_lon, target_lat = np.meshgrid(*axes)
+    x, y = project(target_lon, target_lat, projection, cen_lon)
+    rows, cols = to_index @ np.stack([x.ravel(), y.ravel(), np.ones(x.size)])
+    indices, weights = bilinear_weights(rows, cols, lon.shape)
+    regrid = RegridWeights(indices, weights, *axes)
+    regrid.save(path)
+    logger.info(
+        f"Computed regrid weights {lon.shape} -> {(axes[1].size, axes[0].size)} "
+        f"in {time.perf_counter() - start:.1f}s, saved to {path}"
+    )
+    return regrid
+
+
+def regrid_dataset(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    res: float,
+    cache_dir: Path | None = None,
+) -> tuple[xr.Dataset, dict[str, t.Any]]:
+    """
+    Regrid the `metadata` variables of `ds` to a regular lon/lat grid.
+
+    The target grid covers the grid of the first variable; variables on other
+    (e.g. staggered) grids get their own weights to the same target. Returns
+    the regridded dataset and the metadata updated to the `LonLat` projection.
+    """
+    projection = metadata["projection"]
+    out = xr.Dataset()
+    grids: dict[tuple[str, str], RegridWeights] = {}
+    axes = None
+    datavars = {}
+    for name, dataarray in metadata["datavars"].items():
+        grid = (dataarray["lon"], dataarray["lat"])
+        if grid not in grids:
+            lon, lat = grid_lonlat(ds, *grid)
+            grids[grid] = regrid_weights(lon, lat, projection, res, cache_dir, axes)
+            axes = (grids[grid].lon, grids[grid].lat)
+        weights = grids[grid]
+
+        var = decode_packed(ds[dataarray["arrName"]])
+        ydim, xdim = var.dims[-2:]
+        var = var.drop_vars(
+            [c for c in var.coords if {ydim, xdim} & set(var[c].dims)]
+        ).chunk({ydim: -1, xdim: -1})
+        out[dataarray["arrName"]] = xr.apply_ufunc(
+            weights.apply,
+            var,
+            input_core_dims=[[ydim, xdim]],
+            output_core_dims=[["lat", "lon"]],
+            dask="parallelized",
+            output_dtypes=[np.float64],
+            dask_gufunc_kwargs={
+                "output_sizes": {"lat": weights.lat.size, "lon": weights.lon.size}
+            },
+            keep_attrs=True,
+        )
+        # read the regridded variable in the chunks it is computed in
+        regridded = out[dataarray["arrName"]]
+        regridded.encoding["preferred_chunks"] = {
+            dim: chunks[0] for dim, chunks in regridded.chunksizes.items()
+        }
+        datavars[name] = {**dataarray, "lon": "lon", "lat": "lat"}
+
+    assert axes is not None
+    out = out.assign_coords(
+        lon=("lon", axes[0], {"units": "degrees_east", "standard_name": "longitude"}),
+        lat=("lat", axes[1], {"units": "degrees_north", "standard_name": "latitude"}),
+    )
+    out.attrs = ds.attrs
+    return out, {**metadata, "datavars": datavars, "projection": {"name": "LonLat"}}
@@ -0,0 +1,218 @@
+"""
+Zarr store writing directly to any fsspec URL (s3://, gs://, memory://...)
+or local path.
+
+Chunk writes are uploaded in the background by a pool of threads, so a
+store is written at the speed of the connection instead of one request
+latency per chunk. Failed uploads are retried with exponential backoff.
+Metadata (zarr `.z*` keys and JSON files) is only written once every
+pending chunk is uploaded, so readers never see metadata, a manifest or an
+index referring to missing chunks; objects larger than `part_size` are
+written in parts (multipart uploads on object stores). An object store only
+shows an upload once it is complete; a local file is written aside and
+renamed into place, so an interrupted write never leaves a partial file.
+"""
+
+import logging
+import random
+import threading
+import time
+import typing as t
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import fsspec
+import zarr
+
+logger = logging.getLogger(__name__)
+
+
+def is_url(out: str | Path) -> bool:
+    return "://" in str(out)
+
+
+def is_metadata_key(key: str) -> bool:
+    name = key.rsplit("/", 1)[-1]
+    return name.startswith(".") or name.endswith(".json")
+
+
+class UploadStore(zarr.storage.BaseStore):
+    """
+    Write-behind zarr store over an fsspec URL.
+
+    Up to `concurrency` uploads run at once and at most `2 * concurrency`
+    chunks are buffered. `flush` waits for the pending uploads and raises
+    the first upload error; `close` flushes and stops the threads.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        concurrency: int = 16,
+        retries: int = 5,
+        backoff: float = 0.5,
+        part_size: int = 8 * 2**20,
+        **storage_options: t.Any,
+    ):
+        self.url = url
+        self.fs, root = fsspec.core.url_to_fs(url, **storage_options)
+        if "file" in self.fs.protocol and not storage_options:
+            # object stores have no directories; create them on local disk
+            self.fs = fsspec.filesystem("file", auto_mkdir=True)
+        self.root = root.rstrip("/")
+        self.local = "file" in self.fs.protocol
+        self.retries = retries
+        self.backoff = backoff
+        self.part_size = part_size
+        self._pool = ThreadPoolExecutor(concurrency, thread_name_prefix="upload")
+        self._slots = threading.BoundedSemaphore(2 * concurrency)
+        self._lock = threading.Lock()
+        self._buffers: dict[str, bytes] = {}
+        self._pending: set[Future] = set()
+        self._errors: list[BaseException] = []
+
+    def _path(self, key: str) -> str:
+        return f"{self.root}/{key}" if key else self.root
+
+    def _write(self, path: str, data: bytes):
+        if len(data) > self.part_size:
+            with self.fs.open(path, "wb", block_size=self.part_size) as f:
+                for start in range(0, len(data), self.part_size):
+                    f.write(data[start : start + self.part_size])
+        else:
+            self.fs.pipe_file(path, data)
+
+    def _write_atomic(self, path: str, data: bytes):
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            self._write(tmp, data)
+            self.fs.mv(tmp, path)
+        except BaseException:
+            if self.fs.exists(tmp):
+                self.fs.rm_file(tmp)
+            raise
+
+    def _put(self, key: str, data: bytes):
+        path = self._path(key)
+        for attempt in range(self.retries + 1):
+            try:
+                if self.local:
+                    self._write_atomic(path, data)
+                else:
+                    self._write(path, data)
+                return
+            except (FileNotFoundError, PermissionError):
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                logger.warning(
+                    f"Upload of {key} failed ({e!r}), retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _upload(self, key: str, data: bytes):
+        try:
+            self._put(key, data)
+        finally:
+            with self._lock:
+                if self._buffers.get(key) is data:
+                    del self._buffers[key]
+            self._slots.release()
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+            if (error := future.exception()) is not None:
+                self._errors.append(error)
+
+    def flush(self):
+        """Wait for all pending uploads; raise the first error, if any."""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for future in pending:
+                future.exception()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def __setitem__(self, key: str, value: t.Any):
+        data = bytes(memoryview(value))
+        if is_metadata_key(key):
+            self.flush()
+            self._put(key, data)
+            return
+        self._slots.acquire()
+        with self._lock:
+            self._buffers[key] = data
+        future = self._pool.submit(self._upload, key, data)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def __getitem__(self, key: str) -> bytes:
+        with self._lock:
+            if key in self._buffers:
+                return self._buffers[key]
+        try:
+            return self.fs.cat_file(self._path(key))
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            if key in self._buffers:
+                return True
+        return isinstance(key, str) and self.fs.isfile(self._path(key))
+
+    def __delitem__(self, key: str):
+        self.flush()
+        try:
+            self.fs.rm_file(self._path(key))
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def keys_under(self, path: str = "") -> list[str]:
+        self.flush()
+        prefix = self.root + "/"
+        try:
+            found = self.fs.find(self._path(path))
+        except FileNotFoundError:
+            return []
+        return [p[len(prefix) :] for p in found if p.startswith(prefix)]
+
+    def __iter__(self):
+        return iter(self.keys_under())
+
+    def __len__(self) -> int:
+        return len(self.keys_under())
+
+    def listdir(self, path: str = "") -> list[str]:
+        self.flush()
+        try:
+            entries = self.fs.ls(self._path(path), detail=False)
+        except FileNotFoundError:
+            return []
+        return sorted(str(e).rstrip("/").rsplit("/", 1)[-1] for e in entries)
+
+    def rmdir(self, path: str = ""):
+        self.flush()
+        target = self._path(path)
+        if self.fs.exists(target):
+            self.fs.rm(target, recursive=True)
+
+    def getsize(self, path: str = "") -> int:
+        self.flush()
+        return self.fs.du(self._path(path))
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown()
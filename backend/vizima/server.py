@@ -0,0 +1,477 @@
+"""
+HTTP server for processed stores, made for browser and CDN caching.
+
+Every file is served with a strong ETag derived from its content, so a
+client revalidating an unchanged chunk gets an empty 304. Chunks get a long
+`Cache-Control` max-age; metadata is always revalidated, so clients see
+store updates; published content-addressed chunks are immutable. Single
+byte ranges are supported and read from the file (e.g. the inner chunks
+of a shard), JSON metadata is sent gzip-compressed, with an ETag of its
+own, to clients that accept it, and recently served files are kept in a
+byte-bounded LRU cache.
+"""
+
+import gzip
+import http.client
+import logging
+import random
+import re
+import threading
+import time
+import typing as t
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from .manifest import hash_bytes, hash_file
+
+logger = logging.getLogger(__name__)
+
+METADATA_NAMES = {
+    ".zarray",
+    ".zattrs",
+    ".zgroup",
+    ".zmetadata",
+    "zarr.json",
+    "vizima_manifest.json",
+    "tiles.json",
+}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ETAG_CACHE_BYTES = 16 * 2**20
+# name of a published, content-addressed chunk (see publish.py)
+CONTENT_HASH = re.compile(r"[0-9a-f]{32}")
+
+
+def is_metadata(path: str) -> bool:
+    name = path.rsplit("/", 1)[-1]
+    return name in METADATA_NAMES or name.endswith(".json")
+
+
+@dataclass
+class Entry:
+    """A served file: its content, gzipped content (metadata only) and ETag."""
+
+    body: bytes
+    etag: str
+    stamp: tuple[int, int]
+    gzipped: bytes | None = None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.body) + len(self.gzipped or b"")
+
+
+@dataclass
+class Tag:
+    """ETag of a file served by ranges, which is not read whole."""
+
+    etag: str
+    stamp: tuple[int, int]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.etag)
+
+
+def gzip_etag(etag: str) -> str:
+    """ETag of the gzip-encoded representation of a file with `etag`."""
+    return f'{etag[:-1]}-gzip"'
+
+
+class Sized(t.Protocol):
+    @property
+    def nbytes(self) -> int: ...
+
+
+class ByteLRU[V: Sized]:
+    """
+    Thread-safe LRU cache holding at most `max_bytes` of entries (anything
+    with an `nbytes`, e.g. an `Entry` or a numpy array).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._entries: OrderedDict[str, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: V):
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (start, stop) of a single `bytes=` range, or None to send the whole file
+    (no, multiple or malformed ranges). Raises ValueError if unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if (
+        unit.strip() != "bytes"
+        or not sep
+        or not (first or last)
+        or not all(part.isdigit() for part in (first, last) if part)
+    ):
+        return None
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+        return max(size - length, 0), size
+    start = int(first)
+    stop = min(int(last) + 1, size) if last else size
+    if start >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    if stop <= start:
+        return None
+    return start, stop
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison)."""
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+@dataclass
+class Response:
+    status: int
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+
+class ChunkServer:
+    """
+    Serves the files under `root` (a store, or a directory of stores).
+
+    Files are read once and then served from the cache for as long as their
+    size and modification time are unchanged.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        cache_bytes: int = 256 * 2**20,
+        chunk_max_age: int = 24 * 3600,
+        allow_origin: str = "*",
+    ):
+        self.root = root.resolve()
+        self.cache: ByteLRU[Entry] = ByteLRU(cache_bytes)
+        self.tags: ByteLRU[Tag] = ByteLRU(ETAG_CACHE_BYTES)
+        self.chunk_max_age = chunk_max_age
+        self.allow_origin = allow_origin
+
+    def resolve(self, url_path: str) -> Path | None:
+        rel = unquote(urlsplit(url_path).path).lstrip("/")
+        path = (self.root / rel).resolve()
+        if not path.is_relative_to(self.root) or not path.is_file():
+            return None
+        return path
+
+    def cached(self, path: Path, stamp: tuple[int, int]) -> Entry | None:
+        entry = self.cache.get(str(path))
+        return entry if entry is not None and entry.stamp == stamp else None
+
+    def load(self, path: Path) -> Entry:
+        stat = path.stat()
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        key = str(path)
+        entry = self.cached(path, stamp)
+        if entry is not None:
+            return entry
+        body = path.read_bytes()
+        entry = Entry(body, f'"{hash_bytes(body)}"', stamp)
+        if is_metadata(key) and len(body) > 256:
+            entry.gzipped = gzip.compress(body, compresslevel=6, mtime=0)
+        self.cache.put(key, entry)
+        return entry
+
+    def etag(self, path: Path, stamp: tuple[int, int]) -> str:
+        """ETag of the file at `path`, hashed block by block once per change."""
+        key = str(path)
+        tag = self.tags.get(key)
+        if tag is None or tag.stamp != stamp:
+            tag = Tag(f'"{hash_file(path)}"', stamp)
+            self.tags.put(key, tag)
+        return tag.etag
+
+    def cache_control(self, name: str) -> str:
+        if is_metadata(name):
+            return "no-cache"
+        if CONTENT_HASH.fullmatch(name) or self.chunk_max_age >= IMMUTABLE_MAX_AGE:
+            return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        return f"public, max-age={self.chunk_max_age}"
+
+    def respond(self, method: str, url_path: str, headers: t.Mapping[str, str]):
+        """Response to a request; `headers` keys are expected in lower case."""
+        base = {
+            "Access-Control-Allow-Origin": self.allow_origin,
+            "Access-Control-Expose-Headers": "ETag, Content-Range, Content-Length",
+        }
+        if method == "OPTIONS":
+            return Response(
+                HTTPStatus.NO_CONTENT,
+                {
+                    **base,
+                    "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+                    "Access-Control-Allow-Headers": "Range, If-None-Match",
+                    "Access-Control-Max-Age": "86400",
+                },
+            )
+        if method not in ("GET", "HEAD"):
+            return Response(
+                HTTPStatus.METHOD_NOT_ALLOWED, {**base, "Allow": "GET, HEAD"}
+            )
+
+        path = self.resolve(url_path)
+        if path is None:
+            return Response(HTTPStatus.NOT_FOUND, {**base, "Content-Length": "0"})
+        stat = path.stat()
+        size, stamp = stat.st_size, (stat.st_size, stat.st_mtime_ns)
+        range_header = headers.get("range")
+        if range_header and not is_metadata(path.name):
+            # read only the range from the file, unless it is cached
+            entry = self.cached(path, stamp)
+            etag = entry.etag if entry is not None else self.etag(path, stamp)
+        else:
+            entry = self.load(path)
+            etag = entry.etag
+        gzipped = entry is not None and entry.gzipped is not None
+        use_gzip = (
+            gzipped
+            and not range_header
+            and "gzip" in headers.get("accept-encoding", "")
+        )
+        if use_gzip:
+            etag = gzip_etag(etag)
+        base.update(
+            {
+                "ETag": etag,
+                "Cache-Control": self.cache_control(path.name),
+                "Accept-Ranges": "bytes",
+            }
+        )
+        if gzipped:
+            base["Vary"] = "Accept-Encoding"
+
+        if etag_matches(headers.get("if-none-match", ""), etag):
+            return Response(HTTPStatus.NOT_MODIFIED, base)
+
+        span = None
+        if range_header and headers.get("if-range", etag) == etag:
+            try:
+                span = parse_range(range_header, size)
+            except ValueError:
+                return Response(
+                    HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                    {**base, "Content-Range": f"bytes */{size}"},
+                )
+        if span is not None:
+            start, stop = span
+            base["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+            status = HTTPStatus.PARTIAL_CONTENT
+            if entry is not None:
+                body = entry.body[start:stop]
+            else:
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    body = f.read(stop - start)
+        else:
+            status = HTTPStatus.OK
+            entry = entry or self.load(path)
+            body = entry.gzipped if use_gzip and entry.gzipped else entry.body
+            if use_gzip:
+                base["Content-Encoding"] = "gzip"
+
+        base["Content-Type"] = (
+            "application/json" if is_metadata(path.name) else "application/octet-stream"
+        )
+        base["Content-Length"] = str(len(body))
+        return Response(status, base, b"" if method == "HEAD" else body)
+
+
+def asgi_app(server: ChunkServer):
+    """ASGI application around `server`, e.g. for `uvicorn`."""
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        headers = {k.decode().lower(): v.decode() for k, v in scope["headers"]}
+        response = server.respond(scope["method"], scope["path"], headers)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": int(response.status),
+                "headers": [
+                    (k.encode(), v.encode()) for k, v in response.headers.items()
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": response.body})
+
+    return app
+
+
+def make_handler(server: ChunkServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive connections, as browsers use
+        protocol_version = "HTTP/1.1"
+
+        def handle_request(self):
+            headers = {k.lower(): v for k, v in self.headers.items()}
+            response = server.respond(self.command, self.path, headers)
+            self.send_response(response.status)
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            bodiless = (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED)
+            if (
+                "Content-Length" not in response.headers
+                and response.status not in bodiless
+            ):
+                self.send_header("Content-Length", str(len(response.body)))
+            self.end_headers()
+            if response.body:
+                self.wfile.write(response.body)
+
+        do_GET = do_HEAD = do_OPTIONS = do_POST = do_PUT = do_DELETE = handle_request
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def make_http_server(server: ChunkServer, host: str, port: int) -> ThreadingHTTPServer:
+    httpd = ThreadingHTTPServer((host, port), make_handler(server))
+    httpd.daemon_threads = True
+    return httpd
+
+
+def chunk_paths(store: Path) -> list[str]:
+    """Paths, relative to `store`, of its chunk files."""
+    return sorted(
+        p.relative_to(store).as_posix()
+        for p in store.rglob("*")
+        if p.is_file() and not is_metadata(p.name)
+    )
+
+
+def bench_client(
+    url: str,
+    paths: list[str],
+    requests: int,
+    revisit: float,
+    seed: int,
+) -> tuple[list[float], Counter, int]:
+    """
+    One client panning around: each request revisits a chunk it has already
+    fetched with probability `revisit` (sending its ETag, as a browser
+    revalidating its cache would) and otherwise fetches a random chunk.
+    """
+    parts = urlsplit(url)
+    connection = (
+        http.client.HTTPSConnection
+        if parts.scheme == "https"
+        else http.client.HTTPConnection
+    )(parts.netloc, timeout=30)
+    rng = random.Random(seed)
+    etags: dict[str, str] = {}
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    nbytes = 0
+    try:
+        for _ in range(requests):
+            if etags and rng.random() < revisit:
+                path = rng.choice(list(etags))
+                headers = {"If-None-Match": etags[path]}
+            else:
+                path = rng.choice(paths)
+                headers = {}
+            start = time.perf_counter()
+            connection.request(
+                "GET", f"{parts.path.rstrip('/')}/{path}", headers=headers
+            )
+            response = connection.getresponse()
+            body = response.read()
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status] += 1
+            nbytes += len(body)
+            if etag := response.getheader("ETag"):
+                etags[path] = etag
+    finally:
+        connection.close()
+    return latencies, statuses, nbytes
+
+
+def bench_server(
+    url: str,
+    store: Path,
+    clients: int = 8,
+    requests: int = 200,
+    revisit: float = 0.5,
+) -> dict[str, t.Any]:
+    """
+    Load test the server at `url` (serving `store`) with concurrent clients;
+    works against any HTTP server, e.g. to compare with nginx.
+    """
+    paths = chunk_paths(store)
+    if not paths:
+        raise ValueError(f"No chunks found in {store}")
+
+    results: list[tuple[list[float], Counter, int]] = [([], Counter(), 0)] * clients
+
+    def run(i: int):
+        results[i] = bench_client(url, paths, requests, revisit, seed=i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    latencies = sorted(x for lat, _, _ in results for x in lat)
+    statuses: Counter = sum((s for _, s, _ in results), Counter())
+    nbytes = sum(n for _, _, n in results)
+
+    def percentile(q: float) -> float:
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000
+
+    return {
+        "requests": len(latencies),
+        "seconds": round(wall, 3),
+        "requests_per_second": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(0.5), 2),
+        "p95_ms": round(percentile(0.95), 2),
+        "p99_ms": round(percentile(0.99), 2),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "megabytes": round(nbytes / 2**20, 2),
+    }
@@ -0,0 +1,317 @@
+"""
+Writer for Zarr v3 stores with the `sharding_indexed` codec.
+
+The rest of the pipeline uses zarr-python 2, which cannot write v3 stores,
+so the (small) subset of the v3 format used here is written directly: a
+group with arrays on a regular chunk grid, where every chunk of the grid is
+a shard of blosc-compressed inner chunks followed by a little-endian index
+of (offset, nbytes) pairs. Small inner chunks keep reads small; large shards
+keep the number of objects in the store manageable.
+"""
+
+import json
+import logging
+import math
+import shutil
+import typing as t
+from pathlib import Path
+
+import dask
+import numcodecs
+import numpy as np
+import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+# offset/nbytes of an inner chunk that was not written (all fill values)
+EMPTY = 2**64 - 1
+
+BLOSC = {"cname": "lz4", "clevel": 5, "shuffle": "shuffle", "blocksize": 0}
+BLOSC_SHUFFLE = {"noshuffle": 0, "shuffle": 1, "bitshuffle": 2}
+
+
+def to_json(obj: t.Any) -> t.Any:
+    """`obj` with numpy values as lists/scalars and non-finite floats as strings."""
+    if isinstance(obj, dict):
+        return {str(k): to_json(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        return [to_json(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return "NaN" if math.isnan(obj) else ("Infinity" if obj > 0 else "-Infinity")
+    return obj
+
+
+def plan_shards(
+    shape: tuple[int, ...],
+    chunks: tuple[int, ...],
+    itemsize: int,
+    target_bytes: int,
+) -> tuple[int, ...]:
+    """
+    Shard shape of whole inner `chunks`, of at most about `target_bytes`.
+
+    Shards grow from the last dimension to the first, so they span whole
+    rows, then whole grids, then several time steps or levels.
+    """
+    shard = list(chunks)
+    for dim in reversed(range(len(shape))):
+        nchunks = -(-shape[dim] // chunks[dim])
+        factor = max(1, target_bytes // (math.prod(shard) * itemsize))
+        shard[dim] = chunks[dim] * min(nchunks, factor)
+        if factor < nchunks:
+            break
+    return tuple(shard)
+
+
+def blosc_codec(itemsize: int) -> dict[str, t.Any]:
+    return {"name": "blosc", "configuration": {**BLOSC, "typesize": itemsize}}
+
+
+def bytes_codec() -> dict[str, t.Any]:
+    return {"name": "bytes", "configuration": {"endian": "little"}}
+
+
+def get_compressor() -> numcodecs.Blosc:
+    # the typesize is taken from the arrays passed to `encode`
+    return numcodecs.Blosc(
+        cname=BLOSC["cname"],
+        clevel=BLOSC["clevel"],
+        shuffle=BLOSC_SHUFFLE[BLOSC["shuffle"]],
+        blocksize=BLOSC["blocksize"],
+    )
+
+
+def chunk_key(index: tuple[int, ...]) -> str:
+    return "/".join(["c", *map(str, index)])
+
+
+def write_json(path: Path, doc: dict[str, t.Any]):
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / "zarr.json", "w") as f:
+        json.dump(to_json(doc), f, indent=2, allow_nan=False)
+
+
+def array_metadata(
+    shape: tuple[int, ...],
+    dtype: np.dtype,
+    chunk_shape: tuple[int, ...],
+    codecs: list[dict[str, t.Any]],
+    fill_value: t.Any,
+    attrs: dict[str, t.Any],
+    dims: tuple[str, ...],
+) -> dict[str, t.Any]:
+    return {
+        "zarr_format": 3,
+        "node_type": "array",
+        "shape": list(shape),
+        "data_type": dtype.name,
+        "chunk_grid": {
+            "name": "regular",
+            "configuration": {"chunk_shape": list(chunk_shape)},
+        },
+        "chunk_key_encoding": {"name": "default", "configuration": {"separator": "/"}},
+        "fill_value": fill_value,
+        "codecs": codecs,
+        "attributes": attrs,
+        "dimension_names": list(dims),
+    }
+
+
+def encode_shard(
+    block: np.ndarray,
+    chunks: tuple[int, ...],
+    shard: tuple[int, ...],
+    fill_value: t.Any,
+) -> bytes | None:
+    """
+    Bytes of one shard holding `block` (cut at the array edge), or None if
+    all its inner chunks hold only `fill_value`.
+    """
+    compressor = get_compressor()
+    grid = tuple(s // c for s, c in zip(shard, chunks))
+    index = np.full(grid + (2,), EMPTY, dtype="<u8")
+    parts, offset = [], 0
+    for origin in np.ndindex(*grid):
+        slices = tuple(slice(o * c, (o + 1) * c) for o, c in zip(origin, chunks))
+        inner = block[slices]
+        if inner.size == 0 or np.all(inner == fill_value):
+            continue
+        if inner.shape != chunks:
+            padded = np.full(chunks, fill_value, dtype=block.dtype)
+            padded[tuple(slice(0, n) for n in inner.shape)] = inner
+            inner = padded
+        data = compressor.encode(np.ascontiguousarray(inner, dtype=block.dtype))
+        index[origin] = (offset, len(data))
+        parts.append(data)
+        offset += len(data)
+    if not parts:
+        return None
+    return b"".join(parts) + index.tobytes()
+
+
+def write_sharded_array(
+    path: Path,
+    var: xr.DataArray,
+    chunks: tuple[int, ...],
+    shard: tuple[int, ...],
+    fill_value: int,
+    write: t.Callable[[Path, bytes], None],
+):
+    """Write the (dask-backed) integer `var` as a sharded v3 array at `path`."""
+    dtype = var.dtype.newbyteorder("<")
+    codecs = [
+        {
+            "name": "sharding_indexed",
+            "configuration": {
+                "chunk_shape": list(chunks),
+                "codecs": [bytes_codec(), blosc_codec(dtype.itemsize)],
+                "index_codecs": [bytes_codec()],
+                "index_location": "end",
+            },
+        }
+    ]
+    attrs = {**var.attrs, "_FillValue": fill_value}
+    write_json(
+        path,
+        array_metadata(
+            var.shape,
+            dtype,
+            shard,
+            codecs,
+            fill_value,
+            attrs,
+            tuple(map(str, var.dims)),
+        ),
+    )
+
+    def _write(block, index):
+        data = encode_shard(np.asarray(block, dtype=dtype), chunks, shard, fill_value)
+        if data is not None:
+            write(path / chunk_key(index), data)
+
+    data = var.chunk(dict(zip(var.dims, shard))).data
+    blocks = data.to_delayed()
+    dask.compute(
+        *(
+            dask.delayed(_write)(blocks[index], index)
+            for index in np.ndindex(*data.numblocks)
+        )
+    )
+
+
+def write_plain_array(
+    path: Path,
+    var: xr.Variable,
+    write: t.Callable[[Path, bytes], None],
+):
+    """Write a CF-encoded (coordinate) variable as a single-chunk v3 array."""
+    var = xr.conventions.encode_cf_variable(var)
+    values = np.ascontiguousarray(var.values, dtype=var.dtype.newbyteorder("<"))
+    attrs = dict(var.attrs)
+    fill_value = attrs.get("_FillValue", var.encoding.get("_FillValue"))
+    if fill_value is None:
+        fill_value = "NaN" if values.dtype.kind == "f" else 0
+    write_json(
+        path,
+        array_metadata(
+            values.shape,
+            values.dtype,
+            values.shape,
+            [bytes_codec(), blosc_codec(values.dtype.itemsize)],
+            fill_value,
+            attrs,
+            tuple(map(str, var.dims)),
+        ),
+    )
+    write(path / chunk_key((0,) * values.ndim), get_compressor().encode(values))
+
+
+def write_sharded_dataset(
+    out_ds: xr.Dataset,
+    out: Path,
+    chunks: dict[str, tuple[int, ...]],
+    shard_bytes: int,
+    fill_value: int,
+    write: t.Callable[[Path, bytes], None] | None = None,
+):
+    """
+    Write `out_ds` as a Zarr v3 group at `out`, replacing any existing store.
+
+    Data variables (packed integers) are sharded with inner `chunks` per
+    variable; coordinates are written as single-chunk arrays.
+    """
+    write = write or write_file
+    if out.exists():
+        shutil.rmtree(out)
+    write_json(
+        out, {"zarr_format": 3, "node_type": "group", "attributes": out_ds.attrs}
+    )
+
+    for name, var in out_ds.data_vars.items():
+        shard = plan_shards(
+            var.shape, chunks[str(name)], var.dtype.itemsize, shard_bytes
+        )
+        logger.info(f"{name}: inner chunks {chunks[str(name)]}, shards {shard}")
+        write_sharded_array(
+            out / str(name), var, chunks[str(name)], shard, fill_value, write
+        )
+
+    for name, coord in out_ds.coords.items():
+        if coord.dtype.kind in "OSU":
+            logger.warning(f"Skipping coordinate `{name}` of dtype {coord.dtype}")
+            continue
+        write_plain_array(out / str(name), coord.variable, write)
+
+
+def write_file(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read_array(path: Path) -> np.ndarray:
+    """Read a whole array written by this module (for checks and tests)."""
+    with open(path / "zarr.json") as f:
+        meta = json.load(f)
+    shape = tuple(meta["shape"])
+    dtype = np.dtype(meta["data_type"]).newbyteorder("<")
+    grid_chunks = tuple(meta["chunk_grid"]["configuration"]["chunk_shape"])
+    fill_value = meta["fill_value"]
+    sharding = meta["codecs"][0]["name"] == "sharding_indexed"
+    inner = (
+        tuple(meta["codecs"][0]["configuration"]["chunk_shape"])
+        if sharding
+        else grid_chunks
+    )
+    compressor = get_compressor()
+
+    out = np.full(shape, np.nan if fill_value == "NaN" else fill_value, dtype=dtype)
+    for index in np.ndindex(*(-(-n // c) for n, c in zip(shape, grid_chunks))):
+        key = path / chunk_key(index)
+        if not key.exists():
+            continue
+        buf = key.read_bytes()
+        origin = tuple(i * c for i, c in zip(index, grid_chunks))
+        if sharding:
+            grid = tuple(s // c for s, c in zip(grid_chunks, inner))
+            nindex = math.prod(grid) * 16
+            offsets = np.frombuffer(buf[-nindex:], dtype="<u8").reshape(grid + (2,))
+            pieces = [
+                (tuple(o + i * c for o, i, c in zip(origin, sub, inner)), offsets[sub])
+                for sub in np.ndindex(*grid)
+                if offsets[sub][0] != EMPTY
+            ]
+            pieces = [(start, buf[o : o + n]) for start, (o, n) in pieces]
+        else:
+            pieces = [(origin, buf)]
+        for start, data in pieces:
+            chunk = np.frombuffer(compressor.decode(data), dtype=dtype).reshape(inner)
+            region = tuple(
+                slice(s, min(s + c, n)) for s, c, n in zip(start, inner, shape)
+            )
+            if any(r.start >= r.stop for r in region):
+                continue
+            out[region] = chunk[tuple(slice(0, r.stop - r.start) for r in region)]
+    return out
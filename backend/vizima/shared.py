@@ -0,0 +1,734 @@
+"""
+Coordinated writes of several `process_dataset` runs into one (Zarr v2) store.
+
+Writers, in different processes or on different machines sharing the
+store's filesystem, may write different variables, different time ranges
+of the same variables, or both. A write goes through four steps:
+
+1. read the source and compute the slab statistics, without any lock;
+2. reserve, under the store lock: merge the writer's times into the time
+   axes of the store, create the missing arrays, widen packing ranges and
+   register the writer as active on its arrays;
+3. pack and write the writer's slabs, each into its own region, without
+   any lock;
+4. commit, under the store lock: merge the slabs into the manifest, the
+   datavars, vectors and axes into the root attributes, write the
+   time-varying coordinates, reconsolidate the metadata and unregister.
+
+Inserting time steps before stored ones (which moves them) or widening a
+packing range (which re-packs the stored values) changes data other writers
+may be writing, so a writer needing either waits until no other writer is
+active on the time axis or array involved.
+
+The lock is a file created with O_EXCL, atomic on local and NFS
+filesystems. Locks and registrations are refreshed while their writer is
+alive, so those not refreshed for `stale` seconds are from writers that died
+and are ignored. A stale lock is broken by renaming it aside first, so that
+writers breaking it at the same time never remove a fresh lock.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import typing as t
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+import zarr
+from xarray.backends.zarr import encode_zarr_attr_value
+from xarray.coding.times import decode_cf_datetime, encode_cf_datetime
+
+from . import manifest as mf
+from .profiling import Profiler, profile_compressors
+from .vizimacli import (
+    FILL_VALUE,
+    dataset_attrs,
+    encoding_hash,
+    format_to_iso,
+    open_store,
+    pack_variable,
+    packing_params_from_range,
+    prepare_variable,
+    repack_block,
+    source_packing_range,
+)
+from .watch import now_iso
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = ".vizima.lock"
+WRITERS_DIR = ".vizima.writers"
+
+
+def is_fresh(path: Path, stale: float) -> bool:
+    try:
+        return time.time() - path.stat().st_mtime < stale
+    except FileNotFoundError:
+        return False
+
+
+class StoreLock:
+    """
+    Exclusive lock of a store, as a lock file created with O_EXCL. A lock
+    not refreshed (see `Heartbeat`) for `stale` seconds is broken. The file
+    holds a token of its holder, so that releasing a lock that was broken
+    leaves the lock of the next holder alone.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        poll: float = 0.5,
+        timeout: float | None = None,
+        stale: float = 600.0,
+    ):
+        self.path = path
+        self.poll = poll
+        self.timeout = timeout
+        self.stale = stale
+        self.token = uuid.uuid4().hex
+        self.held = False
+
+    def acquire(self):
+        start = time.monotonic()
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self.break_stale():
+                    continue
+                if self.timeout is not None and (
+                    time.monotonic() - start > self.timeout
+                ):
+                    raise TimeoutError(f"Could not lock {self.path} in {self.timeout}s")
+                time.sleep(self.poll)
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump(
+                    {
+                        "host": socket.gethostname(),
+                        "pid": os.getpid(),
+                        "since": now_iso(),
+                        "token": self.token,
+                    },
+                    f,
+                )
+            self.held = True
+            return
+
+    def break_stale(self) -> bool:
+        """
+        Remove the lock file if it is stale; True if it may be created again.
+
+        The file is renamed aside and removed only if it is still the stale
+        file observed: a fresh lock that replaced it in between (created by
+        another writer that broke it first) is linked back into place.
+        """
+        try:
+            observed = self.path.stat()
+        except FileNotFoundError:
+            return True
+        if time.time() - observed.st_mtime < self.stale:
+            return False
+        aside = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}")
+        try:
+            os.rename(self.path, aside)
+        except FileNotFoundError:
+            # broken by another writer
+            return True
+        moved = aside.stat()
+        if (moved.st_ino, moved.st_mtime_ns) == (observed.st_ino, observed.st_mtime_ns):
+            logger.warning(f"Breaking stale lock {self.path}")
+        else:
+            try:
+                os.link(aside, self.path)
+            except FileExistsError:
+                logger.warning(f"Lock {self.path} was taken while it was put back")
+        aside.unlink()
+        return True
+
+    def release(self):
+        self.held = False
+        try:
+            token = json.loads(self.path.read_text()).get("token")
+        except (FileNotFoundError, ValueError):
+            return
+        if token == self.token:
+            self.path.unlink(missing_ok=True)
+        else:
+            logger.warning(f"Lock {self.path} was broken while it was held")
+
+    def __enter__(self) -> t.Self:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc: object):
+        self.release()
+
+
+class Heartbeat:
+    """Touch `paths` (those that exist) every `interval` seconds, in a thread."""
+
+    def __init__(self, paths: t.Callable[[], list[Path]], interval: float):
+        self.paths = paths
+        self.interval = interval
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            for path in self.paths():
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+
+    def __enter__(self) -> t.Self:
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc: object):
+        self.stop.set()
+        self.thread.join()
+
+
+class Writer:
+    """Registration of a writer as active on arrays and time dimensions."""
+
+    def __init__(self, out: Path, stale: float):
+        self.dir = out / WRITERS_DIR
+        self.id = uuid.uuid4().hex
+        self.path = self.dir / f"{self.id}.json"
+        self.stale = stale
+
+    def register(self, arrays: list[str], time_dims: list[str]):
+        self.dir.mkdir(exist_ok=True)
+        self.path.write_text(
+            json.dumps(
+                {
+                    "arrays": arrays,
+                    "time_dims": time_dims,
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                    "since": now_iso(),
+                }
+            )
+        )
+
+    def unregister(self):
+        self.path.unlink(missing_ok=True)
+
+    def others(self) -> list[dict[str, t.Any]]:
+        """Registrations of the other live writers."""
+        if not self.dir.exists():
+            return []
+        others = []
+        for path in self.dir.glob("*.json"):
+            if path == self.path or not is_fresh(path, self.stale):
+                continue
+            try:
+                others.append(json.loads(path.read_text()))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return others
+
+
+def array_dims(arr: zarr.Array) -> list[str]:
+    return list(arr.attrs.get("_ARRAY_DIMENSIONS", []))
+
+
+def stored_times(arr: zarr.Array) -> np.ndarray:
+    """Decoded values of a stored time coordinate."""
+    units = arr.attrs.get("units", "")
+    if "since" not in units:
+        return arr[...]
+    return decode_cf_datetime(arr[...], units, arr.attrs.get("calendar"))
+
+
+def write_times(arr: zarr.Array, values: np.ndarray):
+    if np.issubdtype(values.dtype, np.datetime64):
+        values, _, _ = encode_cf_datetime(
+            values, arr.attrs["units"], arr.attrs.get("calendar")
+        )
+    arr.resize(len(values))
+    arr[...] = np.asarray(values).astype(arr.dtype)
+
+
+def move_time_steps(
+    store: zarr.DirectoryStore,
+    arr: zarr.Array,
+    axis: int,
+    moves: np.ndarray,
+):
+    """
+    Move the stored time steps `i` of `arr` (already resized) to `moves[i]`,
+    which are increasing and not before `i`.
+    """
+    if arr.chunks[axis] != 1:
+        values = arr[...]
+        moved = np.full_like(values, 0 if arr.fill_value is None else arr.fill_value)
+        index = [slice(None)] * arr.ndim
+        index[axis] = moves
+        moved[tuple(index)] = np.take(values, np.arange(len(moves)), axis=axis)
+        arr[...] = moved
+        return
+    others = [
+        range(-(-n // c))
+        for i, (n, c) in enumerate(zip(arr.shape, arr.chunks))
+        if i != axis
+    ]
+    for old in reversed(range(len(moves))):
+        new = int(moves[old])
+        if new == old:
+            continue
+        for rest in np.ndindex(*map(len, others)):
+            src = list(rest)
+            src.insert(axis, old)
+            dst = list(rest)
+            dst.insert(axis, new)
+            src_key = arr._chunk_key(tuple(src))
+            dst_key = arr._chunk_key(tuple(dst))
+            if src_key in store:
+                store.rename(src_key, dst_key)
+            elif dst_key in store:
+                del store[dst_key]
+
+
+def moved_slabs(
+    slabs: dict[str, dict[str, t.Any]], moves: np.ndarray
+) -> dict[str, dict[str, t.Any]]:
+    """Manifest slabs with their (leading) time index moved."""
+    moved = {}
+    for key, slab in slabs.items():
+        index = [int(i) for i in key.split(".")]
+        index[0] = int(moves[index[0]])
+        moved[mf.slab_key(tuple(index))] = slab
+    return moved
+
+
+def merge_attrs(
+    existing: dict[str, t.Any], new: dict[str, t.Any], group: zarr.Group
+) -> dict[str, t.Any]:
+    """
+    Root attributes of a store with `new` written into it: the axes,
+    datavars and vectors of both, the times of the store's time axes and
+    the titles and projection of the first writer.
+    """
+    from .dataset_model import Dataset
+
+    attrs = {**new, **existing}
+    for key in ("lons", "lats", "levels", "datavars", "vectors"):
+        attrs[key] = {**existing.get(key, {}), **new[key]}
+    attrs["times"] = {
+        name: [format_to_iso(v) for v in stored_times(group[name])]
+        for name in {**existing.get("times", {}), **new["times"]}
+    }
+    return Dataset(**attrs).model_dump()
+
+
+def create_array(
+    group: zarr.Group,
+    name: str,
+    var: xr.DataArray,
+    shape: tuple[int, ...],
+    chunks: tuple[int, ...],
+    fill_value: t.Any,
+):
+    arr = group.create(
+        name,
+        shape=shape,
+        chunks=chunks,
+        dtype=var.dtype,
+        fill_value=fill_value,
+        compressor=zarr.storage.default_compressor,
+    )
+    attrs = {k: encode_zarr_attr_value(v) for k, v in var.attrs.items()}
+    attrs["_ARRAY_DIMENSIONS"] = list(var.dims)
+    coordinates = [str(c) for c in var.coords if c not in var.dims]
+    if coordinates:
+        attrs["coordinates"] = " ".join(sorted(coordinates))
+    arr.attrs.update(attrs)
+
+
+def shared_write(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    out: Path,
+    profiler: Profiler,
+    poll: float = 1.0,
+    timeout: float | None = None,
+    stale: float = 600.0,
+):
+    """
+    Write the `metadata` variables of `ds` into the store at `out`, which
+    other `shared_write` calls may be writing into at the same time.
+
+    Writers must write disjoint slabs: different variables or time steps.
+    A writer needing to move or re-pack data other writers are writing
+    waits up to `timeout` seconds (None: for ever) for them to finish.
+    """
+    import dask.array as da
+
+    out.mkdir(parents=True, exist_ok=True)
+    lock = StoreLock(out / LOCK_NAME, poll, timeout, stale)
+    writer = Writer(out, stale)
+
+    prepared = {}
+    for name, dataarray in metadata["datavars"].items():
+        prepared[name] = prepare_variable(ds, name, dataarray, profiler)
+    time_dims = {
+        dv["time"]: str(ds[dv["time"]].dims[0])
+        for dv in metadata["datavars"].values()
+        if dv["time"]
+    }
+    attrs = dataset_attrs(ds, metadata, profiler)
+
+    def refreshed() -> list[Path]:
+        return [writer.path] + ([lock.path] if lock.held else [])
+
+    with Heartbeat(refreshed, stale / 4):
+        try:
+            with profiler.stage("reserve"):
+                plan = reserve(
+                    ds,
+                    metadata,
+                    out,
+                    prepared,
+                    time_dims,
+                    attrs,
+                    lock,
+                    writer,
+                    profiler,
+                )
+
+            var_names = {dv["arrName"]: n for n, dv in metadata["datavars"].items()}
+            store = open_store(out, profiler, var_names)
+            group = zarr.open_group(store, mode="r+")
+            sources, targets, regions = [], [], []
+            written: dict[str, dict[str, dict[str, t.Any]]] = {}
+            for name, dataarray in metadata["datavars"].items():
+                arr_name = dataarray["arrName"]
+                var, chunks, slabs = prepared[name]
+                packed = pack_variable(var, plan["packing"][arr_name], profiler, name)
+                stored = plan["slabs"].get(arr_name, {})
+                written[arr_name] = {}
+                for key, slab in slabs.items():
+                    index = [int(i) for i in key.split(".")] if len(chunks) > 2 else []
+                    if dataarray["time"]:
+                        index[0] = int(plan["positions"][dataarray["time"]][index[0]])
+                    store_key = mf.slab_key(tuple(index))
+                    written[arr_name][store_key] = slab
+                    if stored.get(store_key, {}).get("hash") == slab["hash"]:
+                        continue
+                    sources.append(packed.data[mf.slab_region(key, chunks)])
+                    targets.append(group[arr_name])
+                    regions.append(mf.slab_region(store_key, chunks))
+
+            profile_compressors(profiler, targets)
+            with profiler.stage("store"):
+                if sources:
+                    da.store(sources, targets, regions=regions, lock=False)
+                logger.info(f"Wrote {len(sources)} slab(s) into {out}")
+
+            with profiler.stage("commit"), lock:
+                commit(ds, out, plan, written, attrs)
+        finally:
+            writer.unregister()
+
+
+@dataclass
+class Reservation:
+    """What a writer needs to change in the store before writing its slabs."""
+
+    store: zarr.DirectoryStore
+    group: zarr.Group
+    manifest: dict[str, t.Any]
+    merged: dict[str, np.ndarray]  # merged values of each time axis
+    moves: dict[str, np.ndarray]  # new positions of its stored steps
+    positions: dict[str, np.ndarray]  # positions of the writer's steps
+    shifted: set[str]  # time dimensions whose stored steps move
+    ranges: dict[str, dict[str, float]]  # packing range of each array
+    widened: set[str]  # arrays whose packing range is widened
+
+
+def plan_reservation(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    out: Path,
+    prepared: dict[str, t.Any],
+    time_dims: dict[str, str],
+    attrs: dict[str, t.Any],
+) -> Reservation:
+    store = zarr.DirectoryStore(out)
+    group = zarr.open_group(store, mode="a")
+    existing = group.attrs.asdict()
+    if "projection" in existing and existing["projection"] != attrs["projection"]:
+        raise ValueError(
+            f"Projection {attrs['projection']} differs from the one of {out}"
+        )
+    manifest: dict[str, t.Any] | None = mf.load_manifest(store)
+    if manifest is None:
+        if any(True for _ in group.arrays()):
+            raise ValueError(f"{out} was not written by vizima (no manifest)")
+        manifest = {"version": mf.MANIFEST_VERSION, "variables": {}}
+
+    merged, moves, positions = {}, {}, {}
+    for time_name in time_dims:
+        new = ds[time_name].values
+        old = stored_times(group[time_name]) if time_name in group else None
+        merged[time_name] = new if old is None else np.union1d(old, new)
+        if old is not None:
+            moves[time_name] = np.searchsorted(merged[time_name], old)
+        positions[time_name] = np.searchsorted(merged[time_name], new)
+    shifted = {
+        time_dims[n]
+        for n, m in moves.items()
+        if not np.array_equal(m, np.arange(len(m)))
+    }
+
+    ranges, widened = {}, set()
+    for name, dataarray in metadata["datavars"].items():
+        arr_name = dataarray["arrName"]
+        var, _, slabs = prepared[name]
+        data_range = mf.slabs_range(slabs)
+        entry = manifest["variables"].get(arr_name)
+        if arr_name in group and entry is None:
+            raise ValueError(f"{arr_name} of {out} is not in its manifest")
+        if entry is None:
+            ranges[arr_name] = source_packing_range(var, data_range) or dict(
+                zip(("min", "max"), data_range or (0.0, 0.0))
+            )
+        elif data_range is None or mf.reusable_packing(entry, data_range):
+            ranges[arr_name] = entry["packing"]
+        else:
+            ranges[arr_name] = {
+                "min": min(entry["packing"]["min"], data_range[0]),
+                "max": max(entry["packing"]["max"], data_range[1]),
+            }
+            widened.add(arr_name)
+    return Reservation(
+        store, group, manifest, merged, moves, positions, shifted, ranges, widened
+    )
+
+
+def apply_reservation(
+    r: Reservation,
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    out: Path,
+    prepared: dict[str, t.Any],
+    time_dims: dict[str, str],
+    profiler: Profiler,
+) -> dict[str, dict[str, float]]:
+    """Grow and shift the time axes, create the missing arrays and re-pack
+    widened ones. Returns the packing of the writer's arrays."""
+    import dask.array as da
+
+    store, group, manifest = r.store, r.group, r.manifest
+    packing = {}
+    for name, dataarray in metadata["datavars"].items():
+        arr_name = dataarray["arrName"]
+        if arr_name in group and arr_name not in r.widened:
+            packing[arr_name] = {
+                k: group[arr_name].attrs[k] for k in ("scale_factor", "add_offset")
+            }
+        else:
+            packing[arr_name] = packing_params_from_range(
+                r.ranges[arr_name]["min"], r.ranges[arr_name]["max"]
+            )
+    out_vars = {
+        dv["arrName"]: pack_variable(
+            prepared[n][0], packing[dv["arrName"]], profiler, n
+        )
+        for n, dv in metadata["datavars"].items()
+    }
+    coords = xr.Dataset(out_vars).coords
+
+    # time axes: grow (and shift) every array along them
+    for time_name, values in r.merged.items():
+        dim = time_dims[time_name]
+        if time_name not in group:
+            time_coord = xr.Dataset(
+                coords={time_name: (dim, values, ds[time_name].attrs)}
+            )
+            time_coord[time_name].encoding = {
+                k: v
+                for k, v in ds[time_name].encoding.items()
+                if k in ("units", "calendar", "dtype")
+            }
+            time_coord.to_zarr(store, mode="a", consolidated=False)
+            continue
+        for arr_name, arr in group.arrays():
+            dims = array_dims(arr)
+            if dim not in dims or arr_name == time_name:
+                continue
+            axis = dims.index(dim)
+            arr.resize(
+                *(len(values) if i == axis else n for i, n in enumerate(arr.shape))
+            )
+            if dim in r.shifted:
+                move_time_steps(store, arr, axis, r.moves[time_name])
+        write_times(group[time_name], values)
+        if dim in r.shifted:
+            logger.info(f"Moved the stored steps of {time_name} for new ones")
+            for arr_name, entry in manifest["variables"].items():
+                if array_dims(group[arr_name])[:1] == [dim]:
+                    entry["slabs"] = moved_slabs(entry["slabs"], r.moves[time_name])
+
+    # missing coordinates and arrays
+    sizes = {dim: len(r.merged[n]) for n, dim in time_dims.items()}
+    static = {
+        name: coord.variable
+        for name, coord in coords.items()
+        if name not in group and not set(coord.dims) & set(sizes)
+    }
+    if static:
+        xr.Dataset(coords=static).to_zarr(store, mode="a", consolidated=False)
+    for name, coord in coords.items():
+        if name in group or name in r.merged or not set(coord.dims) & set(sizes):
+            continue
+        if not np.issubdtype(coord.dtype, np.number):
+            logger.warning(f"{name}: only numeric time-varying coords can be shared")
+            continue
+        shape = tuple(sizes.get(d, n) for d, n in zip(coord.dims, coord.shape))
+        chunks = tuple(1 if d in sizes else n for d, n in zip(coord.dims, shape))
+        fill = np.nan if np.issubdtype(coord.dtype, np.floating) else 0
+        create_array(group, str(name), coord, shape, chunks, fill)
+
+    for name, dataarray in metadata["datavars"].items():
+        arr_name = dataarray["arrName"]
+        var, chunks, _ = prepared[name]
+        shape = tuple(sizes.get(d, n) for d, n in zip(var.dims, var.shape))
+        if arr_name not in group:
+            create_array(group, arr_name, out_vars[arr_name], shape, chunks, FILL_VALUE)
+            manifest["variables"][arr_name] = {
+                "shape": list(shape),
+                "chunks": list(chunks),
+                "coords": "",
+                "slabs": {},
+            }
+        elif group[arr_name].shape != shape or array_dims(group[arr_name]) != list(
+            var.dims
+        ):
+            raise ValueError(
+                f"{arr_name} of {out} has shape {group[arr_name].shape}, not {shape}"
+            )
+        if arr_name in r.widened:
+            logger.info(f"{arr_name}: widening packing range to {r.ranges[arr_name]}")
+            target = group[arr_name]
+            old = {k: target.attrs[k] for k in ("scale_factor", "add_offset")}
+            with profiler.stage("repack", name):
+                da.store(
+                    da.from_zarr(target).map_blocks(
+                        repack_block, old, packing[arr_name], dtype=np.int16
+                    ),
+                    target,
+                    lock=False,
+                )
+        # packed integers written as they are keep their exact packing
+        packing[arr_name] = {k: out_vars[arr_name].attrs[k] for k in packing[arr_name]}
+        group[arr_name].attrs.update(packing[arr_name])
+        entry = manifest["variables"][arr_name]
+        entry["packing"] = r.ranges[arr_name]
+        entry["encoding"] = encoding_hash(packing[arr_name])
+
+    mf.save_manifest(store, manifest)
+    return packing
+
+
+def reserve(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    out: Path,
+    prepared: dict[str, t.Any],
+    time_dims: dict[str, str],
+    attrs: dict[str, t.Any],
+    lock: StoreLock,
+    writer: Writer,
+    profiler: Profiler,
+) -> dict[str, t.Any]:
+    """
+    Under the lock, prepare the store for the writer's slabs and register
+    it. Returns the positions of its times along the store's time axes,
+    the packing of its arrays and the slabs already stored.
+    """
+    start = time.monotonic()
+    waiting = False
+    while True:
+        with lock:
+            r = plan_reservation(ds, metadata, out, prepared, time_dims, attrs)
+            busy = [
+                o
+                for o in writer.others()
+                if r.shifted & set(o["time_dims"]) or r.widened & set(o["arrays"])
+            ]
+            if not busy:
+                packing = apply_reservation(
+                    r, ds, metadata, out, prepared, time_dims, profiler
+                )
+                arr_names = [dv["arrName"] for dv in metadata["datavars"].values()]
+                writer.register(arr_names, sorted(set(time_dims.values())))
+                return {
+                    "positions": r.positions,
+                    "packing": packing,
+                    "slabs": {
+                        n: r.manifest["variables"][n]["slabs"] for n in arr_names
+                    },
+                }
+        if not waiting:
+            logger.info(
+                f"Waiting for {len(busy)} writer(s) of {out} to finish before "
+                "moving or re-packing what they write"
+            )
+            waiting = True
+        if lock.timeout is not None and time.monotonic() - start > lock.timeout:
+            raise TimeoutError(f"Writers of {out} still active after {lock.timeout}s")
+        time.sleep(lock.poll)
+
+
+def commit(
+    ds: xr.Dataset,
+    out: Path,
+    plan: dict[str, t.Any],
+    written: dict[str, dict[str, dict[str, t.Any]]],
+    attrs: dict[str, t.Any],
+):
+    """Under the lock, record the writer's slabs, coordinates and attributes."""
+    store = zarr.DirectoryStore(out)
+    group = zarr.open_group(store, mode="r+")
+    manifest = mf.load_manifest(store)
+    assert manifest is not None
+
+    for arr_name, slabs in written.items():
+        entry = manifest["variables"][arr_name]
+        entry["slabs"].update(slabs)
+        entry["shape"] = list(group[arr_name].shape)
+
+    # time-varying coordinates, at the writer's time steps
+    time_dims = {str(ds[n].dims[0]): n for n in plan["positions"]}
+    for name, arr in group.arrays():
+        dims = array_dims(arr)
+        if name in plan["positions"] or name not in ds.variables:
+            continue
+        if name in manifest["variables"] or not set(dims) & set(time_dims):
+            continue
+        if not np.issubdtype(ds[name].dtype, np.number):
+            continue
+        index = tuple(
+            plan["positions"][time_dims[d]] if d in time_dims else slice(None)
+            for d in dims
+        )
+        arr.oindex[index] = ds[name].values.astype(arr.dtype)
+
+    group.attrs.put(merge_attrs(group.attrs.asdict(), attrs, group))
+    updated = xr.open_zarr(store, consolidated=False)
+    for arr_name, entry in manifest["variables"].items():
+        entry["coords"] = mf.coords_hash(updated[arr_name])
+    mf.save_manifest(store, manifest)
+    zarr.consolidate_metadata(store)
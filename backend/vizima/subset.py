@@ -0,0 +1,180 @@
+"""
+Regional, temporal and vertical subsetting of a source dataset.
+
+A bounding box, time range and list of levels are resolved to index ranges
+on the dimensions of the datavars' coordinates, and the dataset is sliced
+with `isel` before anything is read. The source arrays are lazy, so only the
+selected hyperslabs (the source chunks overlapping them) are ever read, and
+the lon/lat/time/level summaries of the store are computed on the subset.
+"""
+
+import logging
+import typing as t
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+Indexers = dict[t.Hashable, slice | np.ndarray]
+
+
+def parse_bbox(text: str) -> tuple[float, float, float, float]:
+    """`WEST,SOUTH,EAST,NORTH` in degrees; WEST > EAST crosses the dateline."""
+    try:
+        west, south, east, north = (float(v) for v in text.split(","))
+    except ValueError:
+        raise ValueError(f"bbox must be WEST,SOUTH,EAST,NORTH. Got {text!r}")
+    if south > north:
+        raise ValueError(f"bbox south ({south}) is north of its north ({north})")
+    return west, south, east, north
+
+
+def parse_time_range(text: str) -> tuple[pd.Timestamp | None, pd.Timestamp | None]:
+    """`START/END` ISO 8601 times, both inclusive; either may be left empty."""
+    start, sep, end = text.partition("/")
+    if not sep:
+        raise ValueError(f"time range must be START/END. Got {text!r}")
+    return (
+        pd.Timestamp(start) if start else None,
+        pd.Timestamp(end) if end else None,
+    )
+
+
+def in_lon_range(lon: np.ndarray, west: float, east: float) -> np.ndarray:
+    """Mask of the longitudes east of `west` and west of `east`, modulo 360."""
+    width = (east - west) % 360.0
+    if width == 0 and east != west:
+        width = 360.0
+    return (lon - west) % 360.0 <= width
+
+
+def index_range(mask: np.ndarray, what: str) -> slice:
+    """Smallest slice covering the True values of `mask`."""
+    (found,) = np.nonzero(mask)
+    if not found.size:
+        raise ValueError(f"No {what} inside the selection")
+    return slice(int(found[0]), int(found[-1]) + 1)
+
+
+def merge_indexers(indexers: Indexers, new: Indexers) -> Indexers:
+    for dim, index in new.items():
+        old = indexers.get(dim)
+        if old is not None and isinstance(old, slice) and isinstance(index, slice):
+            index = slice(min(old.start, index.start), max(old.stop, index.stop))
+        indexers[dim] = index
+    return indexers
+
+
+def lon_indexer(lon: np.ndarray, west: float, east: float) -> slice | np.ndarray:
+    """
+    Columns of the 1-D longitudes `lon` inside [west, east]. A selection
+    running over the end of a global grid (across its seam) is returned as
+    the indices in west-to-east order.
+    """
+    (found,) = np.nonzero(in_lon_range(lon, west, east))
+    if not found.size:
+        raise ValueError("No longitude inside the selection")
+    if found[-1] - found[0] + 1 == found.size:
+        return slice(int(found[0]), int(found[-1]) + 1)
+    gap = int(np.argmax(np.diff(found)))
+    return np.concatenate([found[gap + 1 :], found[: gap + 1]])
+
+
+def bbox_indexers(
+    ds: xr.Dataset, lon_name: str, lat_name: str, bbox: tuple[float, ...]
+) -> Indexers:
+    """Index ranges of the grid of `lon_name`/`lat_name` covering `bbox`."""
+    west, south, east, north = bbox
+    lon, lat = ds[lon_name], ds[lat_name]
+    if lon.ndim == 1 and lat.ndim == 1:
+        return {
+            lon.dims[0]: lon_indexer(lon.values, west, east),
+            lat.dims[0]: index_range(
+                np.asarray((lat.values >= south) & (lat.values <= north)), "latitude"
+            ),
+        }
+    # curvilinear: the rectangle of rows and columns holding every point
+    # inside the box; leading (e.g. time) dimensions of the coordinates are
+    # assumed not to move the grid
+    lon = lon.isel({d: 0 for d in lon.dims[:-2]})
+    lat = lat.isel({d: 0 for d in lat.dims[:-2]})
+    if lon.dims != lat.dims or lon.ndim != 2:
+        raise ValueError(f"{lon_name} and {lat_name} are not on the same 2-D grid")
+    inside = in_lon_range(lon.values, west, east)
+    inside &= (lat.values >= south) & (lat.values <= north)
+    ydim, xdim = lon.dims
+    return {
+        ydim: index_range(np.asarray(inside.any(axis=1)), "grid point"),
+        xdim: index_range(np.asarray(inside.any(axis=0)), "grid point"),
+    }
+
+
+def time_indexers(ds: xr.Dataset, name: str, start, end) -> Indexers:
+    time = ds[name]
+    if time.ndim != 1:
+        return {}
+    values = pd.to_datetime(time.values)
+    mask = np.ones(values.shape, dtype=bool)
+    if start is not None:
+        mask &= values >= start
+    if end is not None:
+        mask &= values <= end
+    return {time.dims[0]: index_range(mask, f"{name} step")}
+
+
+def level_indexers(ds: xr.Dataset, name: str, levels: list[float]) -> Indexers:
+    level = ds[name]
+    if level.ndim != 1:
+        raise ValueError(f"Levels can only be selected on 1-D coordinates: {name}")
+    found = []
+    for value in levels:
+        (match,) = np.nonzero(np.isclose(level.values, value))
+        if not match.size:
+            raise ValueError(f"Level {value} not found in {name}")
+        found.append(int(match[0]))
+    return {level.dims[0]: np.array(sorted(set(found)))}
+
+
+def subset_dataset(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    bbox: tuple[float, float, float, float] | None = None,
+    time_range: tuple[pd.Timestamp | None, pd.Timestamp | None] | None = None,
+    levels: list[float] | None = None,
+) -> xr.Dataset:
+    """
+    Lazily select the part of `ds` inside `bbox` (west, south, east, north),
+    `time_range` (start, end, inclusive) and at `levels`, on the coordinates
+    the datavars of `metadata` refer to.
+    """
+    indexers: Indexers = {}
+    datavars = metadata["datavars"].values()
+    if bbox is not None:
+        grids = {(v["lon"], v["lat"]) for v in datavars if v["lon"] and v["lat"]}
+        for lon_name, lat_name in sorted(grids):
+            merge_indexers(indexers, bbox_indexers(ds, lon_name, lat_name, bbox))
+    if time_range is not None:
+        for name in sorted({v["time"] for v in datavars if v["time"]}):
+            merge_indexers(indexers, time_indexers(ds, name, *time_range))
+    if levels:
+        for name in sorted({v["level"] for v in datavars if v["level"]}):
+            merge_indexers(indexers, level_indexers(ds, name, levels))
+
+    subset = ds.isel(indexers)
+    logger.info(
+        "Subset "
+        + ", ".join(f"{d}: {ds.sizes[d]} -> {subset.sizes[d]}" for d in indexers)
+    )
+
+    if bbox is not None:
+        # longitudes selected across a seam continue east of it
+        west = bbox[0]
+        for lon_name in {v["lon"] for v in datavars if v["lon"]}:
+            lon = subset[lon_name]
+            dim = lon.dims[0] if lon.ndim == 1 else None
+            if dim is not None and isinstance(indexers.get(dim), np.ndarray):
+                wrapped = west + (lon.values - west) % 360.0
+                subset = subset.assign_coords({lon_name: (dim, wrapped, lon.attrs)})
+    return subset
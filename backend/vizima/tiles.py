@@ -0,0 +1,373 @@
+"""
+Pre-rendered, colormapped image tiles of a processed store.
+
+Tiles are written as RGBA PNG files, with missing values transparent, in
+one of two layouts:
+- native: `<arrName>/<leading indices>/<row>/<col>.png`, tiles of the grid
+  itself, north up.
+- xyz: `<arrName>/<leading indices>/<z>/<x>/<y>.png`, web-mercator tiles of
+  a LonLat grid, for standard map clients.
+Every slab is colormapped in one vectorized pass; the tiles are then cut
+from (or gathered out of) the colored slab. The content hash of each tile's
+pixels is kept in `tiles.json`, so unchanged tiles are not encoded or
+written again.
+"""
+
+import json
+import logging
+import math
+import multiprocessing
+import struct
+import typing as t
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import zarr
+
+from .manifest import hash_bytes
+from .vizimacli import FILL_VALUE, Colormap, TileLayout, range_from_packing_params
+
+logger = logging.getLogger(__name__)
+
+TILES_MANIFEST = "tiles.json"
+XYZ_TILE_SIZE = 256
+
+# colors at evenly spaced stops; viridis matches the frontend painters
+COLORMAP_STOPS = {
+    Colormap.viridis: [
+        "#440154",
+        "#482878",
+        "#3e4989",
+        "#31688e",
+        "#26828e",
+        "#1f9e89",
+        "#35b779",
+        "#6ece58",
+        "#fde725",
+    ],
+    Colormap.magma: [
+        "#000004",
+        "#1c1044",
+        "#4f127b",
+        "#812581",
+        "#b5367a",
+        "#e55064",
+        "#fb8761",
+        "#fec287",
+        "#fcfdbf",
+    ],
+    Colormap.greys: ["#000000", "#ffffff"],
+}
+
+
+def colormap_lut(colormap: Colormap, n: int = 256) -> np.ndarray:
+    """(n, 4) uint8 RGBA lookup table of `colormap`."""
+    stops = np.array(
+        [[int(c[i : i + 2], 16) for i in (1, 3, 5)] for c in COLORMAP_STOPS[colormap]],
+        dtype=np.float64,
+    )
+    positions = np.linspace(0, 1, len(stops))
+    x = np.linspace(0, 1, n)
+    lut = np.full((n, 4), 255, dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.round(np.interp(x, positions, stops[:, channel]))
+    return lut
+
+
+def colorize(
+    packed: np.ndarray,
+    scale_factor: float,
+    add_offset: float,
+    vmin: float,
+    vmax: float,
+    lut: np.ndarray,
+) -> np.ndarray:
+    """
+    RGBA image of a packed field, with values in [vmin, vmax] spread over
+    `lut` (clamped outside) and missing values transparent.
+
+    The value range is converted to packed units, so the field itself is
+    never unpacked.
+    """
+    low = (vmin - add_offset) / scale_factor
+    step = (vmax - vmin) / scale_factor / (len(lut) - 1) or 1.0
+    index = np.clip(
+        np.rint((packed - np.float32(low)) / np.float32(step)), 0, len(lut) - 1
+    )
+    rgba = lut[index.astype(np.intp)]
+    rgba[packed == FILL_VALUE] = 0
+    return rgba
+
+
+def encode_png(rgba: np.ndarray, level: int = 6) -> bytes:
+    """PNG file of an (h, w, 4) uint8 image."""
+    height, width = rgba.shape[:2]
+    # filter type 0 (none) at the start of every row
+    raw = np.zeros((height, 1 + width * 4), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", header),
+            chunk(b"IDAT", zlib.compress(raw.tobytes(), level)),
+            chunk(b"IEND", b""),
+        ]
+    )
+
+
+def native_tiles(
+    rgba: np.ndarray, tile_size: int
+) -> t.Iterator[tuple[str, np.ndarray]]:
+    """(row/col, tile) of an image cut into `tile_size` tiles; edge tiles are smaller."""
+    ny, nx = rgba.shape[:2]
+    for row in range(-(-ny // tile_size)):
+        for col in range(-(-nx // tile_size)):
+            yield (
+                f"{row}/{col}",
+                rgba[
+                    row * tile_size : (row + 1) * tile_size,
+                    col * tile_size : (col + 1) * tile_size,
+                ],
+            )
+
+
+def axis_index(
+    values: np.ndarray, start: float, step: float, count: int, periodic: bool
+):
+    """Nearest index on a regular axis of each value, or -1 outside it."""
+    index = np.rint((values - start) / step).astype(np.int64)
+    if periodic:
+        return index % count
+    return np.where((index >= 0) & (index < count), index, -1)
+
+
+def xyz_index(
+    lon: np.ndarray, lat: np.ndarray, zoom: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Grid column of every pixel column and grid row of every pixel row of
+    the web-mercator world at `zoom` (-1 where outside the grid).
+
+    A LonLat grid is separable, so the pixels of a tile are the outer
+    product of these two index vectors.
+    """
+    npix = XYZ_TILE_SIZE * 2**zoom
+    centers = (np.arange(npix) + 0.5) / npix
+    pixel_lon = centers * 360.0 - 180.0
+    pixel_lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * centers))))
+
+    dlon = float(lon[1] - lon[0]) if len(lon) > 1 else 360.0
+    periodic = bool(np.isclose(abs(dlon) * len(lon), 360.0))
+    # longitudes as offsets east of the first grid longitude
+    offsets = (pixel_lon - lon[0]) % 360.0 if dlon > 0 else (lon[0] - pixel_lon) % 360.0
+    cols = axis_index(offsets, 0.0, abs(dlon), len(lon), periodic)
+    if not periodic:
+        # the half cell west of the first longitude wraps to just below 360
+        cols = np.where(offsets > 360.0 - abs(dlon) / 2, 0, cols)
+    dlat = float(lat[1] - lat[0]) if len(lat) > 1 else 180.0
+    rows = axis_index(pixel_lat, float(lat[0]), dlat, len(lat), False)
+    return cols, rows
+
+
+def xyz_tiles(
+    rgba: np.ndarray, indices: dict[int, tuple[np.ndarray, np.ndarray]]
+) -> t.Iterator[tuple[str, np.ndarray]]:
+    """(z/x/y, tile) of the XYZ tiles overlapping the grid, at every zoom of `indices`."""
+    size = XYZ_TILE_SIZE
+    for zoom, (cols, rows) in indices.items():
+        for x in range(2**zoom):
+            tile_cols = cols[x * size : (x + 1) * size]
+            if np.all(tile_cols < 0):
+                continue
+            for y in range(2**zoom):
+                tile_rows = rows[y * size : (y + 1) * size]
+                if np.all(tile_rows < 0):
+                    continue
+                tile = rgba[tile_rows[:, None], tile_cols[None, :]]
+                tile[(tile_rows[:, None] < 0) | (tile_cols[None, :] < 0)] = 0
+                yield f"{zoom}/{x}/{y}", tile
+
+
+def default_max_zoom(lon: np.ndarray) -> int:
+    """Zoom at which a tile pixel is about one grid cell wide at the equator."""
+    dlon = abs(float(lon[1] - lon[0])) if len(lon) > 1 else 360.0
+    return max(0, math.ceil(math.log2(360.0 / (dlon * XYZ_TILE_SIZE))))
+
+
+def render_slab(
+    store: str,
+    arr_name: str,
+    slab: tuple[int, ...],
+    style: dict[str, t.Any],
+    layout: TileLayout,
+    tiling: t.Any,
+    out: Path,
+    known: dict[str, str],
+) -> tuple[dict[str, str], int]:
+    """
+    Render the tiles of one slab of `arr_name` into `out`.
+
+    `tiling` is the tile size (native) or the per-zoom pixel indices (xyz).
+    Tiles whose pixel hash is in `known` are left alone, and tiles with no
+    data are removed. Returns the hashes of the slab's tiles and the number
+    of tiles written.
+    """
+    arr = zarr.open_consolidated(store, mode="r")[arr_name]
+    rgba = colorize(
+        arr[slab],
+        arr.attrs["scale_factor"],
+        arr.attrs["add_offset"],
+        style["vmin"],
+        style["vmax"],
+        colormap_lut(style["colormap"]),
+    )
+    if style["flip"]:
+        rgba = rgba[::-1]
+    tiles = (
+        native_tiles(rgba, tiling)
+        if layout == TileLayout.native
+        else xyz_tiles(rgba, tiling)
+    )
+
+    prefix = "/".join([arr_name, *map(str, slab)])
+    hashes, written = {}, 0
+    for key, tile in tiles:
+        rel = f"{prefix}/{key}.png"
+        path = out / rel
+        if not tile[..., 3].any():
+            path.unlink(missing_ok=True)
+            continue
+        tile = np.ascontiguousarray(tile)
+        digest = hash_bytes(str(tile.shape).encode(), memoryview(tile.reshape(-1)))
+        hashes[rel] = digest
+        if known.get(rel) == digest and path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(encode_png(tile))
+        written += 1
+    return hashes, written
+
+
+def render_tiles(
+    store: Path,
+    out: Path,
+    names: list[str],
+    layout: TileLayout = TileLayout.native,
+    colormap: Colormap = Colormap.viridis,
+    vmin: float | None = None,
+    vmax: float | None = None,
+    tile_size: int = 256,
+    max_zoom: int | None = None,
+    workers: int = 2,
+) -> dict[str, int]:
+    """
+    Render image tiles of the `names` datavars (all if empty) of the
+    processed `store` into `out`, one slab per task on a process pool.
+
+    The value range defaults to each variable's packing range. Returns the
+    number of tiles written per variable.
+    """
+    group = zarr.open_consolidated(str(store), mode="r")
+    attrs = group.attrs.asdict()
+    datavars = attrs["datavars"]
+    unknown = set(names) - set(datavars)
+    if unknown:
+        raise ValueError(f"Unknown variable(s) {sorted(unknown)} in {store}")
+    if layout == TileLayout.xyz and attrs["projection"]["name"] != "LonLat":
+        raise ValueError(
+            "XYZ tiles need a LonLat store; regrid it with process-dataset --regrid-res"
+        )
+
+    manifest_path = out / TILES_MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    known: dict[str, str] = manifest.get("hashes", {})
+    info: dict[str, t.Any] = manifest.get("variables", {})
+    rendered = {datavars[name]["arrName"] for name in names or datavars}
+    # tiles of the variables not rendered now are kept as they are
+    hashes = {k: v for k, v in known.items() if k.split("/", 1)[0] not in rendered}
+    written: dict[str, int] = {}
+
+    tasks = []
+    for name in names or list(datavars):
+        dataarray = datavars[name]
+        arr_name = dataarray["arrName"]
+        arr = group[arr_name]
+        lat = group[dataarray["lat"]][:]
+        low, high = range_from_packing_params(
+            arr.attrs["scale_factor"], arr.attrs["add_offset"]
+        )
+        style = {
+            "colormap": colormap,
+            "vmin": low if vmin is None else vmin,
+            "vmax": high if vmax is None else vmax,
+            # native tiles are north up; xyz pixels are looked up by latitude
+            "flip": layout == TileLayout.native
+            and bool(lat.ravel()[0] < lat.ravel()[-1]),
+        }
+        if layout == TileLayout.native:
+            tiling: t.Any = tile_size
+            zooms = None
+        else:
+            lon = group[dataarray["lon"]][:]
+            zooms = list(
+                range((default_max_zoom(lon) if max_zoom is None else max_zoom) + 1)
+            )
+            tiling = {zoom: xyz_index(lon, lat, zoom) for zoom in zooms}
+        info[name] = {
+            "arrName": arr_name,
+            "layout": layout.value,
+            "colormap": colormap.value,
+            "vmin": style["vmin"],
+            "vmax": style["vmax"],
+            "dims": list(arr.attrs["_ARRAY_DIMENSIONS"][:-2]),
+            "shape": list(arr.shape[-2:]),
+            **({"tileSize": tile_size} if zooms is None else {"zooms": zooms}),
+        }
+        written[name] = 0
+        for slab in np.ndindex(*arr.shape[:-2]):
+            tasks.append((name, arr_name, slab, style, tiling))
+
+    # spawn: forking a process that runs dask/HDF5 threads is unsafe
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = {
+            pool.submit(
+                render_slab,
+                str(store),
+                arr_name,
+                slab,
+                style,
+                layout,
+                tiling,
+                out,
+                {
+                    k: v
+                    for k, v in known.items()
+                    if k.startswith("/".join([arr_name, *map(str, slab)]) + "/")
+                },
+            ): name
+            for name, arr_name, slab, style, tiling in tasks
+        }
+        for future in as_completed(futures):
+            slab_hashes, count = future.result()
+            hashes.update(slab_hashes)
+            written[futures[future]] += count
+
+    out.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(
+        json.dumps(
+            {"variables": info, "hashes": dict(sorted(hashes.items()))}, indent=2
+        )
+    )
+    for name, count in written.items():
+        logger.info(f"{name}: wrote {count} tile(s)")
+    return written
@@ -0,0 +1,229 @@
+"""
+Vertical interpolation of WRF model (eta) levels to pressure or height levels.
+
+Model levels follow the terrain and change with time, so their values mean
+little to a viewer. The 3-D datavars are interpolated, column by column, to
+fixed pressure (hPa, linear in log-pressure) or geopotential height (m)
+levels, lazily, one source slab at a time. The interpolation weights of a
+slab only depend on the vertical coordinate, so they are computed once with
+a vectorized search over all columns and reused, from a byte-bounded LRU
+cache, by every variable on the same levels.
+"""
+
+import logging
+import typing as t
+from dataclasses import dataclass
+
+import numpy as np
+import xarray as xr
+
+from .server import ByteLRU
+from .vizimacli import VerticalCoordinate, decode_packed, get_native_chunks
+
+logger = logging.getLogger(__name__)
+
+# dimension of the WRF model levels (after destaggering)
+MODEL_LEVEL_DIM = "bottom_top"
+GRAVITY = 9.81
+WEIGHTS_CACHE_BYTES = 512 * 2**20
+
+
+@dataclass(frozen=True)
+class Levels:
+    """How to compute a vertical coordinate on the model levels of WRF output."""
+
+    inputs: tuple[str, ...]
+    compute: t.Callable[[xr.Dataset], xr.DataArray]
+    # makes the coordinate increase with the model level
+    increasing: t.Callable[[t.Any], t.Any]
+    attrs: dict[str, str]
+
+
+LEVELS = {
+    VerticalCoordinate.pressure: Levels(
+        inputs=("P", "PB"),
+        compute=lambda ds: (decode_packed(ds["P"]) + decode_packed(ds["PB"])) / 100,
+        increasing=lambda p: -np.log(p),
+        attrs={
+            "units": "hPa",
+            "standard_name": "air_pressure",
+            "long_name": "Pressure",
+            "positive": "down",
+            "axis": "Z",
+        },
+    ),
+    VerticalCoordinate.height: Levels(
+        inputs=("PH", "PHB"),
+        compute=lambda ds: (
+            (decode_packed(ds["PH"]) + decode_packed(ds["PHB"])) / GRAVITY
+        ),
+        increasing=lambda z: z,
+        attrs={
+            "units": "m",
+            "standard_name": "geopotential_height",
+            "long_name": "Geopotential height",
+            "positive": "up",
+            "axis": "Z",
+        },
+    ),
+}
+
+
+@dataclass
+class Weights:
+    """Lower model level of each target level and column, and the upper's weight."""
+
+    index: np.ndarray
+    weight: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes + self.weight.nbytes
+
+
+def column_weights(coord: np.ndarray, targets: np.ndarray, axis: int) -> Weights:
+    """
+    Linear interpolation weights of `targets` in every column of `coord`
+    along `axis`, which increases with the index. Targets outside a column
+    get a NaN weight.
+    """
+    coord = np.moveaxis(coord, axis, 0)
+    shape = (len(targets), *coord.shape[1:])
+    index = np.empty(shape, dtype=np.int16)
+    weight = np.empty(shape, dtype=np.float32)
+    for i, target in enumerate(targets):
+        # per-column searchsorted: the number of levels at or below the target
+        below = np.count_nonzero(coord <= target, axis=0) - 1
+        k = np.clip(below, 0, coord.shape[0] - 2)[np.newaxis]
+        lower = np.take_along_axis(coord, k, 0)[0]
+        upper = np.take_along_axis(coord, k + 1, 0)[0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = (target - lower) / (upper - lower)
+        w[(below < 0) | (target > coord[-1])] = np.nan
+        index[i], weight[i] = k[0], w
+    return Weights(np.moveaxis(index, 0, axis), np.moveaxis(weight, 0, axis))
+
+
+def interpolate_block(block: np.ndarray, weights: Weights, axis: int) -> np.ndarray:
+    lower = np.take_along_axis(block, weights.index, axis)
+    upper = np.take_along_axis(block, weights.index + 1, axis)
+    return (lower + weights.weight * (upper - lower)).astype(np.float32)
+
+
+def interpolate(
+    var: xr.DataArray,
+    coord: xr.DataArray,
+    level: xr.DataArray,
+    targets: np.ndarray,
+    cache: ByteLRU[Weights],
+) -> xr.DataArray:
+    """
+    `var` interpolated, lazily, from the model levels of `coord` to `level`,
+    where `coord` and `targets` (the `level` values) increase with the model
+    level. The weights of each slab are shared through `cache`.
+    """
+    import dask.array as da
+    from dask.base import tokenize
+
+    if set(var.dims) != set(coord.dims):
+        raise ValueError(f"{var.name} is not on the grid of the model levels")
+
+    var = decode_packed(var)
+    axis = var.dims.index(MODEL_LEVEL_DIM)
+    native = dict(zip(var.dims, get_native_chunks(var)))
+    # whole columns and grids in every slab, the native chunks along the rest
+    whole = {MODEL_LEVEL_DIM, *var.dims[-2:]}
+    chunks = {d: -1 if d in whole else native[d] for d in var.dims}
+    data = var.chunk(chunks).data
+    coord_data = coord.transpose(*var.dims).chunk(chunks).data
+
+    def interpolate_chunk(block, coord_block, block_info=None):
+        # dask passes the block info to every block it computes
+        assert block_info is not None
+        key = f"{coord_data.name}/{block_info[1]['chunk-location']}"
+        weights = cache.get(key)
+        if weights is None:
+            weights = column_weights(coord_block, targets, axis)
+            cache.put(key, weights)
+        return interpolate_block(block, weights, axis)
+
+    out_chunks = list(data.chunks)
+    out_chunks[axis] = (len(targets),)
+    result = da.map_blocks(
+        interpolate_chunk,
+        data,
+        coord_data,
+        chunks=tuple(out_chunks),
+        dtype=np.float32,
+        name=f"interpolate-{tokenize(data.name, coord_data.name, targets)}",
+    )
+
+    dims = tuple(level.name if d == MODEL_LEVEL_DIM else d for d in var.dims)
+    coords = {
+        name: c for name, c in var.coords.items() if MODEL_LEVEL_DIM not in c.dims
+    }
+    out = xr.DataArray(
+        result,
+        dims=dims,
+        coords={**coords, level.name: level},
+        name=var.name,
+        attrs=var.attrs,
+    )
+    out.encoding = {
+        "chunksizes": tuple(
+            len(targets) if d == level.name else min(native[d], out.sizes[d])
+            for d in dims
+        )
+    }
+    return out
+
+
+def interpolate_dataset(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    vertical: VerticalCoordinate,
+    values: list[float],
+) -> tuple[xr.Dataset, dict[str, t.Any]]:
+    """
+    Interpolate the datavars of `metadata` on WRF model levels to the
+    `vertical` levels `values`, which become their level axis.
+    """
+    if not values:
+        raise ValueError(f"No {vertical.value} levels to interpolate to")
+    spec = LEVELS[vertical]
+    missing = [name for name in spec.inputs if name not in ds]
+    if missing:
+        raise ValueError(
+            f"Interpolating to {vertical.value} levels needs "
+            f"{', '.join(missing)} in the dataset"
+        )
+
+    # pressure levels from the ground up, like the model levels
+    values = sorted(set(values), reverse=spec.attrs["positive"] == "down")
+    level = xr.DataArray(
+        np.array(values, dtype=np.float64),
+        dims=vertical.value,
+        name=vertical.value,
+        attrs=spec.attrs,
+    )
+    coord = spec.increasing(spec.compute(ds))
+    targets = np.asarray(spec.increasing(level.values))
+    cache: ByteLRU[Weights] = ByteLRU(WEIGHTS_CACHE_BYTES)
+
+    interpolated = {}
+    datavars = {}
+    for name, dataarray in metadata["datavars"].items():
+        arr_name = dataarray["arrName"]
+        if MODEL_LEVEL_DIM in ds[arr_name].dims:
+            if arr_name not in interpolated:
+                interpolated[arr_name] = interpolate(
+                    ds[arr_name], coord, level, targets, cache
+                )
+                logger.info(f"{name}: interpolated to {vertical.value} levels")
+            dataarray = {**dataarray, "level": vertical.value}
+        datavars[name] = dataarray
+
+    ds = ds.assign(interpolated)
+    if not any(MODEL_LEVEL_DIM in ds[d["arrName"]].dims for d in datavars.values()):
+        ds = ds.drop_vars([c for c in ds.coords if MODEL_LEVEL_DIM in ds[c].dims])
+    return ds, {**metadata, "datavars": datavars}
@@ -1,28 +1,38 @@
+# Heavy dependencies (xarray, pandas, numpy, cf_xarray, questionary, pydantic,
+# zarr, dask) are imported inside the functions that need them, so that
+# `--help`, shell completion and short invocations start fast.
+# tests/test_visimacli/test_import_time.py guards this.
+from __future__ import annotations
+
+import glob
 import json
 import logging
+import math
+import threading
 import typing as t
+from enum import Enum
 from pathlib import Path
 
-import cf_xarray as cf  # noqa: F401
-import numpy as np
-import pandas as pd
-import questionary
 import typer
-import xarray as xr
-from pydantic import BaseModel
-
-from .dataset_model import (
-    ConicConformal,
-    Dataset,
-    DataVar,
-    Equirectangular,
-    LatAxis,
-    LonAxis,
-    LonLat,
-    Mercator,
-    Stereographic,
-    VectorVar,
-)
+
+from .profiling import ProfileHook, Profiler
+
+if t.TYPE_CHECKING:
+    import numpy as np
+    import xarray as xr
+    import zarr
+
+    from .dataset_model import (
+        ConicConformal,
+        DataVar,
+        Equirectangular,
+        LatAxis,
+        LonAxis,
+        LonLat,
+        Mercator,
+        Stereographic,
+        VectorVar,
+    )
 
 logging.basicConfig(
     level=logging.INFO,
@@ -34,6 +44,79 @@ logger.setLevel(logging.INFO)
 
 app = typer.Typer(add_completion=False)
 
+FILL_VALUE = -32767
+
+# files opened at once by worker processes, see `open_source_files`
+OPEN_WORKERS = 8
+# below this, opening files one by one is faster than starting the workers
+PARALLEL_OPEN_MIN_FILES = 16
+
+
+class SourceLock:
+    """
+    Reentrant lock of all netCDF-C/HDF5 calls of this process: they are not
+    thread-safe, and xarray does not lock around opening a file. Pickled, it
+    refers to the lock of the process it is unpickled in, so that datasets
+    opened in worker processes are read under the lock of their reader.
+    """
+
+    _lock = threading.RLock()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc: object):
+        self.release()
+
+    def __reduce__(self) -> tuple[type, tuple[()]]:
+        return (SourceLock, ())
+
+
+SOURCE_LOCK = SourceLock()
+
+
+class AggregateStat(str, Enum):
+    mean = "mean"
+    min = "min"
+    max = "max"
+
+
+class ClimatologyPeriod(str, Enum):
+    month = "month"
+    dayofyear = "dayofyear"
+
+
+class Colormap(str, Enum):
+    viridis = "viridis"
+    magma = "magma"
+    greys = "greys"
+
+
+class TileLayout(str, Enum):
+    native = "native"
+    xyz = "xyz"
+
+
+# largest read of a source variable, in bytes of its (undecoded) dtype
+MAX_READ_CHUNK_BYTES = 512 * 2**20
+
+
+class LonConvention(str, Enum):
+    signed = "180"  # -180..180
+    positive = "360"  # 0..360
+
+
+class VerticalCoordinate(str, Enum):
+    pressure = "pressure"  # hPa
+    height = "height"  # m, geopotential
+
+
 WRF_PROJ_ID_MAPPING = {
     1: "ConicConformal",
     2: "Stereographic",
@@ -46,18 +129,284 @@ def get_packing_params(da, n_bits=16):
     """Calculates optimal scale_factor and add_offset for signed packing."""
     data_min = float(da.min().values)
     data_max = float(da.max().values)
+    return packing_params_from_range(data_min, data_max, n_bits)
+
 
-    # Range of a signed n-bit integer
-    n_levels = 2**n_bits - 1
+def packing_params_from_range(data_min: float, data_max: float, n_bits=16):
+    # Range of a signed n-bit integer, keeping the two most negative values
+    # free for _FillValue (-32767) and rounding (-32768)
+    n_levels = 2**n_bits - 4
 
-    scale_factor = (data_max - data_min) / n_levels
-    # Offset is the midpoint to utilize the full signed range (-32768 to 32767)
+    scale_factor = (data_max - data_min) / n_levels or 1.0
+    # Offset is the midpoint to utilize the full signed range (-32766 to 32766)
     add_offset = (data_max + data_min) / 2
 
     return {"scale_factor": scale_factor, "add_offset": add_offset}
 
 
+def range_from_packing_params(
+    scale_factor: float, add_offset: float, n_bits=16
+) -> tuple[float, float]:
+    """Data range the packing was made for (inverse of packing_params_from_range)."""
+    half = (2**n_bits - 4) / 2 * scale_factor
+    return add_offset - half, add_offset + half
+
+
+def pack_block(block: np.ndarray, scale_factor: float, add_offset: float):
+    """Pack a block of floats into int16, with NaNs set to FILL_VALUE."""
+    import numpy as np
+
+    packed = np.round((block - add_offset) / scale_factor)
+    packed[np.isnan(packed)] = FILL_VALUE
+    return packed.astype(np.int16)
+
+
+def repack_block(
+    block: np.ndarray, old: dict[str, float], new: dict[str, float]
+) -> np.ndarray:
+    """Re-pack an int16 block from the `old` to the `new` packing parameters."""
+    import numpy as np
+
+    values = block * old["scale_factor"] + old["add_offset"]
+    values[block == FILL_VALUE] = np.nan
+    return pack_block(values, new["scale_factor"], new["add_offset"])
+
+
+# CF attributes of a variable opened without mask_and_scale
+SOURCE_PACKING_ATTRS = ("scale_factor", "add_offset", "_FillValue", "missing_value")
+
+
+def source_packing(var: xr.DataArray) -> dict[str, t.Any] | None:
+    """
+    Packing of a variable opened without decoding (its CF attributes are
+    still in `attrs`): scale_factor, add_offset and fill_values, or None.
+    """
+    import numpy as np
+
+    if not any(k in var.attrs for k in SOURCE_PACKING_ATTRS):
+        return None
+    fills = [var.attrs[k] for k in ("_FillValue", "missing_value") if k in var.attrs]
+    return {
+        "scale_factor": float(var.attrs.get("scale_factor", 1.0)),
+        "add_offset": float(var.attrs.get("add_offset", 0.0)),
+        "fill_values": sorted({v.item() for v in np.ravel(fills)}),
+    }
+
+
+def decode_block(block: np.ndarray, source: dict[str, t.Any]) -> np.ndarray:
+    """Decode raw packed values to float32, with fill values as NaN."""
+    import numpy as np
+
+    values = block.astype(np.float32)
+    values *= np.float32(source["scale_factor"])
+    values += np.float32(source["add_offset"])
+    values[np.isin(block, source["fill_values"])] = np.nan
+    return values
+
+
+def is_same_packing(
+    dtype: np.dtype, source: dict[str, t.Any], packing: dict[str, float]
+) -> bool:
+    """Whether integers of `dtype` packed as `source` are already packed as `packing`."""
+    import numpy as np
+
+    return (
+        dtype == np.int16
+        and source["fill_values"] == [FILL_VALUE]
+        and all(np.isclose(source[k], packing[k], rtol=1e-9) for k in packing)
+    )
+
+
+def remap_block(
+    block: np.ndarray, source: dict[str, t.Any], packing: dict[str, float]
+) -> np.ndarray:
+    """
+    Re-pack raw integers from their `source` packing to int16 with
+    `packing`, as one affine map in float32. Integers already packed with
+    `packing` are returned unchanged.
+    """
+    import numpy as np
+
+    if is_same_packing(block.dtype, source, packing):
+        return block
+
+    scale = np.float32(source["scale_factor"] / packing["scale_factor"])
+    offset = np.float32(
+        (source["add_offset"] - packing["add_offset"]) / packing["scale_factor"]
+    )
+    values = block.astype(np.float32)
+    values *= scale
+    values += offset
+    packed = np.rint(values, out=values).astype(np.int16)
+    packed[np.isin(block, source["fill_values"])] = FILL_VALUE
+    return packed
+
+
+def decode_packed(var: xr.DataArray) -> xr.DataArray:
+    """
+    Lazily decode a variable opened without decoding (see `open_dataset_files`)
+    to float32; other variables are returned as they are.
+    """
+    import numpy as np
+    import xarray as xr
+
+    source = source_packing(var)
+    if source is None:
+        return var
+    decoded = xr.apply_ufunc(
+        decode_block,
+        var,
+        kwargs={"source": source},
+        dask="parallelized",
+        output_dtypes=[np.float32],
+        keep_attrs=True,
+    )
+    for key in SOURCE_PACKING_ATTRS:
+        decoded.attrs.pop(key, None)
+    # keep the source chunks for read planning
+    decoded.encoding = {
+        k: v
+        for k, v in var.encoding.items()
+        if k in ("chunksizes", "contiguous", "preferred_chunks")
+    }
+    return decoded
+
+
+def source_packing_range(
+    var: xr.DataArray, data_range: tuple[float, float] | None
+) -> dict[str, float] | None:
+    """
+    Packing range (as in the manifest) giving back the int16 packing of an
+    undecoded `var`, if its `data_range` fits it, so its integers can be
+    written as they are.
+    """
+    import numpy as np
+
+    source = source_packing(var)
+    if source is None or var.dtype != np.int16 or data_range is None:
+        return None
+    if source["fill_values"] != [FILL_VALUE]:
+        return None
+    raw = [
+        round((v - source["add_offset"]) / source["scale_factor"]) for v in data_range
+    ]
+    limit = (2**16 - 4) // 2
+    if not all(-limit <= r <= limit for r in raw):
+        return None
+    low, high = range_from_packing_params(source["scale_factor"], source["add_offset"])
+    return {"min": low, "max": high}
+
+
+def pack_variable(
+    var: xr.DataArray,
+    packing: dict[str, float],
+    profiler: Profiler,
+    name: str,
+) -> xr.DataArray:
+    """
+    Lazily pack `var` into int16 with the given packing parameters.
+
+    The packing parameters and _FillValue are stored as attributes, so the
+    array is written as-is and decoded by any CF-aware reader. Integers
+    opened without decoding are re-packed directly, never as float64.
+    """
+    import numpy as np
+    import xarray as xr
+
+    source = source_packing(var)
+    if source is not None and not np.issubdtype(var.dtype, np.integer):
+        var, source = decode_packed(var), None
+    if source is not None and is_same_packing(var.dtype, source, packing):
+        # written as they are: keep the exact source parameters
+        packing = {k: source[k] for k in packing}
+
+    def _pack(block):
+        with profiler.task("pack", name):
+            if source is not None:
+                return remap_block(block, source, packing)
+            return pack_block(block, **packing)
+
+    packed = xr.apply_ufunc(
+        _pack,
+        var,
+        dask="parallelized",
+        output_dtypes=[np.int16],
+        keep_attrs=True,
+    )
+    for key in SOURCE_PACKING_ATTRS:
+        packed.attrs.pop(key, None)
+    packed.attrs.update(packing)
+    packed.encoding = {"_FillValue": FILL_VALUE}
+    return packed
+
+
+def get_native_chunks(var: xr.DataArray) -> tuple[int, ...]:
+    """
+    Chunk shape of `var` in the source file.
+
+    Contiguous (unchunked) variables can be read in any slices without
+    reading more than asked for, so their native chunk is 1 along every
+    dimension: reads then follow the output chunks.
+    """
+    if var.encoding.get("contiguous", False):
+        return (1,) * var.ndim
+    chunksizes = var.encoding.get("chunksizes")
+    if chunksizes:
+        return tuple(int(c) for c in chunksizes)
+    preferred = var.encoding.get("preferred_chunks", {})
+    return tuple(int(preferred.get(d, n)) for d, n in zip(var.dims, var.shape))
+
+
+def plan_read_chunks(
+    shape: tuple[int, ...],
+    native_chunks: tuple[int, ...],
+    out_chunks: tuple[int, ...],
+    itemsize: int = 4,
+    max_bytes: int = MAX_READ_CHUNK_BYTES,
+) -> tuple[int, ...]:
+    """
+    Read chunks that are whole multiples of both the native and output chunks.
+
+    Every read then decompresses whole source chunks exactly once and writes
+    whole output chunks, capped at the dimension size. Reads larger than
+    `max_bytes` are cut down, leading dimensions first, to fewer whole
+    output chunks, at the cost of decompressing some source chunks again.
+    """
+    read = [
+        min(math.lcm(native, out), n)
+        for n, native, out in zip(shape, native_chunks, out_chunks)
+    ]
+    for i, out in enumerate(out_chunks):
+        size = math.prod(read) * itemsize
+        if size <= max_bytes:
+            break
+        fit = max_bytes * read[i] // size
+        read[i] = min(read[i], max(out, fit // out * out))
+    return tuple(read)
+
+
+def read_amplification(
+    shape: tuple[int, ...],
+    native_chunks: tuple[int, ...],
+    read_chunks: tuple[int, ...],
+) -> float:
+    """Bytes decompressed divided by bytes needed when reading in `read_chunks`."""
+    amplification = 1.0
+    for n, native, read in zip(shape, native_chunks, read_chunks):
+        decompressed = 0
+        for start in range(0, n, read):
+            stop = min(start + read, n)
+            first = start // native * native
+            last = min(-(-stop // native) * native, n)
+            decompressed += last - first
+        amplification *= decompressed / n
+    return amplification
+
+
 def format_to_iso(val):
+    import numpy as np
+    import pandas as pd
+
     if isinstance(val, np.datetime64):
         return pd.Timestamp(val).isoformat()
     if hasattr(val, "isoformat"):
@@ -71,13 +420,138 @@ def format_to_iso(val):
     raise ValueError("Unsupported time type")
 
 
+def expand_dataset_files(patterns: list[str]) -> list[Path]:
+    """Expand file paths and glob patterns into a sorted, de-duplicated file list."""
+    files: list[Path] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        matches = [m for m in matches if Path(m).is_file()]
+        if not matches:
+            raise typer.BadParameter(f"No dataset file found for `{pattern}`")
+        files.extend(Path(m) for m in matches)
+    return list(dict.fromkeys(files))
+
+
+def get_time_dim(ds: xr.Dataset) -> str:
+    """Return the dimension of the 1-D time coordinate used to concatenate files."""
+    import cf_xarray  # noqa: F401
+
+    for name in ds.cf.coordinates.get("time", []):
+        if ds[name].ndim == 1:
+            return str(ds[name].dims[0])
+    raise ValueError("No 1-D time coordinate found to concatenate the files along")
+
+
+def packed_variables(ds: xr.Dataset) -> list[str]:
+    """
+    Data variables stored as int16 with a scale_factor or add_offset.
+
+    Other integers (and `_Unsigned` ones, whose raw values are not their
+    integers) are left to xarray to decode.
+    """
+    import numpy as np
+
+    return [
+        str(name)
+        for name, var in ds.data_vars.items()
+        if var.encoding.get("dtype") == np.int16
+        and "_Unsigned" not in var.encoding
+        and ("scale_factor" in var.encoding or "add_offset" in var.encoding)
+    ]
+
+
+def open_dataset_files(files: list[Path]) -> xr.Dataset:
+    """
+    Open one or more dataset files lazily.
+
+    Multiple files are opened in parallel (see `open_source_files`) and
+    concatenated along the time dimension. Variables without a time
+    dimension are taken from the first file, so the static coordinates are
+    never compared or loaded.
+
+    Packed int16 variables are not decoded: they keep their integers,
+    with their packing in their attributes, and are re-packed directly by
+    `pack_variable`; `decode_packed` gives their values. A variable packed
+    differently in different files is decoded, file by file, to float32.
+    """
+    import xarray as xr
+
+    with open_source_file(files[0]) as first:
+        packed = packed_variables(first)
+        time_dim = get_time_dim(first) if len(files) > 1 else None
+    mask_and_scale = {name: False for name in packed}
+
+    if time_dim is None:
+        return open_source_file(files[0], chunks={}, mask_and_scale=mask_and_scale)
+
+    opened = open_source_files(files, chunks={}, mask_and_scale=mask_and_scale)
+    datasets = opened
+    for name in packed:
+        packings = {repr(source_packing(ds[name])) for ds in datasets if name in ds}
+        if len(packings) > 1:
+            logger.info(f"{name}: packed differently across files; decoding it")
+            datasets = [
+                ds.assign({name: decode_packed(ds[name])}) if name in ds else ds
+                for ds in datasets
+            ]
+
+    combined = xr.combine_nested(
+        datasets,
+        concat_dim=time_dim,
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+        join="override",
+        combine_attrs="override",
+    )
+    combined.set_close(lambda: [ds.close() for ds in opened])
+    return combined
+
+
+def open_source_file(path: Path, **kwargs: t.Any) -> xr.Dataset:
+    """`xr.open_dataset`, safe to call while other threads read source files."""
+    import xarray as xr
+
+    with SOURCE_LOCK:
+        return xr.open_dataset(path, lock=SOURCE_LOCK, **kwargs)
+
+
+def open_source_files(files: list[Path], **kwargs: t.Any) -> list[xr.Dataset]:
+    """
+    `open_source_file` of every file. Many files are opened in parallel by
+    worker processes, since HDF5 calls cannot run in parallel threads, and
+    their lazy datasets are sent back to be read in this process.
+    """
+    import functools
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if (
+        len(files) < PARALLEL_OPEN_MIN_FILES
+        or "forkserver" not in multiprocessing.get_all_start_methods()
+    ):
+        return [open_source_file(f, **kwargs) for f in files]
+
+    # workers are forked from a server that has already imported xarray
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["xarray", "netCDF4", "dask.array", __name__])
+    with ProcessPoolExecutor(min(OPEN_WORKERS, len(files)), mp_context=context) as pool:
+        return list(pool.map(functools.partial(open_source_file, **kwargs), files))
+
+
 def ask_text(default: any, message: str) -> str:  # type: ignore
+    import questionary
+
     return questionary.text(message, default=default).unsafe_ask()
 
 
 def handle_lonlats(
     ds: xr.Dataset, coord_name: t.Literal["longitude", "latitude"]
 ) -> dict[str, LonAxis | LatAxis]:
+    import cf_xarray  # noqa: F401
+
+    from .dataset_model import LatAxis, LonAxis
+
     match coord_name:
         case "longitude":
             AxisClass = LonAxis
@@ -94,28 +568,68 @@ def handle_lonlats(
 
     axis = {}
 
+    # index only the end values (or corners), which reads a single element
+    # (chunk) of lazily loaded coordinates instead of the whole array
     for name in names:
         coord = ds[name]
-        match coord.values.ndim:
-            case 1:
-                axis[coord.name] = AxisClass(
-                    start=coord.values[0],
-                    end=coord.values[-1],
-                    count=len(coord.values),
-                )
-            case 2:
-                axis[coord.name] = AxisClass(
-                    start=coord.values[0, 0],
-                    end=coord.values[-1, -1],
-                    count=coord.values.shape[dimind],
-                )
-            case _:
+        match coord.ndim:
+            case 0:
                 raise ValueError(
-                    f"Dimension of {coord_name} should be 1 or 2. Got {coord.values.ndim} for {coord.name}"
+                    f"Dimension of {coord_name} should be at least 1. Got 0 for {coord.name}"
                 )
+            case 1:
+                # the wrap columns of a halo are not part of the grid
+                halo = coord.attrs.get("lonHalo", {})
+                coord = coord[halo.get("west", 0) : coord.size - halo.get("east", 0)]
+                count = coord.size
+                start, end = coord[[0, -1]].values
+                if count > 2 and regular_step(coord) is None:
+                    logger.warning(
+                        f"{coord.name} is not evenly spaced; it is summarized "
+                        "by its first and last values only"
+                    )
+            case _:
+                # time-varying (e.g. WRF) coordinates: the first step's grid
+                coord = first_step(coord, 2)
+                start, end = coord[[0, -1], [0, -1]].values.diagonal()
+                count = coord.shape[dimind]
+        axis[coord.name] = AxisClass(start=start, end=end, count=count)
     return axis
 
 
+def first_step(coord: xr.DataArray, ndim: int) -> xr.DataArray:
+    """`coord` at index 0 of all but its last `ndim` dimensions."""
+    return coord.isel({d: 0 for d in coord.dims[: max(coord.ndim - ndim, 0)]})
+
+
+def regular_step(coord: xr.DataArray, sample: int = 4) -> float | None:
+    """
+    Step of an evenly spaced 1-D `coord`, or None. Only the first, middle and
+    last `sample` steps are read and compared with the average step; the
+    whole coordinate is scanned only when they differ from it, to tell
+    irregular grids from rounding.
+    """
+    import numpy as np
+
+    n = coord.size
+    if n < 2:
+        return None
+    start, end = (float(v) for v in coord[[0, -1]].values)
+    step = (end - start) / (n - 1)
+    mid = n // 2
+    steps = np.concatenate(
+        [
+            np.diff(coord[: sample + 1].values),
+            np.diff(coord[mid : mid + sample + 1].values),
+            np.diff(coord[-sample - 1 :].values),
+        ]
+    )
+    if np.allclose(steps, step, rtol=1e-6):
+        return step
+    steps = np.diff(coord.values)
+    return float(steps.mean()) if np.allclose(steps, step, rtol=1e-4) else None
+
+
 def handle_lons(ds: xr.Dataset) -> dict[str, LonAxis]:
     return handle_lonlats(ds, "longitude")  # ty:ignore[invalid-return-type]
 
@@ -125,11 +639,15 @@ def handle_lats(ds: xr.Dataset) -> dict[str, LatAxis]:
 
 
 def check_periodic_lon(lon0, dlon, nlon):
+    import numpy as np
+
     lon_wrap = lon0 + dlon * nlon
     return True if np.isclose(lon_wrap - lon0, 360) else False
 
 
 def handle_times(ds) -> dict[str, list[str]]:
+    import cf_xarray  # noqa: F401
+
     names = ds.cf.coordinates.get("time", [])
     if not names:
         return {}
@@ -143,12 +661,16 @@ def handle_times(ds) -> dict[str, list[str]]:
 
 
 def skip_variables(ds):
+    import questionary
+
     return questionary.checkbox(
         "Select variables which you want to skip:", choices=list(ds.data_vars)
     ).unsafe_ask()
 
 
 def get_lon_name_for_var(var: xr.DataArray) -> str:
+    import cf_xarray  # noqa: F401
+
     try:
         return var.cf["longitude"].name
     except (KeyError, AttributeError):
@@ -156,6 +678,8 @@ def get_lon_name_for_var(var: xr.DataArray) -> str:
 
 
 def get_lat_name_for_var(var: xr.DataArray) -> str:
+    import cf_xarray  # noqa: F401
+
     try:
         return var.cf["latitude"].name
     except (KeyError, AttributeError):
@@ -166,6 +690,8 @@ def get_vertical_name_for_var(
     var: xr.DataArray,
     ds_verticals: dict[str, list[str]],
 ) -> str:
+    import cf_xarray  # noqa: F401
+
     try:
         vname = var.cf["vertical"].name
     except (KeyError, AttributeError):
@@ -181,6 +707,8 @@ def get_vertical_name_for_var(
 
 
 def get_time_name_for_var(var: xr.DataArray) -> str:
+    import cf_xarray  # noqa: F401
+
     try:
         return var.cf["time"].name
     except (KeyError, AttributeError):
@@ -192,6 +720,10 @@ def handle_vectors(
     data_vars: list[str],
     ds_verticals: dict[str, list[str]],
 ) -> dict[str, VectorVar]:
+    import questionary
+
+    from .dataset_model import VectorVar
+
     vectors: dict[str, VectorVar] = {}
     vec_choices = questionary.checkbox(
         "Select variables to group as Vectors (pairs):", choices=data_vars
@@ -218,6 +750,11 @@ def handle_vectors(
             if timev1 != timev2:
                 raise ValueError(f"Time don't match for ({v1}, {v2})")
 
+            gridv1 = (get_lon_name_for_var(var1), get_lat_name_for_var(var1))
+            gridv2 = (get_lon_name_for_var(var2), get_lat_name_for_var(var2))
+            if gridv1 != gridv2 or var1.sizes != var2.sizes:
+                raise ValueError(f"Grids don't match for ({v1}, {v2})")
+
             attrs: dict[str, any] = {}  # type: ignore
 
             name: str = ask_text(f"{v1}_{v2}", f"Vector name for ({v1}, {v2}):")
@@ -251,6 +788,8 @@ def handle_datavars(
     data_vars: list[str],
     ds_verticals: dict[str, list[str]],
 ) -> dict[str, DataVar]:
+    from .dataset_model import DataVar
+
     datavars: dict[str, DataVar] = {}
     for v in data_vars:
         name: str = ask_text(
@@ -287,14 +826,18 @@ def handle_datavars(
 
 
 def handle_levels(ds: xr.Dataset) -> dict[str, list[str]]:
+    import cf_xarray  # noqa: F401
+
     names = ds.cf.coordinates.get("vertical", [])
     levels: dict[str, list[str]] = {}
 
     for name in names:
         units = ds[name].attrs.get("units", "")
-        if ds[name].values.ndim == 0:
+        if ds[name].ndim == 0:
             continue
-        levels[name] = [f"{val} {units}".strip() for val in ds[name].values]
+        # time-varying levels (e.g. WRF ZNU): the first step's
+        values = first_step(ds[name], 1).values
+        levels[name] = [f"{val} {units}".strip() for val in values]
 
     return levels
 
@@ -312,6 +855,8 @@ def process_conic_conformal(ds: xr.Dataset) -> ConicConformal:
     """
     Process conic conformal projection.
     """
+    from .dataset_model import ConicConformal
+
     truelat1 = ds.attrs.get("TRUELAT1", None)
     if truelat1 is None:
         raise ValueError("truelat1 not found in dataset attributes")
@@ -346,6 +891,8 @@ def process_equirectangular(ds: xr.Dataset) -> Equirectangular:
     """
     Process equirectangular projection.
     """
+    from .dataset_model import Equirectangular
+
     cen_lon = ds.attrs.get("CEN_LON", None)
     if cen_lon is None:
         raise ValueError("cen_lon not found in dataset attributes")
@@ -372,14 +919,20 @@ def process_equirectangular(ds: xr.Dataset) -> Equirectangular:
 
 
 def process_mercator(ds: xr.Dataset) -> Mercator:
+    from .dataset_model import Mercator
+
     return Mercator(name="Mercator")
 
 
 def process_lonlat(ds: xr.Dataset) -> LonLat:
+    from .dataset_model import LonLat
+
     return LonLat(name="LonLat")
 
 
 def process_stereographic(ds: xr.Dataset) -> Stereographic:
+    from .dataset_model import Stereographic
+
     cen_lon = ds.attrs.get("CEN_LON", None)
     if cen_lon is None:
         raise ValueError("cen_lon not found in dataset attributes")
@@ -414,6 +967,8 @@ def handle_projection(
     """
     Handle projection detection and return appropriate projection object.
     """
+    import questionary
+
     proj_name = get_proj_name_from_ds(ds)
 
     if not proj_name:
@@ -425,21 +980,592 @@ def handle_projection(
         raise ValueError(f"Unsupported projection or no projection found: {proj_name}")
 
 
+def dataset_attrs(
+    ds: xr.Dataset, metadata: dict[str, t.Any], profiler: Profiler
+) -> dict[str, t.Any]:
+    """Validated `Dataset` attributes of the processed store."""
+    from .dataset_model import Dataset
+
+    with profiler.stage("inspect"):
+        lons = handle_lons(ds)
+        lats = handle_lats(ds)
+        levels = handle_levels(ds)
+        times = handle_times(ds)
+
+    dataset = Dataset(
+        lons=lons,
+        lats=lats,
+        levels=levels,
+        times=times,
+        datavars=metadata["datavars"],
+        vectors=metadata["vectors"],
+        projection=metadata["projection"],
+        title=metadata["title"],
+        subtitle=metadata["subtitle"],
+        description=metadata["description"],
+    )
+    return dataset.model_dump()
+
+
+def prepare_variable(
+    ds: xr.Dataset,
+    name: str,
+    dataarray: dict[str, t.Any],
+    profiler: Profiler,
+) -> tuple[xr.DataArray, tuple[int, ...], dict[str, dict[str, t.Any]]]:
+    """
+    Source variable chunked for reading, its output chunks and slab statistics.
+    """
+    from . import manifest as mf
+
+    var = ds[dataarray["arrName"]]
+
+    # TODO: need to implement intelligent chunking strategy
+    chunks = []
+    if dataarray["time"]:
+        chunks.append(1)
+    if dataarray["level"]:
+        chunks.append(1)
+    chunks.append(var.shape[-2])
+    chunks.append(var.shape[-1])
+
+    native_chunks = get_native_chunks(var)
+    read_chunks = plan_read_chunks(
+        var.shape, native_chunks, tuple(chunks), var.dtype.itemsize
+    )
+    logger.info(
+        f"{dataarray['arrName']}: native chunks {native_chunks}, "
+        f"read chunks {read_chunks}, read amplification "
+        f"{read_amplification(var.shape, native_chunks, read_chunks):.2f}x "
+        f"(vs {read_amplification(var.shape, native_chunks, tuple(chunks)):.2f}x "
+        "reading one output chunk at a time)"
+    )
+
+    # dask chunks must line up with the native and zarr chunks
+    var = var.chunk(dict(zip(var.dims, read_chunks)))
+    # the decoded size; the size of the source files is `input_file_bytes`
+    profiler.count(name, bytes_decoded=var.nbytes)
+
+    with profiler.stage("stats", name):
+        slabs = mf.slab_stats(decode_packed(var), tuple(chunks))
+
+    return var, tuple(chunks), slabs
+
+
+def encoding_hash(packing: dict[str, float]) -> str:
+    import zarr
+
+    from .manifest import hash_json
+
+    return hash_json(
+        {
+            "dtype": "int16",
+            "_FillValue": FILL_VALUE,
+            "compressor": zarr.storage.default_compressor.get_config(),
+            **packing,
+        }
+    )
+
+
+def open_store(
+    out: Path | str,
+    profiler: Profiler,
+    var_names: dict[str, str],
+    **upload_options: t.Any,
+) -> t.Any:
+    """
+    Store at a local path, or at an fsspec URL with concurrent uploads
+    (see `vizima.remote.UploadStore` for `upload_options`).
+    """
+    import zarr
+
+    from .profiling import ProfiledStore
+    from .remote import UploadStore, is_url
+
+    if is_url(out):
+        store: t.Any = UploadStore(str(out), **upload_options)
+    else:
+        store = zarr.DirectoryStore(out)
+    if profiler.enabled:
+        store = ProfiledStore(store, profiler, var_names)
+    return store
+
+
+def write_dataset(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    out: Path | str,
+    profiler: Profiler,
+    incremental: bool = True,
+    upload_options: dict[str, t.Any] | None = None,
+    ranges: dict[str, tuple[float, float] | None] | None = None,
+):
+    """
+    Pack the `metadata` variables of `ds` and write them to the store at `out`
+    (a path or fsspec URL).
+
+    With `incremental`, only slabs that changed since the last run into the
+    same store are rewritten (see `vizima.manifest`). The packing covers
+    `ranges` (see `data_ranges`), e.g. of time steps appended later.
+    """
+    import xarray as xr
+
+    from . import manifest as mf
+
+    out_ds = xr.Dataset()
+    out_ds.attrs = dataset_attrs(ds, metadata, profiler)
+    halo = {
+        str(name): coord.attrs["lonHalo"]
+        for name, coord in ds.coords.items()
+        if "lonHalo" in coord.attrs
+    }
+    if halo:
+        out_ds.attrs["lonHalo"] = halo
+
+    encoding: dict[str, dict] = {}
+    var_names: dict[str, str] = {}
+
+    store = open_store(out, profiler, var_names, **(upload_options or {}))
+    old_manifest = mf.load_manifest(store) if incremental else None
+    manifest: dict[str, t.Any] = {"version": mf.MANIFEST_VERSION, "variables": {}}
+
+    for name, dataarray in metadata["datavars"].items():
+        var_names[dataarray["arrName"]] = name
+        var, chunks, slabs = prepare_variable(ds, name, dataarray, profiler)
+
+        data_range = union_range(
+            mf.slabs_range(slabs), (ranges or {}).get(dataarray["arrName"])
+        )
+        old_entry = (old_manifest or {}).get("variables", {}).get(dataarray["arrName"])
+        packing_range = mf.reusable_packing(
+            old_entry, data_range
+        ) or source_packing_range(var, data_range)
+        if packing_range is None:
+            packing_range = dict(zip(("min", "max"), data_range or (0.0, 0.0)))
+        packing = packing_params_from_range(packing_range["min"], packing_range["max"])
+
+        out_ds[dataarray["arrName"]] = pack_variable(var, packing, profiler, name)
+
+        encoding[dataarray["arrName"]] = {"chunks": chunks}
+
+        manifest["variables"][dataarray["arrName"]] = {
+            "shape": list(var.shape),
+            "chunks": list(chunks),
+            "coords": mf.coords_hash(var),
+            "encoding": encoding_hash(packing),
+            "packing": {"min": packing_range["min"], "max": packing_range["max"]},
+            "slabs": slabs,
+        }
+
+    changed = mf.changed_slabs(old_manifest, manifest)
+
+    with profiler.stage("store"):
+        if changed is None:
+            # the metadata and coordinates; the packed data is written below,
+            # through arrays whose compressors can be profiled
+            out_ds.to_zarr(store, mode="w", encoding=encoding, compute=False)
+            changed = {
+                arr_name: list(entry["slabs"])
+                for arr_name, entry in manifest["variables"].items()
+            }
+        write_changed_slabs(store, out_ds, encoding, changed, profiler)
+        mf.save_manifest(store, manifest)
+        store.close()
+
+
+REPACK_DIR = ".vizima.repack"
+
+
+def repack_journal_key(arr_name: str) -> str:
+    return f"{REPACK_DIR}/{arr_name}.json"
+
+
+def repack_array(
+    store: t.Any,
+    group: zarr.Group,
+    arr_name: str,
+    old: dict[str, float],
+    new: dict[str, float],
+    packing_range: dict[str, float],
+):
+    """
+    Re-pack the stored `arr_name` from the `old` to the `new` packing.
+
+    The re-packed chunks go to a scratch array first, then a journal is
+    written, and only then are they copied over the stored chunks along with
+    the new attributes (`finish_repack`). An interrupted re-pack so either
+    left the array as it was or is completed by the next update.
+    """
+    import dask.array as da
+    import numpy as np
+
+    target = group[arr_name]
+    scratch = group.empty_like(f"{REPACK_DIR}/{arr_name}", target, overwrite=True)
+    da.store(
+        da.from_zarr(target).map_blocks(repack_block, old, new, dtype=np.int16),
+        scratch,
+        lock=False,
+    )
+    journal = {"packing": new, "range": packing_range}
+    store[repack_journal_key(arr_name)] = json.dumps(journal).encode()
+    finish_repack(store, group, arr_name)
+
+
+def finish_repack(store: t.Any, group: zarr.Group, arr_name: str):
+    """Copy the journaled re-pack of `arr_name` into place; safe to repeat."""
+    import itertools
+
+    import zarr
+
+    from . import manifest as mf
+
+    journal = json.loads(store[repack_journal_key(arr_name)])
+    target = group[arr_name]
+    scratch = group[f"{REPACK_DIR}/{arr_name}"]
+    separator = target._dimension_separator or "."
+    for index in itertools.product(*map(range, target.cdata_shape)):
+        key = separator.join(map(str, index)) or "0"
+        try:
+            store[f"{target.path}/{key}"] = store[f"{scratch.path}/{key}"]
+        except KeyError:
+            store.pop(f"{target.path}/{key}", None)
+    target.attrs.update(journal["packing"])
+
+    manifest = mf.load_manifest(store)
+    if manifest is not None:
+        entry = manifest["variables"][arr_name]
+        entry["packing"] = journal["range"]
+        entry["encoding"] = encoding_hash(journal["packing"])
+        mf.save_manifest(store, manifest)
+    del store[repack_journal_key(arr_name)]
+    zarr.storage.rmdir(store, REPACK_DIR)
+
+
+def finish_repacks(store: t.Any, group: zarr.Group, arr_names: list[str]) -> bool:
+    """Complete the re-packs of `arr_names` an interrupted update left behind."""
+    pending = [name for name in arr_names if repack_journal_key(name) in store]
+    for name in pending:
+        logger.warning(f"{name}: completing an interrupted re-pack")
+        finish_repack(store, group, name)
+    return bool(pending)
+
+
+def union_range(
+    a: tuple[float, float] | None, b: tuple[float, float] | None
+) -> tuple[float, float] | None:
+    if a is None or b is None:
+        return a or b
+    return min(a[0], b[0]), max(a[1], b[1])
+
+
+def data_ranges(
+    ds: xr.Dataset, metadata: dict[str, t.Any]
+) -> dict[str, tuple[float, float] | None]:
+    """
+    (min, max) of every `metadata` variable of `ds` (None if it has no finite
+    value), in one pass over the data, read in planned read chunks.
+    """
+    import dask
+    import numpy as np
+
+    values = {}
+    for dataarray in metadata["datavars"].values():
+        var = ds[dataarray["arrName"]]
+        out_chunks = (1,) * (var.ndim - 2) + var.shape[-2:]
+        read_chunks = plan_read_chunks(
+            var.shape, get_native_chunks(var), out_chunks, var.dtype.itemsize
+        )
+        var = decode_packed(var.chunk(dict(zip(var.dims, read_chunks))))
+        values[dataarray["arrName"]] = (var.min(), var.max())
+    (computed,) = dask.compute(values)
+    return {
+        name: (float(low), float(high)) if np.isfinite(low) else None
+        for name, (low, high) in computed.items()
+    }
+
+
+def update_store(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    out: Path | str,
+    profiler: Profiler,
+    upload_options: dict[str, t.Any] | None = None,
+):
+    """
+    Write `ds` into an existing processed store without rewriting it.
+
+    Time steps already in the store are overwritten in place (region writes)
+    and later ones are appended. If the new values fall outside a variable's
+    packing range, the range is widened and the stored chunks re-packed (see
+    `repack_array`). A store without a manifest is written from scratch.
+    """
+    import dask.array as da
+    import numpy as np
+    import xarray as xr
+    import zarr
+    from xarray.coding.times import encode_cf_datetime
+
+    from . import manifest as mf
+    from .profiling import profile_compressors
+
+    var_names: dict[str, str] = {}
+    store = open_store(out, profiler, var_names, **(upload_options or {}))
+    manifest = mf.load_manifest(store)
+    if manifest is None:
+        store.close()
+        write_dataset(ds, metadata, out, profiler, False, upload_options)
+        return
+
+    group = zarr.open_group(store, mode="r+")
+    if finish_repacks(store, group, metadata_arr_names(metadata)):
+        # the re-packs updated the packing ranges of the manifest
+        manifest = mf.load_manifest(store)
+        assert manifest is not None
+    existing = xr.open_zarr(store)
+
+    # position of each time step of `ds` along the store's time axis
+    positions: dict[str, np.ndarray] = {}
+    for time_name in {dv["time"] for dv in metadata["datavars"].values()} - {""}:
+        old_times = existing[time_name].values
+        new_times = ds[time_name].values
+        index = {v: i for i, v in enumerate(old_times)}
+        appended = [v for v in new_times if v not in index]
+        if appended and len(old_times) and min(appended) <= old_times[-1]:
+            raise ValueError(
+                f"New `{time_name}` values must come after the last one in {out}"
+            )
+        index.update({v: len(old_times) + i for i, v in enumerate(appended)})
+        positions[time_name] = np.array([index[v] for v in new_times])
+        if not appended:
+            continue
+
+        # grow every array along the time dimension and write the new times
+        time_dim = existing[time_name].dims[0]
+        new_len = len(old_times) + len(appended)
+        for arr_name, arr in group.arrays():
+            dims = arr.attrs["_ARRAY_DIMENSIONS"]
+            if time_dim not in dims:
+                continue
+            axis = dims.index(time_dim)
+            arr.resize(*(new_len if i == axis else n for i, n in enumerate(arr.shape)))
+            if arr_name == time_name:
+                values = np.asarray(appended)
+                if np.issubdtype(values.dtype, np.datetime64):
+                    values, _, _ = encode_cf_datetime(
+                        values, arr.attrs["units"], arr.attrs.get("calendar")
+                    )
+                arr[len(old_times) :] = values.astype(arr.dtype)
+            elif arr_name not in metadata_arr_names(metadata):
+                new_pos = positions[time_name] >= len(old_times)
+                region = tuple(
+                    slice(len(old_times), None) if i == axis else slice(None)
+                    for i in range(arr.ndim)
+                )
+                arr[region] = (
+                    decode_packed(ds[arr_name])
+                    .isel({time_dim: new_pos})
+                    .values.astype(arr.dtype)
+                )
+
+    sources, targets, regions = [], [], []
+    for name, dataarray in metadata["datavars"].items():
+        arr_name = dataarray["arrName"]
+        var_names[arr_name] = name
+        entry = manifest["variables"][arr_name]
+        var, chunks, slabs = prepare_variable(ds, name, dataarray, profiler)
+        target = group[arr_name]
+
+        data_range = mf.slabs_range(slabs)
+        packing_range = entry["packing"]
+        old = {k: target.attrs[k] for k in ("scale_factor", "add_offset")}
+        packing = old
+        if data_range is not None and mf.reusable_packing(entry, data_range) is None:
+            packing_range = {
+                "min": min(packing_range["min"], data_range[0]),
+                "max": max(packing_range["max"], data_range[1]),
+            }
+            packing = packing_params_from_range(
+                packing_range["min"], packing_range["max"]
+            )
+            logger.info(f"{arr_name}: widening packing range to {packing_range}")
+            with profiler.stage("repack", name):
+                repack_array(store, group, arr_name, old, packing, packing_range)
+            entry["packing"] = packing_range
+            entry["encoding"] = encoding_hash(packing)
+
+        packed = pack_variable(var, packing, profiler, name)
+        for key, slab in slabs.items():
+            index = [int(i) for i in key.split(".")] if len(chunks) > 2 else []
+            if dataarray["time"]:
+                index[0] = int(positions[dataarray["time"]][index[0]])
+            store_key = mf.slab_key(tuple(index))
+            if entry["slabs"].get(store_key, {}).get("hash") == slab["hash"]:
+                continue
+            sources.append(packed.data[mf.slab_region(key, chunks)])
+            targets.append(target)
+            regions.append(mf.slab_region(store_key, chunks))
+            entry["slabs"][store_key] = slab
+        entry["shape"] = list(target.shape)
+
+    profile_compressors(profiler, targets)
+    with profiler.stage("store"):
+        if sources:
+            da.store(sources, targets, regions=regions, lock=False)
+        logger.info(f"Wrote {len(sources)} slab(s) into {out}")
+
+        updated = xr.open_zarr(store, consolidated=False)
+        attrs = dataset_attrs(ds, metadata, profiler)
+        attrs["times"] = {
+            name: [format_to_iso(v) for v in updated[name].values]
+            for name in attrs["times"]
+        }
+        group.attrs.update(attrs)
+        for arr_name in metadata_arr_names(metadata):
+            manifest["variables"][arr_name]["coords"] = mf.coords_hash(
+                updated[arr_name]
+            )
+        zarr.consolidate_metadata(store)
+        mf.save_manifest(store, manifest)
+        store.close()
+
+
+def write_sharded_store(
+    ds: xr.Dataset,
+    metadata: dict[str, t.Any],
+    out: Path,
+    profiler: Profiler,
+    tile_size: int = 256,
+    shard_size: str = "64MB",
+):
+    """
+    Pack the `metadata` variables of `ds` into a sharded Zarr v3 store at `out`.
+
+    Each time step/level is split into `tile_size` square tiles (the unit of a
+    read), grouped into shards of about `shard_size` (the unit of storage).
+    """
+    import xarray as xr
+    from dask.utils import parse_bytes
+
+    from . import manifest as mf
+    from .sharding import write_file, write_sharded_dataset
+
+    out_ds = xr.Dataset()
+    out_ds.attrs = dataset_attrs(ds, metadata, profiler)
+    halo = {
+        str(name): coord.attrs["lonHalo"]
+        for name, coord in ds.coords.items()
+        if "lonHalo" in coord.attrs
+    }
+    if halo:
+        out_ds.attrs["lonHalo"] = halo
+
+    chunks: dict[str, tuple[int, ...]] = {}
+    var_names: dict[str, str] = {}
+    for name, dataarray in metadata["datavars"].items():
+        var_names[dataarray["arrName"]] = name
+        var, slab_chunks, slabs = prepare_variable(ds, name, dataarray, profiler)
+        data_range = mf.slabs_range(slabs)
+        packing_range = source_packing_range(var, data_range)
+        if packing_range is None:
+            packing_range = dict(zip(("min", "max"), data_range or (0.0, 0.0)))
+        packing = packing_params_from_range(packing_range["min"], packing_range["max"])
+        out_ds[dataarray["arrName"]] = pack_variable(var, packing, profiler, name)
+        chunks[dataarray["arrName"]] = slab_chunks[:-2] + tuple(
+            min(tile_size, n) for n in var.shape[-2:]
+        )
+
+    def write(path: Path, data: bytes):
+        var = var_names.get(path.relative_to(out).parts[0])
+        with profiler.task("write", var):
+            write_file(path, data)
+        profiler.count(var, bytes_written=len(data), chunks_written=1)
+
+    with profiler.stage("store"):
+        write_sharded_dataset(
+            out_ds, out, chunks, parse_bytes(shard_size), FILL_VALUE, write
+        )
+
+
+def metadata_arr_names(metadata: dict[str, t.Any]) -> list[str]:
+    return [dv["arrName"] for dv in metadata["datavars"].values()]
+
+
+def write_changed_slabs(
+    store: t.Any,
+    out_ds: xr.Dataset,
+    encoding: dict[str, dict],
+    changed: dict[str, list[str]],
+    profiler: Profiler,
+):
+    """
+    Write only the `changed` slabs of `out_ds` into an existing store.
+
+    The root attributes and packing attributes are refreshed and the metadata
+    reconsolidated; everything else in the store is left as is.
+    """
+    import dask.array as da
+    import zarr
+
+    from .manifest import slab_region
+    from .profiling import profile_compressors
+
+    group = zarr.open_group(store, mode="r+")
+    group.attrs.update(out_ds.attrs)
+
+    sources, targets, regions = [], [], []
+    for arr_name, keys in changed.items():
+        packed = out_ds[arr_name]
+        target = group[arr_name]
+        target.attrs.update(
+            {k: packed.attrs[k] for k in ("scale_factor", "add_offset")}
+        )
+        profile_compressors(profiler, [target])
+        for key in keys:
+            region = slab_region(key, encoding[arr_name]["chunks"])
+            sources.append(packed.data[region])
+            targets.append(target)
+            regions.append(region)
+        logger.info(f"{arr_name}: rewriting {len(keys)} changed slab(s)")
+
+    if sources:
+        da.store(sources, targets, regions=regions, lock=False)
+    zarr.consolidate_metadata(store)
+
+
 @app.command()
 def prepare_metadata(
-    dataset_file: t.Annotated[
-        Path, typer.Argument(help="Path to the dataset file", exists=True)
+    dataset_files: t.Annotated[
+        list[str],
+        typer.Argument(help="Path(s) or glob pattern(s) of the dataset file(s)"),
     ],
     metadata_file: t.Annotated[
         Path, typer.Option(help="Path to save the metadata json file")
     ] = Path("dataset_meta.json"),
+    profile: t.Annotated[
+        Path | None,
+        typer.Option(help="Write a JSON profiling report to this path"),
+    ] = None,
+    profile_hook: t.Annotated[
+        list[ProfileHook] | None,
+        typer.Option(help="Run cProfile/tracemalloc over the hot stages"),
+    ] = None,
 ):
-    ds = xr.open_dataset(dataset_file)
+    from .dataset_model import Dataset
+    from .destagger import destagger_dataset
 
-    times = handle_times(ds)
-    levels = handle_levels(ds)
-    lons = handle_lons(ds)
-    lats = handle_lats(ds)
+    profiler = Profiler(
+        "prepare_metadata", profile is not None, profile_hook or [], ["inspect"]
+    )
+
+    with profiler.stage("open"):
+        ds = open_dataset_files(expand_dataset_files(dataset_files))
+        ds, _ = destagger_dataset(ds)
+
+    with profiler.stage("inspect"):
+        times = handle_times(ds)
+        levels = handle_levels(ds)
+        lons = handle_lons(ds)
+        lats = handle_lats(ds)
     projection = handle_projection(ds)
 
     try:
@@ -481,14 +1607,16 @@ def prepare_metadata(
 
     logger.info(f"Metadata saved to {metadata_file}")
 
+    if profile is not None:
+        profiler.dump(profile)
+        logger.info(f"Profiling report saved to {profile}")
+
 
 @app.command()
 def process_dataset(
-    dataset_file: t.Annotated[
-        Path,
-        typer.Argument(
-            help="Path to the dataset file", exists=True, file_okay=True, dir_okay=False
-        ),
+    dataset_files: t.Annotated[
+        list[str],
+        typer.Argument(help="Path(s) or glob pattern(s) of the dataset file(s)"),
     ],
     metadata_file: t.Annotated[
         Path,
@@ -500,60 +1628,567 @@ def process_dataset(
         ),
     ],
     out: t.Annotated[
-        Path,
-        typer.Option(help="Path to save the processed dataset"),
-    ] = Path("dataset.zarr"),
+        str,
+        typer.Option(
+            help="Path or fsspec URL (e.g. s3://bucket/dataset.zarr) "
+            "to save the processed dataset"
+        ),
+    ] = "dataset.zarr",
+    profile: t.Annotated[
+        Path | None,
+        typer.Option(help="Write a JSON profiling report to this path"),
+    ] = None,
+    profile_hook: t.Annotated[
+        list[ProfileHook] | None,
+        typer.Option(help="Run cProfile/tracemalloc over the hot stages"),
+    ] = None,
+    incremental: t.Annotated[
+        bool,
+        typer.Option(
+            "--incremental/--full",
+            help="Rewrite only the slabs whose source values or encoding "
+            "changed since the last run into the same store",
+        ),
+    ] = True,
+    zarr_format: t.Annotated[
+        int,
+        typer.Option(
+            min=2,
+            max=3,
+            help="Zarr format of the store; 3 writes sharded arrays "
+            "(always a full write)",
+        ),
+    ] = 2,
+    tile_size: t.Annotated[
+        int,
+        typer.Option(help="Size of the square tiles read by clients (Zarr v3)"),
+    ] = 256,
+    shard_size: t.Annotated[
+        str,
+        typer.Option(help="Uncompressed size of a stored shard (Zarr v3)"),
+    ] = "64MB",
+    regrid_res: t.Annotated[
+        float | None,
+        typer.Option(help="Regrid to a regular lon/lat grid of this resolution"),
+    ] = None,
+    regrid_cache: t.Annotated[
+        Path | None,
+        typer.Option(
+            help="Directory of cached regrid weights "
+            "[default: $XDG_CACHE_HOME/vizima/regrid]"
+        ),
+    ] = None,
+    upload_concurrency: t.Annotated[
+        int, typer.Option(help="Concurrent chunk uploads to a URL `--out`")
+    ] = 16,
+    upload_retries: t.Annotated[
+        int, typer.Option(help="Retries of a failed upload, with backoff")
+    ] = 5,
+    lon_convention: t.Annotated[
+        LonConvention | None,
+        typer.Option(
+            help="Roll global (periodic) grids to longitudes -180..180 (180) "
+            "or 0..360 (360)"
+        ),
+    ] = None,
+    lon_halo: t.Annotated[
+        int,
+        typer.Option(
+            min=0,
+            help="Copy this many columns across the seam of global grids onto "
+            "their west and east edge tiles (Zarr v3)",
+        ),
+    ] = 0,
+    bbox: t.Annotated[
+        str | None,
+        typer.Option(
+            help="Only process WEST,SOUTH,EAST,NORTH (degrees; WEST > EAST "
+            "crosses the dateline), e.g. --bbox=-20,0,60,40"
+        ),
+    ] = None,
+    time_range: t.Annotated[
+        str | None,
+        typer.Option(help="Only process START/END (inclusive, either may be empty)"),
+    ] = None,
+    levels: t.Annotated[
+        list[float] | None,
+        typer.Option(help="Only process these vertical levels (repeatable)"),
+    ] = None,
+    vertical: t.Annotated[
+        VerticalCoordinate | None,
+        typer.Option(
+            help="Interpolate WRF model levels to pressure (hPa) or height (m) "
+            "levels, given with --vertical-level"
+        ),
+    ] = None,
+    vertical_level: t.Annotated[
+        list[float] | None,
+        typer.Option(help="Pressure or height level to interpolate to (repeatable)"),
+    ] = None,
+    earth_relative: t.Annotated[
+        bool,
+        typer.Option(
+            "--earth-relative",
+            help="Rotate the vectors of WRF output from grid- to earth-relative "
+            "(with COSALPHA/SINALPHA)",
+        ),
+    ] = False,
+    shared: t.Annotated[
+        bool,
+        typer.Option(
+            "--shared",
+            help="Write alongside other process-dataset runs into the same "
+            "store (other variables or time ranges), coordinating through a "
+            "lock file in the store",
+        ),
+    ] = False,
 ):
-    ds = xr.open_dataset(dataset_file)
-    metadata = json.load(open(metadata_file))
+    from .remote import is_url
+
+    if zarr_format == 3 and is_url(out):
+        raise typer.BadParameter("Zarr v3 stores can only be written to a local path")
+    if lon_halo and zarr_format != 3:
+        raise typer.BadParameter("--lon-halo needs the tiles of --zarr-format 3")
+    if shared and (zarr_format == 3 or is_url(out)):
+        raise typer.BadParameter(
+            "--shared writes Zarr v2 stores on a local or shared filesystem only"
+        )
 
-    lons = handle_lons(ds)
-    lats = handle_lats(ds)
-    levels = handle_levels(ds)
-    times = handle_times(ds)
+    from .subset import parse_bbox, parse_time_range
 
-    dataset = Dataset(
-        lons=lons,
-        lats=lats,
-        levels=levels,
-        times=times,
-        datavars=metadata["datavars"],
-        vectors=metadata["vectors"],
-        projection=metadata["projection"],
-        title=metadata["title"],
-        subtitle=metadata["subtitle"],
-        description=metadata["description"],
+    try:
+        bounds = parse_bbox(bbox) if bbox is not None else None
+        times = parse_time_range(time_range) if time_range is not None else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    profiler = Profiler(
+        "process_dataset", profile is not None, profile_hook or [], ["stats", "store"]
     )
+    with profiler.stage("open"):
+        files = expand_dataset_files(dataset_files)
+        ds = open_dataset_files(files)
+        with open(metadata_file) as f:
+            metadata: dict[str, t.Any] = json.load(f)
+    profiler.count(input_file_bytes=sum(f.stat().st_size for f in files))
 
-    out_ds = xr.Dataset()
-    out_ds.attrs = dataset.model_dump()
+    from .derive import derive_variables
+    from .destagger import destagger_dataset
 
-    encoding: dict[str, dict] = {}
+    try:
+        ds, metadata = destagger_dataset(ds, metadata, earth_relative)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    ds = derive_variables(ds, metadata)
 
-    for _, dataarray in metadata["datavars"].items():
-        var = ds[dataarray["name"]]
-        out_ds[dataarray["name"]] = var
+    if vertical is not None:
+        from .vertical import interpolate_dataset
 
-        # TODO: need to implement intelligent chunking strategy
-        chunks = []
-        if dataarray["time"]:
-            chunks.append(1)
-        if dataarray["level"]:
-            chunks.append(1)
-        chunks.append(var.shape[-2])
-        chunks.append(var.shape[-1])
+        try:
+            ds, metadata = interpolate_dataset(
+                ds, metadata, vertical, vertical_level or []
+            )
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+    elif vertical_level:
+        raise typer.BadParameter("--vertical-level needs --vertical")
 
-        encoding[dataarray["name"]] = {
-            "dtype": "int16",
-            "_FillValue": -32767,
-            "chunks": tuple(chunks),
-            **get_packing_params(var),
-        }
+    if bounds is not None or times is not None or levels:
+        from .subset import subset_dataset
 
-    out_ds.to_zarr(out, mode="w", encoding=encoding)
+        ds = subset_dataset(ds, metadata, bounds, times, levels)
+
+    if regrid_res is not None:
+        from .regrid import regrid_dataset
+
+        with profiler.stage("regrid"):
+            ds, metadata = regrid_dataset(ds, metadata, regrid_res, regrid_cache)
+
+    if lon_convention is not None or lon_halo:
+        from .periodic import wrap_longitude
+
+        try:
+            ds = wrap_longitude(ds, metadata, lon_convention, lon_halo, tile_size)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+
+    if zarr_format == 3:
+        write_sharded_store(ds, metadata, Path(out), profiler, tile_size, shard_size)
+    elif shared:
+        from .shared import shared_write
+
+        try:
+            shared_write(ds, metadata, Path(out), profiler)
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+    else:
+        upload_options = {"concurrency": upload_concurrency, "retries": upload_retries}
+        write_dataset(ds, metadata, out, profiler, incremental, upload_options)
 
     logger.info(f"Dataset saved to {out}")
 
+    if profile is not None:
+        profiler.dump(profile)
+        logger.info(f"Profiling report saved to {profile}")
+
+
+@app.command()
+def watch(
+    inbox: t.Annotated[
+        Path,
+        typer.Argument(
+            help="Directory to watch for new dataset files",
+            exists=True,
+            file_okay=False,
+        ),
+    ],
+    metadata_file: t.Annotated[
+        list[Path],
+        typer.Option(
+            help="Metadata json file(s); a file goes to the first one whose "
+            "variables it contains",
+            exists=True,
+            dir_okay=False,
+        ),
+    ],
+    out_dir: t.Annotated[
+        Path,
+        typer.Option(help="Directory of the stores, named after the metadata files"),
+    ] = Path("."),
+    pattern: t.Annotated[
+        str, typer.Option(help="Glob pattern of the files to ingest")
+    ] = "*.nc",
+    workers: t.Annotated[int, typer.Option(help="Number of worker threads")] = 2,
+    queue_size: t.Annotated[
+        int, typer.Option(help="Maximum number of queued jobs")
+    ] = 4,
+    retries: t.Annotated[
+        int, typer.Option(help="Retries of a failed job, with backoff")
+    ] = 3,
+    poll_interval: t.Annotated[
+        float, typer.Option(help="Seconds between inbox scans")
+    ] = 2.0,
+    status_file: t.Annotated[
+        Path | None,
+        typer.Option(
+            help="Path of the status json file [default: OUT_DIR/watch_status.json]"
+        ),
+    ] = None,
+    archive_dir: t.Annotated[
+        Path | None,
+        typer.Option(help="Move ingested files to this directory"),
+    ] = None,
+    once: t.Annotated[
+        bool, typer.Option(help="Ingest the files present now and exit")
+    ] = False,
+):
+    from .watch import StatusFile, Watcher, load_routes
+
+    watcher = Watcher(
+        inbox,
+        load_routes(metadata_file, out_dir),
+        StatusFile(status_file or out_dir / "watch_status.json"),
+        pattern=pattern,
+        workers=workers,
+        queue_size=queue_size,
+        retries=retries,
+        archive_dir=archive_dir,
+    )
+    logger.info(f"Watching {inbox} for {pattern}")
+    try:
+        watcher.run(poll_interval=poll_interval, once=once)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+
+@app.command()
+def process_batch(
+    jobs_file: t.Annotated[
+        Path,
+        typer.Argument(
+            help='JSON list of {"input": ..., "metadata": ..., "out": ...} jobs',
+            exists=True,
+            dir_okay=False,
+        ),
+    ],
+    ledger: t.Annotated[
+        Path,
+        typer.Option(help="SQLite ledger recording the progress of the jobs"),
+    ] = Path("batch_ledger.sqlite"),
+    workers: t.Annotated[int, typer.Option(help="Number of worker processes")] = 2,
+    chunk_size: t.Annotated[
+        int, typer.Option(help="Time steps written (and recorded) at a time")
+    ] = 24,
+    memory_limit: t.Annotated[
+        str | None,
+        typer.Option(help="Memory limit of each worker process, e.g. 4GB"),
+    ] = None,
+):
+    """
+    Process many datasets, resuming an interrupted run from the ledger.
+    """
+    from .batch import load_jobs, run_batch
+
+    summary = run_batch(load_jobs(jobs_file), ledger, workers, chunk_size, memory_limit)
+    logger.info(f"Batch finished: {summary}")
+    if summary.get("failed"):
+        raise typer.Exit(1)
+
+
+@app.command()
+def aggregate(
+    store: t.Annotated[
+        Path,
+        typer.Argument(help="Processed dataset store", exists=True, file_okay=False),
+    ],
+    freq: t.Annotated[
+        list[str] | None,
+        typer.Option(help="Resampling frequency, e.g. 1D or MS (monthly)"),
+    ] = None,
+    stat: t.Annotated[
+        list[AggregateStat] | None,
+        typer.Option(help="Statistic of each aggregate [default: mean]"),
+    ] = None,
+    climatology: t.Annotated[
+        list[ClimatologyPeriod] | None,
+        typer.Option(help="Climatology over all years, per month or day of year"),
+    ] = None,
+):
+    """
+    Add daily/monthly aggregates and climatologies to a processed store.
+    """
+    from .aggregate import aggregate_store
+
+    if not freq and not climatology:
+        raise typer.BadParameter("Give at least one --freq or --climatology")
+
+    added = aggregate_store(
+        store,
+        freq or [],
+        stat or [AggregateStat.mean],
+        climatology or [],
+        Profiler("aggregate"),
+    )
+    for name in added:
+        logger.info(f"Added {name}")
+
+
+@app.command()
+def contour(
+    store: t.Annotated[
+        Path,
+        typer.Argument(help="Processed dataset store", exists=True, file_okay=False),
+    ],
+    var: t.Annotated[
+        list[str] | None, typer.Option(help="Variable(s) to contour [default: all]")
+    ] = None,
+    level: t.Annotated[
+        list[float] | None,
+        typer.Option(help="Contour level(s) [default: round levels]"),
+    ] = None,
+    nlevels: t.Annotated[
+        int, typer.Option(help="Approximate number of default levels")
+    ] = 10,
+):
+    """
+    Precompute contour lines of every time step and level into the store.
+    """
+    from .contour import contour_store
+
+    used = contour_store(store, var or [], sorted(level or []), nlevels)
+    for name, levels in used.items():
+        logger.info(f"{name}: contoured at {levels}")
+
+
+@app.command()
+def render_tiles(
+    store: t.Annotated[
+        Path,
+        typer.Argument(help="Processed dataset store", exists=True, file_okay=False),
+    ],
+    out: t.Annotated[Path, typer.Option(help="Tiles directory")] = Path("tiles"),
+    var: t.Annotated[
+        list[str] | None, typer.Option(help="Variable(s) to render [default: all]")
+    ] = None,
+    layout: t.Annotated[
+        TileLayout,
+        typer.Option(
+            help="Grid tiles (native) or web-mercator tiles (xyz, LonLat only)"
+        ),
+    ] = TileLayout.native,
+    colormap: t.Annotated[Colormap, typer.Option(help="Colormap")] = Colormap.viridis,
+    vmin: t.Annotated[
+        float | None,
+        typer.Option(help="Lower end of the colormap [default: packing range]"),
+    ] = None,
+    vmax: t.Annotated[
+        float | None,
+        typer.Option(help="Upper end of the colormap [default: packing range]"),
+    ] = None,
+    tile_size: t.Annotated[
+        int, typer.Option(help="Size of native tiles, in grid cells")
+    ] = 256,
+    max_zoom: t.Annotated[
+        int | None,
+        typer.Option(
+            help="Highest xyz zoom level [default: about the grid resolution]"
+        ),
+    ] = None,
+    workers: t.Annotated[int, typer.Option(help="Rendering processes")] = 2,
+):
+    """
+    Render colormapped PNG tiles of every time step and level of a store.
+    """
+    from .tiles import render_tiles as _render_tiles
+
+    _render_tiles(
+        store,
+        out,
+        var or [],
+        layout,
+        colormap,
+        vmin,
+        vmax,
+        tile_size,
+        max_zoom,
+        workers,
+    )
+
+
+@app.command()
+def serve(
+    root: t.Annotated[
+        Path,
+        typer.Argument(
+            help="Store, or directory of stores", exists=True, file_okay=False
+        ),
+    ],
+    host: t.Annotated[str, typer.Option(help="Address to listen on")] = "127.0.0.1",
+    port: t.Annotated[int, typer.Option(help="Port to listen on")] = 8000,
+    cache_size: t.Annotated[
+        str, typer.Option(help="Memory for cached chunks and metadata, e.g. 512MB")
+    ] = "256MB",
+    chunk_max_age: t.Annotated[
+        int,
+        typer.Option(
+            help="Cache-Control max-age of chunks, in seconds (a year or more: immutable)"
+        ),
+    ] = 24 * 3600,
+):
+    """
+    Serve stores over HTTP with ETags, Cache-Control and Range support.
+    """
+    from dask.utils import parse_bytes
+
+    from .server import ChunkServer, make_http_server
+
+    server = ChunkServer(root, parse_bytes(cache_size), chunk_max_age)
+    httpd = make_http_server(server, host, port)
+    logger.info(f"Serving {root} at http://{host}:{port}/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+@app.command()
+def bench_serve(
+    url: t.Annotated[str, typer.Argument(help="URL the store is served at")],
+    store: t.Annotated[
+        Path,
+        typer.Argument(
+            help="Local copy of the served store", exists=True, file_okay=False
+        ),
+    ],
+    clients: t.Annotated[int, typer.Option(help="Concurrent clients")] = 8,
+    requests: t.Annotated[int, typer.Option(help="Requests per client")] = 200,
+    revisit: t.Annotated[
+        float,
+        typer.Option(help="Fraction of requests revalidating an already fetched chunk"),
+    ] = 0.5,
+):
+    """
+    Load test a chunk server (this one, nginx, a CDN...) with panning clients.
+    """
+    from .server import bench_server
+
+    result = bench_server(url, store, clients, requests, revisit)
+    typer.echo(json.dumps(result, indent=2))
+
+
+@app.command()
+def publish(
+    store: t.Annotated[
+        Path,
+        typer.Argument(help="Processed dataset store", exists=True, file_okay=False),
+    ],
+    dest: t.Annotated[str, typer.Argument(help="Publishing directory or fsspec URL")],
+    name: t.Annotated[
+        str | None, typer.Option(help="Published name [default: store name]")
+    ] = None,
+    prune: t.Annotated[
+        bool, typer.Option(help="Delete chunks no published index refers to")
+    ] = False,
+    upload_concurrency: t.Annotated[
+        int, typer.Option(help="Concurrent chunk uploads")
+    ] = 16,
+):
+    """
+    Publish a store with content-addressed, immutable chunks and a small index.
+    """
+    from .publish import prune_chunks, publish_store
+
+    publish_store(store, dest, name, upload_concurrency)
+    if prune:
+        prune_chunks(dest)
+
+
+@app.command()
+def rechunk(
+    store: t.Annotated[
+        Path,
+        typer.Argument(help="Processed dataset store"),
+    ],
+    out: t.Annotated[
+        Path | None,
+        typer.Option(help="Write the rechunked store here [default: in place]"),
+    ] = None,
+    chunks: t.Annotated[
+        str,
+        typer.Option(
+            help="New chunk sizes per dimension, e.g. time=24,lat=256,lon=256 "
+            "(-1: whole dimension; others are kept)"
+        ),
+    ] = "",
+    compressor: t.Annotated[
+        str | None,
+        typer.Option(
+            help="New compressor: none, or a numcodecs id with an optional "
+            "level, e.g. zstd:5 [default: keep]"
+        ),
+    ] = None,
+    max_mem: t.Annotated[
+        str, typer.Option(help="Memory limit per worker for a copied block")
+    ] = "256MB",
+    workers: t.Annotated[int, typer.Option(help="Arrays rewritten at once")] = 4,
+):
+    """
+    Rewrite an existing store with new chunks and/or compressor, keeping its
+    packed values and attributes.
+    """
+    from dask.utils import parse_bytes
+
+    from .rechunk import parse_chunks, parse_compressor, rechunk_store
+
+    try:
+        new_chunks = parse_chunks(chunks)
+        codec = parse_compressor(compressor) if compressor is not None else "keep"
+        rechunk_store(store, out, new_chunks, codec, parse_bytes(max_mem), workers)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
 
 if __name__ == "__main__":
     app()
@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+
+from .derive import derive_variables, expression_names
+from .destagger import destagger_dataset
+from .profiling import Profiler
+from .vizimacli import open_dataset_files, open_source_file, update_store
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Route:
+    """Metadata (from `prepare_metadata`) and target store for matching files."""
+
+    metadata_file: Path
+    out: Path
+    metadata: dict[str, t.Any] = field(hash=False, compare=False)
+
+    @property
+    def arr_names(self) -> set[str]:
+        """Source variables needed: the inputs of derived variables."""
+        names = set()
+        for dv in self.metadata["datavars"].values():
+            if dv.get("expression"):
+                names |= expression_names(dv["expression"])
+            else:
+                names.add(dv["arrName"])
+        return names
+
+
+def load_routes(metadata_files: list[Path], out_dir: Path) -> list[Route]:
+    routes = []
+    for metadata_file in metadata_files:
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+        out = out_dir / f"{metadata_file.stem}.zarr"
+        routes.append(Route(metadata_file, out, metadata))
+    return routes
+
+
+def match_route(path: Path, routes: list[Route]) -> Route | None:
+    """First route whose variables are all present in the file at `path`."""
+    with open_source_file(path) as ds:
+        names = set(map(str, ds.variables))
+    for route in routes:
+        if route.arr_names <= names:
+            return route
+    return None
+
+
+def now_iso() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+class StatusFile:
+    """Per-file ingest state, rewritten atomically as a JSON file on every change."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.files: dict[str, dict[str, t.Any]] = {}
+        if path.exists():
+            with open(path) as f:
+                self.files = json.load(f).get("files", {})
+
+    def update(self, files: list[Path], **fields: t.Any):
+        with self._lock:
+            for path in files:
+                self.files.setdefault(str(path), {}).update(fields)
+            self._write()
+
+    def state(self, path: Path) -> str | None:
+        return self.files.get(str(path), {}).get("state")
+
+    def _write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"updated": now_iso(), "files": self.files}, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+class Watcher:
+    """
+    Watch an inbox directory and ingest new files into their target stores.
+
+    Files are matched to a route by their variables, and only picked up once
+    their size and mtime stayed the same for one poll, so that files still
+    being written are skipped. New files of one route are batched into one
+    job, and a route has at most one job in flight so its time steps are
+    appended in order. Jobs go through a bounded queue to a pool of worker
+    threads: when the workers fall behind, scanning blocks instead of piling
+    up work. Failed jobs are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        inbox: Path,
+        routes: list[Route],
+        status: StatusFile,
+        pattern: str = "*",
+        workers: int = 2,
+        queue_size: int = 4,
+        retries: int = 3,
+        backoff: float = 5.0,
+        archive_dir: Path | None = None,
+    ):
+        self.inbox = inbox
+        self.routes = routes
+        self.status = status
+        self.pattern = pattern
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.archive_dir = archive_dir
+        self.jobs: queue.Queue[tuple[Route, list[Path]] | None] = queue.Queue(
+            maxsize=queue_size
+        )
+        self._busy: set[Route] = set()
+        self._busy_lock = threading.Lock()
+        self._sizes: dict[Path, tuple[int, int]] = {}
+        self._routes: dict[Path, Route | None] = {}
+        self._detected: dict[Path, float] = {}
+
+        # jobs interrupted by a previous run are picked up again
+        for info in self.status.files.values():
+            if info.get("state") in ("queued", "processing", "retrying"):
+                info["state"] = None
+
+    def scan(self) -> dict[Route, list[Path]]:
+        """New, settled and matched files in the inbox, grouped by route."""
+        batches: dict[Route, list[Path]] = {}
+        for path in sorted(self.inbox.glob(self.pattern)):
+            if not path.is_file() or self.status.state(path) in (
+                "queued",
+                "processing",
+                "done",
+                "failed",
+                "unmatched",
+            ):
+                continue
+            stat = path.stat()
+            size = (stat.st_size, stat.st_mtime_ns)
+            self._detected.setdefault(path, time.time())
+            if self._sizes.get(path) != size:
+                self._sizes[path] = size
+                continue
+
+            if path not in self._routes:
+                try:
+                    self._routes[path] = match_route(path, self.routes)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Cannot read {path}: {e}")
+                    continue
+            route = self._routes[path]
+            if route is None:
+                logger.warning(f"No metadata matches the variables of {path}")
+                self.status.update([path], state="unmatched", detected_at=now_iso())
+                continue
+            batches.setdefault(route, []).append(path)
+        return batches
+
+    def dispatch(self, batches: dict[Route, list[Path]]):
+        for route, files in batches.items():
+            with self._busy_lock:
+                if route in self._busy:
+                    continue
+                self._busy.add(route)
+            self.status.update(files, state="queued", target=str(route.out), attempts=0)
+            # blocks while the queue is full (backpressure)
+            self.jobs.put((route, files))
+
+    def process(self, route: Route, files: list[Path]):
+        for attempt in range(1, self.retries + 2):
+            self.status.update(files, state="processing", attempts=attempt)
+            try:
+                with open_dataset_files(files) as source:
+                    ds, metadata = destagger_dataset(source, route.metadata)
+                    ds = derive_variables(ds, metadata)
+                    update_store(ds, metadata, route.out, Profiler("watch"))
+            except Exception as e:
+                logger.exception(f"Failed to ingest {files} into {route.out}")
+                if attempt > self.retries:
+                    self.status.update(
+                        files, state="failed", error=repr(e), finished_at=now_iso()
+                    )
+                    return
+                self.status.update(files, state="retrying", error=repr(e))
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            else:
+                finished = time.time()
+                for path in files:
+                    self.status.update(
+                        [path],
+                        state="done",
+                        error=None,
+                        finished_at=now_iso(),
+                        latency_s=finished - self._detected.get(path, finished),
+                    )
+                self.archive(files)
+                logger.info(f"Ingested {len(files)} file(s) into {route.out}")
+                return
+
+    def archive(self, files: list[Path]):
+        if self.archive_dir is None:
+            return
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        for path in files:
+            os.replace(path, self.archive_dir / path.name)
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                route, files = job
+                try:
+                    self.process(route, files)
+                except Exception:
+                    # e.g. archiving failed; keep the worker alive
+                    logger.exception(f"Failed to finish {files} of {route.out}")
+                finally:
+                    with self._busy_lock:
+                        self._busy.discard(route)
+            finally:
+                self.jobs.task_done()
+
+    def run(
+        self,
+        poll_interval: float = 2.0,
+        stop: threading.Event | None = None,
+        once: bool = False,
+    ):
+        """
+        Scan and ingest until `stop` is set.
+
+        With `once`, files present now are ingested and the call returns when
+        they are done; files are then not required to settle for a poll.
+        """
+        stop = stop or threading.Event()
+        threads = [
+            threading.Thread(target=self.worker, daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            if once:
+                self.scan()
+            while not stop.is_set():
+                self.dispatch(self.scan())
+                if once:
+                    self.jobs.join()
+                    if not self.scan():
+                        break
+                    continue
+                stop.wait(poll_interval)
+        finally:
+            for _ in threads:
+                self.jobs.put(None)
+            for thread in threads:
+                thread.join()
@@ -1,6 +1,7 @@
 import * as zarr from "zarrita";
 import { logger } from "../../logger";
 import { type GridConfig, GridData } from "./grid-data";
+import { PublishedStore } from "./published-store";
 import z from "zod";
 
 const ZarrAttrsSchema = z.looseObject({
@@ -19,9 +20,7 @@ export async function fetchZarrGrid(
     rootUrl = new URL(config.url, window.location.origin).href;
   }
 
-  const store = new zarr.FetchStore(rootUrl);
-
-  const arr = await zarr.open(store, { kind: "array" });
+  const arr = await openArray(rootUrl);
   log.debug(`Opened Zarr at ${config.url}`);
 
   const attrs = ZarrAttrsSchema.parse(arr.attrs);
@@ -47,3 +46,18 @@ export async function fetchZarrGrid(
   );
   return new GridData(config, values);
 }
+
+/**
+ * Open the array at `url`: a store URL, or `<published>/index.json#<array>`
+ * for a store published with content-addressed chunks.
+ */
+async function openArray(url: string) {
+  const parsed = new URL(url);
+  if (!parsed.pathname.endsWith("/index.json")) {
+    return zarr.open(new zarr.FetchStore(url), { kind: "array" });
+  }
+  const arrayPath = decodeURIComponent(parsed.hash.slice(1));
+  parsed.hash = "";
+  const store = await PublishedStore.open(parsed.href);
+  return zarr.open(zarr.root(store).resolve(arrayPath), { kind: "array" });
+}
@@ -0,0 +1,65 @@
+import z from "zod";
+
+// index.json written by `vizimacli publish`
+const PublishedIndexSchema = z.object({
+  version: z.literal(1),
+  chunks_url: z.string(),
+  metadata: z.record(z.string(), z.unknown()),
+  chunks: z.record(z.string(), z.string()),
+});
+
+type PublishedIndex = z.infer<typeof PublishedIndexSchema>;
+
+const indexCache = new Map<string, Promise<PublishedIndex>>();
+
+/**
+ * Read-only zarr store over a published, content-addressed store.
+ *
+ * The index is fetched once per URL; metadata is served from it and chunks
+ * are fetched from their content-hash URLs, which never change.
+ */
+export class PublishedStore {
+  private constructor(
+    private readonly index: PublishedIndex,
+    private readonly chunksUrl: URL,
+  ) {}
+
+  static async open(indexUrl: string): Promise<PublishedStore> {
+    let index = indexCache.get(indexUrl);
+    if (!index) {
+      index = fetch(indexUrl, { cache: "no-cache" })
+        .then((res) => {
+          if (!res.ok) {
+            throw new Error(`Failed to fetch ${indexUrl}: ${res.status}`);
+          }
+          return res.json();
+        })
+        .then((json) => PublishedIndexSchema.parse(json));
+      indexCache.set(indexUrl, index);
+      index.catch(() => indexCache.delete(indexUrl));
+    }
+    const resolved = await index;
+    return new PublishedStore(resolved, new URL(resolved.chunks_url, indexUrl));
+  }
+
+  async get(
+    key: string,
+    options?: RequestInit,
+  ): Promise<Uint8Array | undefined> {
+    const path = key.replace(/^\//, "");
+    if (path in this.index.metadata) {
+      return new TextEncoder().encode(
+        JSON.stringify(this.index.metadata[path]),
+      );
+    }
+    const hash = this.index.chunks[path];
+    if (hash === undefined) {
+      return undefined;
+    }
+    const res = await fetch(new URL(hash, this.chunksUrl), options);
+    if (!res.ok) {
+      throw new Error(`Failed to fetch chunk ${path}: ${res.status}`);
+    }
+    return new Uint8Array(await res.arrayBuffer());
+  }
+}
@@ -55,6 +55,8 @@ export const DataVarSchema = VarSchema.extend({
   lat: z.string(),
   level: z.string(),
   time: z.string(),
+  // computed from the input variables by `vizimacli process-dataset`
+  expression: z.string().nullish(),
 }).meta({ title: "DataVar" });
 
 export const VectorVarSchema = VarSchema.extend({